@@ -0,0 +1,200 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from .history_store import auto_title
+
+SNIPPET_TOKENS = 12
+
+
+def fts5_available() -> bool:
+    """Whether the bundled SQLite was compiled with the FTS5 extension."""
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE probe USING fts5(content)")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def to_match_query(query: str) -> Optional[str]:
+    """Turns free text into a safe FTS5 query: every word must match, the last one as a prefix.
+
+    Quoting each word keeps FTS5 operators and punctuation in user input
+    from being parsed as query syntax.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*" # Match while the user is still typing
+    return " ".join(terms)
+
+
+class ChatSearchIndex:
+    """Inverted index (SQLite FTS5) over saved chat messages and custom session titles.
+
+    It lives in its own database next to the history, so it works with every
+    history backend. history_manager feeds it as sessions are saved, renamed
+    and deleted; ``rebuild`` indexes an existing history from scratch.
+    Automatic titles are only kept for display: they repeat the first
+    message, which is already indexed.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS threads (
+            thread_id TEXT PRIMARY KEY,
+            title TEXT,
+            message_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+            thread_id UNINDEXED, seq UNINDEXED, role UNINDEXED, content, tokenize = 'unicode61 remove_diacritics 2'
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS title_fts USING fts5(
+            thread_id UNINDEXED, title, tokenize = 'unicode61 remove_diacritics 2'
+        );
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+
+    @property
+    def built(self) -> bool:
+        """Whether the existing history has been indexed (by ``rebuild``)."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'built'").fetchone()
+        return row is not None
+
+    def _set_custom_title(self, thread_id: str, title: str) -> None:
+        self._conn.execute("DELETE FROM title_fts WHERE thread_id = ?", (thread_id,))
+        self._conn.execute("INSERT INTO title_fts (thread_id, title) VALUES (?, ?)", (thread_id, title))
+        self._conn.execute("UPDATE threads SET title = ? WHERE thread_id = ?", (title, thread_id))
+
+    def add_messages(self, thread_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Indexes messages appended to a session (creating its entry on first use)."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT title, message_count FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+            if row is None:
+                self._conn.execute("INSERT INTO threads (thread_id) VALUES (?)", (thread_id,))
+                first_seq, title = 0, None
+            else:
+                first_seq, title = row["message_count"], row["title"]
+            self._conn.executemany(
+                "INSERT INTO message_fts (thread_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [
+                    (thread_id, first_seq + i, message.get("role", ""), message.get("content") or "")
+                    for i, message in enumerate(messages)
+                ],
+            )
+            self._conn.execute(
+                "UPDATE threads SET message_count = message_count + ? WHERE thread_id = ?", (len(messages), thread_id)
+            )
+            if not title:
+                self._conn.execute("UPDATE threads SET title = ? WHERE thread_id = ?", (auto_title(messages), thread_id))
+
+    def set_title(self, thread_id: str, title: str) -> None:
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM threads WHERE thread_id = ?", (thread_id,)).fetchone():
+                self._set_custom_title(thread_id, title)
+
+    def remove(self, thread_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM message_fts WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM title_fts WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+
+    def index_session(self, session_data: Dict[str, Any]) -> None:
+        """(Re)indexes a complete session as returned by get_session."""
+        thread_id = session_data["thread_id"]
+        messages = session_data.get("messages") or []
+        with self._lock:
+            self.remove(thread_id)
+            self.add_messages(thread_id, messages)
+            if session_data.get("custom_title"):
+                with self._conn:
+                    self._set_custom_title(thread_id, session_data["custom_title"])
+
+    def rebuild(self, backend) -> int:
+        """Indexes every session of a history backend from scratch; returns how many were indexed."""
+        indexed = 0
+        with self._lock:
+            with self._conn:
+                for table in ("message_fts", "title_fts", "threads"):
+                    self._conn.execute(f"DELETE FROM {table}")
+            for thread_id in backend.thread_ids():
+                session_data = backend.get_session(thread_id)
+                if not session_data:
+                    continue
+                session_data["thread_id"] = thread_id
+                self.index_session(session_data)
+                indexed += 1
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built', '1')")
+        return indexed
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Returns the matching sessions, best first, with a highlighted snippet.
+
+        Sessions whose custom title matches come first; the rest are ranked
+        by the BM25 score of their best-matching message, whose snippet and
+        position are returned along with how many messages matched.
+        """
+        match = to_match_query(query)
+        if match is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                WITH message_hits AS (
+                    SELECT thread_id, bm25(message_fts) AS score, CAST(seq AS INTEGER) AS seq,
+                           snippet(message_fts, 3, '[', ']', '…', {SNIPPET_TOKENS}) AS snippet
+                    FROM message_fts WHERE message_fts MATCH :match
+                ),
+                best_messages AS (
+                    -- In SQLite the bare columns of a MIN() aggregate come from the row holding the minimum
+                    SELECT thread_id, MIN(score) AS score, seq, snippet, COUNT(*) AS matches
+                    FROM message_hits GROUP BY thread_id
+                ),
+                title_hits AS (
+                    SELECT thread_id, snippet(title_fts, 1, '[', ']', '…', {SNIPPET_TOKENS}) AS snippet
+                    FROM title_fts WHERE title_fts MATCH :match
+                )
+                SELECT threads.thread_id, threads.title, best_messages.score, best_messages.seq,
+                       best_messages.snippet AS message_snippet, COALESCE(best_messages.matches, 0) AS matches,
+                       title_hits.snippet AS title_snippet
+                FROM (SELECT thread_id FROM best_messages UNION SELECT thread_id FROM title_hits) AS hit
+                JOIN threads ON threads.thread_id = hit.thread_id
+                LEFT JOIN best_messages ON best_messages.thread_id = hit.thread_id
+                LEFT JOIN title_hits ON title_hits.thread_id = hit.thread_id
+                ORDER BY title_hits.thread_id IS NULL, best_messages.score IS NULL, best_messages.score
+                LIMIT :limit
+                """,
+                {"match": match, "limit": limit},
+            ).fetchall()
+        return [
+            {
+                "thread_id": row["thread_id"],
+                "title": row["title"] or row["thread_id"],
+                "title_match": row["title_snippet"] is not None,
+                # bm25() is lower-is-better; report higher-is-better
+                "score": round(-row["score"], 4) if row["score"] is not None else None,
+                "snippet": row["message_snippet"] or row["title_snippet"],
+                "message_index": row["seq"],
+                "message_matches": row["matches"],
+            }
+            for row in rows
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,13 +1,19 @@
 import re
 from typing import List, Optional
 
+# Default stop tokens used when a caller does not supply its own list
+DEFAULT_STOP_TOKENS = [
+    "\nUser:", "\nuser:", "\nAssistant:", "\nassistant:", "</s>", "<|endoftext|>", "<|user|>", "<|assistant|>"
+]
+
+# Speaker tags removed by clean_response (compared case-insensitively)
+_SPEAKER_TAGS = ("user:", "assistant:")
+
 # --- Helper Function for Truncating at Stop Tokens ---
 def truncate_at_stop_token(text: str, stop_tokens: Optional[List[str]] = None) -> str:
     """Truncates the text at the first occurrence of any stop token."""
     if not stop_tokens:
-        stop_tokens = [
-            "\nUser:", "\nuser:", "\nAssistant:", "\nassistant:", "</s>", "<|endoftext|>", "<|user|>", "<|assistant|>"
-        ]
+        stop_tokens = DEFAULT_STOP_TOKENS
     min_idx = None
     for token in stop_tokens:
         idx = text.find(token)
@@ -24,4 +30,74 @@ def clean_response(text: str) -> str:
     # Use regex to remove the tags at the beginning of a line or after whitespace, case-insensitive
     # Handles variations like <|user|>, User :, etc. more broadly might be needed depending on model
     # This version targets the specific User: / Assistant: pattern from the original prompt format
-    return re.sub(r"^\s*\b(User|Assistant):\s*", "", text, flags=re.IGNORECASE | re.MULTILINE).strip() 
\ No newline at end of file
+    return re.sub(r"^\s*\b(User|Assistant):\s*", "", text, flags=re.IGNORECASE | re.MULTILINE).strip() 
+
+# --- Incremental Cleaner for Streamed Responses ---
+class StreamingResponseCleaner:
+    """Applies clean_response/truncate_at_stop_token incrementally to streamed text.
+
+    Text is fed chunk by chunk as the model produces it. ``feed`` returns only
+    the part of the cleaned response that can no longer change, holding back
+    trailing whitespace, partial stop tokens and partial speaker tags until
+    more text arrives. Once everything has been fed, ``finish`` returns the
+    remainder so that the concatenated output matches what the blocking
+    endpoint would have returned for the same raw text.
+    """
+
+    def __init__(self, stop_tokens: Optional[List[str]] = None):
+        self.stop_tokens = stop_tokens or DEFAULT_STOP_TOKENS
+        self.raw_text = ""
+        self.emitted = ""
+        self.stopped = False  # True once a stop token has been seen
+
+    def _process(self) -> str:
+        return truncate_at_stop_token(clean_response(self.raw_text), self.stop_tokens)
+
+    def _held_back_length(self, text: str) -> int:
+        """Returns how many trailing characters of ``text`` may still change."""
+        held = len(text) - len(text.rstrip())
+        body = text[:len(text) - held]
+        # A suffix that could grow into a stop token
+        for token in self.stop_tokens:
+            for size in range(min(len(token) - 1, len(self.raw_text)), 0, -1):
+                if self.raw_text.endswith(token[:size]):
+                    held = max(held, min(size, len(text)))
+                    break
+        # A last line that could still turn into a speaker tag
+        last_line = body[body.rfind("\n") + 1:]
+        candidate = last_line.lstrip().lower()
+        if candidate and any(tag.startswith(candidate) for tag in _SPEAKER_TAGS):
+            held = max(held, len(text) - (len(body) - len(last_line)))
+        # Whitespace in front of held-back text is stripped if a stop token follows
+        rest = text[:len(text) - held]
+        return held + len(rest) - len(rest.rstrip())
+
+    def feed(self, chunk: str) -> str:
+        """Adds a raw chunk and returns newly stable cleaned text (may be empty)."""
+        if self.stopped or not chunk:
+            return ""
+        self.raw_text += chunk
+        processed = self._process()
+        if len(processed) < len(clean_response(self.raw_text)):
+            # A stop token was found; everything before it is final
+            self.stopped = True
+            stable = processed
+        else:
+            stable = processed[:len(processed) - self._held_back_length(processed)]
+        return self._emit(stable)
+
+    def finish(self) -> str:
+        """Flushes any held-back text once the stream has ended."""
+        return self._emit(self._process())
+
+    @property
+    def text(self) -> str:
+        """The fully cleaned response for everything fed so far."""
+        return self._process()
+
+    def _emit(self, stable: str) -> str:
+        if len(stable) <= len(self.emitted) or not stable.startswith(self.emitted):
+            return ""
+        delta = stable[len(self.emitted):]
+        self.emitted = stable
+        return delta
@@ -1,11 +1,13 @@
 from __future__ import annotations
 import os
-from typing import Literal, List, Optional
+from typing import Dict, Literal, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import field_validator, ValidationInfo
 
 # Allowed precision choices for models
-PrecisionType = Literal["fp32", "fp16"]
+# int8_dynamic: torch dynamic quantization of Linear layers (CPU)
+# int8 / int4: weight-only quantization through the optional bitsandbytes package (CUDA)
+PrecisionType = Literal["fp32", "fp16", "bf16", "int8_dynamic", "int8", "int4"]
 
 
 class Settings(BaseSettings):
@@ -34,6 +36,46 @@ class Settings(BaseSettings):
     default_top_p: float = 0.95
     default_max_new_tokens: int = 1000
 
+    # --- Context window ---
+    context_truncation: bool = True  # Drop the oldest chat turns that would not fit the model's context window
+    context_summary: bool = False  # Replace dropped turns with a short extractive summary in the system prompt
+    context_summary_max_tokens: int = 256  # Share of the prompt budget that summary may take
+
+    # --- Batching scheduler ---
+    batching_enabled: bool = False  # Route chat generation through the continuous batching scheduler
+    max_batch_size: int = 8  # Maximum number of requests decoded together
+    max_concurrent_generations: Optional[int] = None  # Generations run at once (default: 1, or max_batch_size with batching)
+    max_queue_depth: Optional[int] = 32  # Generations allowed to wait before new ones get 429 (unset: unbounded)
+
+    # --- Warmup / compilation ---
+    warmup_on_load: bool = False  # Run representative prefill/decode shapes before a loaded model serves
+    warmup_prompt_lengths: str = "32,256"  # Comma-separated prompt lengths used for warmup
+    warmup_decode_steps: int = 8  # Decode steps per warmup prompt
+    torch_compile: bool = False  # Compile the decode step over static KV caches (disables KV cache reuse)
+    compile_cache_buckets: str = "512,1024,2048,4096"  # Comma-separated static KV cache lengths; one compile each
+
+    # --- Speculative decoding ---
+    draft_models: str = ""  # Comma-separated target=draft model names under backend/models (e.g. "llama-8b=llama-1b")
+    speculative_num_tokens: int = 5  # Tokens a draft model proposes per step to start with (adapted as acceptance changes)
+
+    # --- Model residency ---
+    model_ram_budget_gb: float = 0.0  # RAM available to resident CPU models (0 = 80% of system RAM)
+    model_vram_budget_gb: float = 0.0  # VRAM available to resident CUDA models (0 = 90% of GPU memory)
+
+    # --- KV cache reuse ---
+    kv_cache_max_mb: int = 512  # Memory budget for per-thread KV caches (0 disables reuse)
+
+    # --- Chat history storage ---
+    history_backend: Literal["json", "jsonl", "sqlite"] = "json"  # json: one file per thread; jsonl: append-only journal per thread; sqlite: WAL database
+    history_db_path: Optional[str] = None  # SQLite file (defaults to saved_chats/history.sqlite3)
+    history_write_behind: bool = True  # Save chat history on a background worker instead of before responding
+    history_queue_max_messages: int = 1000  # Queued messages before saving blocks requests (backpressure)
+    history_compression: Literal["none", "gzip", "zstd"] = "none"  # Codec for cold JSON sessions (zstd needs the optional 'zstandard' package)
+    history_compress_after_days: float = 30.0  # Sessions untouched this long get compressed
+    history_compress_interval_minutes: float = 60.0  # How often the cold-session job runs
+    chat_search_enabled: bool = True  # Full-text search index over saved chats (SQLite FTS5)
+    chat_search_db_path: Optional[str] = None  # Search index file (defaults to saved_chats/search.sqlite3)
+
     # --- API / Frontend ---
     cors_allowed_origins: str = (
         "http://localhost:5173,http://127.0.0.1:5173"  # Comma-separated list
@@ -56,6 +98,22 @@ class Settings(BaseSettings):
         """Return CORS origins as a list, trimming whitespace."""
         return [origin.strip() for origin in self.cors_allowed_origins.split(",") if origin.strip()]
 
+    @property
+    def warmup_prompt_lengths_list(self) -> List[int]:
+        """Return warmup prompt lengths as a list of ints."""
+        return [int(n) for n in self.warmup_prompt_lengths.split(",") if n.strip()]
+
+    @property
+    def compile_cache_buckets_list(self) -> List[int]:
+        """Return static KV cache bucket lengths as a list of ints."""
+        return [int(n) for n in self.compile_cache_buckets.split(",") if n.strip()]
+
+    @property
+    def draft_models_map(self) -> Dict[str, str]:
+        """Return the target model -> draft model mapping."""
+        pairs = (pair.split("=", 1) for pair in self.draft_models.split(",") if "=" in pair)
+        return {target.strip(): draft.strip() for target, draft in pairs if target.strip() and draft.strip()}
+
     # -----------------------------------------------------------------
     # Validators
     # -----------------------------------------------------------------
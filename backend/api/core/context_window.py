@@ -0,0 +1,212 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .prompt_cache import content_digest, encode, message_segment, tokenizer_key
+
+# Tokens assumed for a message's role markers when the chat template cannot be probed,
+# and reserved for the generation prompt (e.g. "<|assistant|>\n") after the last message
+DEFAULT_MESSAGE_OVERHEAD = 8
+# Characters of each dropped message quoted in the summary of earlier turns
+SUMMARY_SNIPPET_CHARS = 160
+SUMMARY_HEADER = "Summary of earlier messages in this conversation (no longer shown in full):\n"
+
+
+def context_length(model) -> Optional[int]:
+    """Returns the number of positions the model can attend over, or None if the config does not say."""
+    config = getattr(model, "config", None)
+    for attr in ("max_position_embeddings", "n_positions", "max_sequence_length", "seq_length"):
+        value = getattr(config, attr, None)
+        if isinstance(value, int) and value > 0:
+            return value
+    return None
+
+
+def prompt_token_budget(model, max_new_tokens: int) -> Optional[int]:
+    """Tokens a prompt may take so that ``max_new_tokens`` more still fit the context window."""
+    length = context_length(model)
+    if length is None:
+        return None
+    return max(length - max_new_tokens, 0)
+
+
+class TokenCountCache:
+    """Token counts of chat messages, keyed by tokenizer and message content.
+
+    Chat mode resends the whole history every turn; with the counts cached,
+    only the new messages of a turn are tokenized to fit the context window.
+    Least-recently-used entries are evicted beyond ``max_entries``.
+    """
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[int]:
+        with self._lock:
+            count = self._entries.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def put(self, key: Hashable, count: int) -> None:
+        with self._lock:
+            self._entries[key] = count
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_token_counts = TokenCountCache()
+
+
+def _template_overhead(tokenizer, role: str) -> int:
+    """Tokens the chat template adds around one message of ``role``.
+
+    Measured by rendering a short conversation with and without one more
+    such message, so templates that require alternating roles still render.
+    """
+    probe = {"role": "user", "content": "x"}
+    reply = {"role": "assistant", "content": "x"}
+    before, after = {
+        "system": ([probe], [{"role": "system", "content": "x"}, probe]),
+        "user": ([probe, reply], [probe, reply, probe]),
+    }.get(role, ([probe], [probe, reply]))
+    try:
+        rendered = [
+            len(encode(tokenizer, tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=False)))
+            for messages in (before, after)
+        ]
+    except Exception:
+        return DEFAULT_MESSAGE_OVERHEAD
+    return max(rendered[1] - rendered[0] - len(encode(tokenizer, "x")), 0)
+
+
+def count_message_tokens(tokenizer, message: Dict[str, str]) -> int:
+    """Tokens one message takes in the prompt, role markers included; cached per tokenizer and content.
+
+    Exact when the prompt format splits per message (the segment is cached
+    for prompt assembly too); otherwise the content is counted plus the
+    role overhead measured for the chat template.
+    """
+    role, content = message.get("role", "user"), message.get("content") or ""
+    segment = message_segment(tokenizer, role, content)
+    if segment is not None:
+        return len(segment.ids)
+    key = (tokenizer_key(tokenizer), role, content_digest(content))
+    count = _token_counts.get(key)
+    if count is not None:
+        return count
+    overhead_key = (tokenizer_key(tokenizer), "template-overhead", role)
+    overhead = _token_counts.get(overhead_key)
+    if overhead is None:
+        overhead = _template_overhead(tokenizer, role)
+        _token_counts.put(overhead_key, overhead)
+    count = len(encode(tokenizer, content)) + overhead
+    _token_counts.put(key, count)
+    return count
+
+
+def token_count_stats() -> Dict[str, int]:
+    return _token_counts.stats()
+
+
+def summarize_messages(tokenizer, messages: List[Dict[str, str]], max_tokens: int) -> Optional[str]:
+    """A short extractive summary of ``messages``: the start of each one, newest kept first.
+
+    Returns None if not even one line fits ``max_tokens``.
+    """
+    lines: List[str] = []
+    used = count_message_tokens(tokenizer, {"role": "system", "content": SUMMARY_HEADER})
+    for message in reversed(messages):
+        text = " ".join((message.get("content") or "").split())
+        if len(text) > SUMMARY_SNIPPET_CHARS:
+            text = text[:SUMMARY_SNIPPET_CHARS].rstrip() + "..."
+        line = f"- {message.get('role', 'user')}: {text}"
+        cost = len(encode(tokenizer, line + "\n"))
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return None
+    return SUMMARY_HEADER + "\n".join(reversed(lines))
+
+
+def _keep_recent(tokenizer, messages: List[Dict[str, str]], budget: int) -> int:
+    """Returns how many of the newest ``messages`` fit ``budget`` tokens (always at least the last one)."""
+    used, kept = 0, 0
+    for message in reversed(messages):
+        cost = count_message_tokens(tokenizer, message)
+        if kept and used + cost > budget:
+            break
+        used += cost
+        kept += 1
+    # Start on a user turn: chat templates commonly require user/assistant alternation from the top
+    while kept > 1 and messages[len(messages) - kept].get("role") != "user":
+        kept -= 1
+    return kept
+
+
+def _renders_own_system_message(tokenizer) -> Tuple[bool, bool]:
+    """How generate_prompt treats a system message leading the history: ``(replaces_system_prompt, rendered)``.
+
+    Custom prompt configs render it instead of the system prompt, chat
+    templates replace its content with the system prompt, and fallback
+    prompts render it as a turn after the system prompt.
+    """
+    prompt_mode = getattr(tokenizer, "prompt_mode", "template")
+    if prompt_mode == "custom" and getattr(tokenizer, "custom_prompt_config", None) is not None:
+        return True, True
+    return False, prompt_mode != "template"
+
+
+def fit_to_context(
+    tokenizer,
+    system_prompt: str,
+    messages: List[Dict[str, str]],
+    budget: int,
+    summarize: bool = False,
+    summary_max_tokens: int = 256,
+) -> Tuple[str, List[Dict[str, str]], int]:
+    """Drops the oldest chat messages until the prompt fits ``budget`` tokens.
+
+    The system prompt and the most recent messages are kept, and so is a
+    leading system message in ``messages`` (generate_prompt decides how it
+    is rendered). With ``summarize``, up to ``summary_max_tokens`` (and at
+    most a quarter) of the budget go to a summary of the dropped messages,
+    appended to whichever system text the prompt shows. Returns
+    ``(system_prompt, messages, dropped_count)``; when everything fits,
+    both are returned unchanged.
+    """
+    leading = list(messages[:1]) if messages and messages[0].get("role") == "system" else []
+    history = messages[len(leading):]
+    replaces, rendered = _renders_own_system_message(tokenizer) if leading else (False, False)
+    system_cost = 0 if replaces else count_message_tokens(tokenizer, {"role": "system", "content": system_prompt})
+    if rendered:
+        system_cost += count_message_tokens(tokenizer, leading[0])
+    available = budget - system_cost - DEFAULT_MESSAGE_OVERHEAD
+    kept = _keep_recent(tokenizer, history, available)
+    if kept == len(history):
+        return system_prompt, messages, 0
+
+    # Small context windows keep most of their budget for the actual turns
+    summary_max_tokens = min(summary_max_tokens, available // 4)
+    if summarize and summary_max_tokens > 0:
+        kept = _keep_recent(tokenizer, history, available - summary_max_tokens)
+        summary = summarize_messages(tokenizer, history[:len(history) - kept], summary_max_tokens)
+        if summary and replaces:
+            leading = [{**leading[0], "content": f"{leading[0].get('content') or ''}\n\n{summary}"}]
+        elif summary:
+            system_prompt = f"{system_prompt}\n\n{summary}"
+    return system_prompt, leading + history[len(history) - kept:], len(history) - kept
@@ -1,3 +1,5 @@
+from typing import Optional
+
 import torch
 
 def get_device_status() -> dict:
@@ -6,4 +8,14 @@ def get_device_status() -> dict:
         device_name = torch.cuda.get_device_name(0)
         return {"device": "cuda", "device_name": device_name}
     else:
-        return {"device": "cpu", "device_name": "CPU"} 
\ No newline at end of file
+        return {"device": "cpu", "device_name": "CPU"}
+
+def cuda_memory_bytes() -> Optional[dict]:
+    """Total, reserved and allocated memory of CUDA device 0 in bytes, or None without CUDA."""
+    if not torch.cuda.is_available():
+        return None
+    return {
+        "total": torch.cuda.get_device_properties(0).total_memory,
+        "reserved": torch.cuda.memory_reserved(0),
+        "allocated": torch.cuda.memory_allocated(0),
+    }
@@ -0,0 +1,96 @@
+import glob
+import gzip
+import importlib.util
+import os
+import zlib
+from typing import Dict, List, Optional
+
+# File suffix added to "<thread_id>.json" by each codec
+CODEC_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+ZSTD_LEVEL = 10
+DICTIONARY_SIZE = 112_640  # zstd's default dictionary size (110 KiB)
+
+
+def codec_unavailable_reason(codec: str) -> Optional[str]:
+    """Returns why ``codec`` cannot be used in this environment, or None if it can."""
+    if codec not in CODEC_EXTENSIONS:
+        return f"Unknown compression codec '{codec}'. Must be one of: {', '.join(CODEC_EXTENSIONS)}"
+    if codec == "zstd" and importlib.util.find_spec("zstandard") is None:
+        return "'zstd' compression requires the optional 'zstandard' package; use 'gzip' otherwise."
+    return None
+
+
+def codec_for_path(path: str) -> Optional[str]:
+    """The codec a session file was written with (None for plain JSON)."""
+    for codec, extension in CODEC_EXTENSIONS.items():
+        if path.endswith(extension):
+            return codec
+    return None
+
+
+class ZstdDictionaries:
+    """Trained zstd dictionaries stored as ``zstd-<dict_id>.dict`` in the history directory.
+
+    New files are compressed with the most recently trained dictionary.
+    Every zstd frame records the id of its dictionary, so files written
+    with an older one stay readable as long as its file is kept.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._cache: Dict[int, object] = {}
+
+    def _path(self, dict_id: int) -> str:
+        return os.path.join(self.directory, f"zstd-{dict_id}.dict")
+
+    def get(self, dict_id: int):
+        if dict_id not in self._cache:
+            import zstandard
+
+            with open(self._path(dict_id), "rb") as f:
+                self._cache[dict_id] = zstandard.ZstdCompressionDict(f.read())
+        return self._cache[dict_id]
+
+    def latest(self):
+        paths = glob.glob(os.path.join(self.directory, "zstd-*.dict"))
+        if not paths:
+            return None
+        newest = max(paths, key=os.path.getmtime)
+        return self.get(int(os.path.basename(newest)[len("zstd-"):-len(".dict")]))
+
+    def train(self, samples: List[bytes], size: int = DICTIONARY_SIZE) -> int:
+        """Trains a dictionary on sample session payloads, saves it and returns its id."""
+        import zstandard
+
+        dictionary = zstandard.train_dictionary(size, samples)
+        dict_id = dictionary.dict_id()
+        with open(self._path(dict_id), "wb") as f:
+            f.write(dictionary.as_bytes())
+        self._cache[dict_id] = dictionary
+        return dict_id
+
+
+def compress(payload: bytes, codec: str, dictionaries: Optional[ZstdDictionaries] = None) -> bytes:
+    if codec == "gzip":
+        return gzip.compress(payload, compresslevel=6, mtime=0)
+    import zstandard
+
+    dictionary = dictionaries.latest() if dictionaries else None
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary).compress(payload)
+
+
+def decompress(data: bytes, codec: str, dictionaries: Optional[ZstdDictionaries] = None) -> bytes:
+    """Raises ValueError for a truncated or corrupt payload, like json.loads does for a corrupt plain session."""
+    if codec == "gzip":
+        try:
+            return gzip.decompress(data)
+        except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+            raise ValueError(f"Corrupt gzip payload: {e}") from e
+    import zstandard
+
+    try:
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        dictionary = dictionaries.get(dict_id) if dict_id and dictionaries else None
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data)
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Corrupt zstd payload: {e}") from e
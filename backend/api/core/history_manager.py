@@ -1,18 +1,239 @@
 import os
-import json
 import datetime
-from typing import Optional, List, Dict, Any
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple
+
+from .config import settings
+from .history_store import (
+    HistoryBackend, JsonHistoryBackend, JsonlHistoryBackend, SQLiteHistoryBackend,
+    auto_title, decode_cursor, encode_cursor, session_sort_key, validate_thread_id,
+)
+from .history_writer import HistoryWriter
+from .chat_search import ChatSearchIndex, fts5_available
+from .history_compression import codec_unavailable_reason
+from .metrics import HISTORY_SAVE_SECONDS
 
 # Define the directory where chat histories will be stored
-# --- MODIFIED: Point to 'saved_chats' at the project root level --- 
+# --- MODIFIED: Point to 'saved_chats' at the project root level ---
 # Assumes history_manager.py is in backend/api/core
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 HISTORY_DIR = os.path.join(PROJECT_ROOT, "saved_chats")
 # HISTORY_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "chat_history") # Old path
 # --- END MODIFICATION ---
 
+# Default SQLite database location when SIGIL_HISTORY_DB_PATH is not set
+DEFAULT_HISTORY_DB = os.path.join(HISTORY_DIR, "history.sqlite3")
+# Default full-text search index location when SIGIL_CHAT_SEARCH_DB_PATH is not set
+DEFAULT_SEARCH_DB = os.path.join(HISTORY_DIR, "search.sqlite3")
+
 os.makedirs(HISTORY_DIR, exist_ok=True)
 
+# How long a read of one session waits for its queued writes before reading anyway
+FLUSH_TIMEOUT_SECONDS = 10.0
+
+# --- Storage Backend Selection ---
+_backend: Optional[HistoryBackend] = None
+_backend_lock = threading.Lock()
+_writer: Optional[HistoryWriter] = None
+_search_index: Optional[ChatSearchIndex] = None
+_compression_thread: Optional[threading.Thread] = None
+_compression_stop = threading.Event()
+
+def create_backend(kind: str, history_dir: str = HISTORY_DIR, db_path: Optional[str] = None) -> HistoryBackend:
+    """Builds a history backend by name ('json', 'jsonl' or 'sqlite')."""
+    if kind == "json":
+        return JsonHistoryBackend(history_dir)
+    if kind == "jsonl":
+        return JsonlHistoryBackend(history_dir)
+    if kind == "sqlite":
+        return SQLiteHistoryBackend(db_path or DEFAULT_HISTORY_DB)
+    raise ValueError(f"Unknown history backend '{kind}'. Must be one of: json, jsonl, sqlite")
+
+def get_backend() -> HistoryBackend:
+    """Returns the configured backend (SIGIL_HISTORY_BACKEND), creating it on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(settings.history_backend, db_path=settings.history_db_path)
+                print(f"Chat history backend: {_backend.name}")
+    return _backend
+
+def set_backend(backend: Optional[HistoryBackend]) -> None:
+    """Replaces the active backend (e.g. in tests); None goes back to the configured one."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+def close_backend() -> None:
+    """Closes the active backend and search index (on shutdown) if they were created."""
+    global _backend
+    disable_search()
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
+
+# --- Full-Text Search ---
+def enable_search(db_path: Optional[str] = None) -> Optional[ChatSearchIndex]:
+    """Opens the search index and keeps it updated from now on.
+
+    The first time, every stored session is indexed (which can take a while
+    for a large history); after that only changes are applied. Returns None
+    if this SQLite build lacks FTS5.
+    """
+    global _search_index
+    if _search_index is not None:
+        return _search_index
+    if not fts5_available():
+        print("Warning: SQLite was built without FTS5; chat search is disabled.")
+        return None
+    index = ChatSearchIndex(db_path or DEFAULT_SEARCH_DB)
+    if not index.built:
+        print("Indexing saved chats for search...")
+        print(f"   ✅ Indexed {index.rebuild(get_backend())} chat(s).")
+    _search_index = index
+    return index
+
+def disable_search() -> None:
+    global _search_index
+    index, _search_index = _search_index, None
+    if index is not None:
+        index.close()
+
+def _update_search(action: str, *args) -> None:
+    """Applies a change to the search index; index errors never fail the history operation."""
+    index = _search_index
+    if index is None:
+        return
+    try:
+        getattr(index, action)(*args)
+    except Exception as e:
+        print(f"Error updating chat search index ({action}): {e}")
+
+def search_sessions(query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Full-text search over message content and titles, best match first.
+    Messages still queued by write-behind are found once written.
+    Raises RuntimeError if search is not enabled.
+    """
+    index = _search_index
+    if index is None:
+        raise RuntimeError("Chat search is not enabled.")
+    return index.search(query, limit)
+
+# --- Cold Session Compression ---
+def compress_cold_sessions(codec: str, idle_days: float) -> int:
+    """Compresses sessions untouched for ``idle_days`` (JSON backend only); returns how many."""
+    backend = get_backend()
+    if not getattr(backend, "COMPRESSIBLE", False):
+        return 0
+    return backend.compress_cold_sessions(codec, idle_days * 86400)
+
+def _compression_loop(codec: str, idle_days: float, interval_seconds: float) -> None:
+    while not _compression_stop.wait(interval_seconds):
+        try:
+            compressed = compress_cold_sessions(codec, idle_days)
+            if compressed:
+                print(f"🗜️ Compressed {compressed} cold chat session(s) with {codec}.")
+        except Exception as e:
+            print(f"Error compressing cold chat sessions: {e}")
+
+def start_cold_compression(codec: str, idle_days: float, interval_minutes: float) -> bool:
+    """Starts the background job that compresses cold sessions; False if ``codec`` is unusable."""
+    global _compression_thread
+    unavailable = codec_unavailable_reason(codec)
+    if unavailable:
+        print(f"Warning: cold chat compression disabled: {unavailable}")
+        return False
+    if _compression_thread is None:
+        _compression_stop.clear()
+        _compression_thread = threading.Thread(
+            target=_compression_loop, args=(codec, idle_days, interval_minutes * 60),
+            name="history-compressor", daemon=True,
+        )
+        _compression_thread.start()
+        print(f"Cold chat compression enabled ({codec}, after {idle_days:g} idle days).")
+    return True
+
+def stop_cold_compression() -> None:
+    global _compression_thread
+    thread, _compression_thread = _compression_thread, None
+    if thread is not None:
+        _compression_stop.set()
+        thread.join()
+
+# --- Write-Behind Persistence ---
+def _write_messages(thread_id, messages, sampling_settings, system_prompt) -> None:
+    start = time.perf_counter()
+    get_backend().append_messages(thread_id, messages, sampling_settings, system_prompt)
+    HISTORY_SAVE_SECONDS.observe(time.perf_counter() - start)
+    _update_search("add_messages", thread_id, messages)
+
+def start_write_behind(max_pending_messages: int = 1000) -> HistoryWriter:
+    """Makes save_chat_messages queue writes for a background worker instead of writing inline."""
+    global _writer
+    if _writer is None:
+        _writer = HistoryWriter(_write_messages, max_pending_messages)
+        print(f"Chat history write-behind enabled (queue limit {max_pending_messages} messages).")
+    return _writer
+
+def stop_write_behind() -> None:
+    """Writes everything still queued and goes back to writing inline (on shutdown)."""
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+def flush_writes(timeout: Optional[float] = FLUSH_TIMEOUT_SECONDS) -> bool:
+    """Waits for every queued write (e.g. before a migration); True if nothing is left pending."""
+    writer = _writer
+    if writer is None:
+        return True
+    flushed = writer.flush(timeout)
+    if not flushed:
+        print(f"Warning: chat history writes still pending after {timeout}s.")
+    return flushed
+
+def flush_thread(thread_id: str, timeout: Optional[float] = FLUSH_TIMEOUT_SECONDS) -> bool:
+    """Waits for one thread's queued writes so a following read sees them; other threads' writes are not waited for."""
+    writer = _writer
+    if writer is None:
+        return True
+    flushed = writer.flush_thread(thread_id, timeout)
+    if not flushed:
+        print(f"Warning: chat history writes for {thread_id} still pending after {timeout}s; reading anyway.")
+    return flushed
+
+def _pending_summaries() -> Dict[str, Dict[str, Any]]:
+    """List entries for sessions with writes still queued, as they will read once written."""
+    writer = _writer
+    pending = writer.pending() if writer is not None else {}
+    if not pending:
+        return {}
+    stored = get_backend().session_summaries(list(pending))
+    summaries = {}
+    for thread_id, write in pending.items():
+        queued_at = datetime.datetime.utcfromtimestamp(write.queued_at).isoformat()
+        summary = dict(stored.get(thread_id) or {
+            "thread_id": thread_id,
+            "title": auto_title(write.messages) or thread_id,
+            "created_at": queued_at,
+            "message_count": 0,
+        })
+        summary["last_updated"] = queued_at
+        summary["message_count"] += len(write.messages)
+        summaries[thread_id] = summary
+    return summaries
+
+def write_queue_stats() -> Dict[str, Any]:
+    """Queue depth and counters of the write-behind worker."""
+    writer = _writer
+    if writer is None:
+        return {"enabled": False}
+    return {"enabled": True, **writer.describe()}
+
 def generate_thread_id() -> str:
     """Generates a unique thread ID based on timestamp."""
     now = datetime.datetime.now()
@@ -20,92 +241,32 @@ def generate_thread_id() -> str:
 
 def get_session_filepath(thread_id: str) -> str:
     """Gets the full path for a session's JSON file."""
-    # Basic sanitization to prevent path traversal
-    if ".." in thread_id or "/" in thread_id or "\\" in thread_id:
-        raise ValueError("Invalid thread_id format containing path elements.")
-    return os.path.join(HISTORY_DIR, f"{thread_id}.json")
+    return os.path.join(HISTORY_DIR, f"{validate_thread_id(thread_id)}.json")
 
 def save_chat_messages(
-    thread_id: Optional[str], 
+    thread_id: Optional[str],
     messages: List[Dict[str, Any]],
     sampling_settings: Optional[Dict[str, Any]] = None,
     system_prompt: Optional[str] = None
 ) -> str:
     """
-    Saves a list of messages and associated settings to a chat session file.
+    Saves a list of messages and associated settings to a chat session.
     If thread_id is None, creates a new session.
     Saves sampling settings and system prompt if provided.
+    With write-behind enabled the write is only queued (see start_write_behind).
     Returns the thread_id of the saved session.
     """
     if thread_id is None:
         thread_id = generate_thread_id()
-        # For a new thread, create the full structure
-        session_data = {
-            "thread_id": thread_id, 
-            "messages": messages, 
-            "metadata": {"created_at": datetime.datetime.utcnow().isoformat()},
-            "sampling_settings": sampling_settings,
-            "system_prompt": system_prompt,
-            "custom_title": None # Initialize custom title for new sessions
-        }
-    else:
-        try:
-            filepath = get_session_filepath(thread_id)
-        except ValueError as e:
-             print(f"Error saving: {e}")
-             raise 
-
-        if os.path.exists(filepath):
-            try:
-                with open(filepath, 'r') as f:
-                    session_data = json.load(f)
-                # Append new messages
-                session_data["messages"].extend(messages)
-                session_data["metadata"]["last_updated"] = datetime.datetime.utcnow().isoformat()
-                # Update settings only if they are explicitly passed in
-                if sampling_settings is not None:
-                    session_data["sampling_settings"] = sampling_settings
-                if system_prompt is not None:
-                    session_data["system_prompt"] = system_prompt
-                # Ensure custom_title field exists if loading older session file
-                if "custom_title" not in session_data:
-                    session_data["custom_title"] = None
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"Error reading session file {thread_id}: {e}. Overwriting with new data.")
-                # If file is corrupted, overwrite with current state
-                session_data = {
-                    "thread_id": thread_id, 
-                    "messages": messages, 
-                    "metadata": {"last_updated": datetime.datetime.utcnow().isoformat()},
-                    "sampling_settings": sampling_settings,
-                    "system_prompt": system_prompt,
-                    "custom_title": None
-                }
-        else:
-             # If file doesn't exist for the given ID, create it
-             session_data = {
-                 "thread_id": thread_id, 
-                 "messages": messages, 
-                 "metadata": {"created_at": datetime.datetime.utcnow().isoformat()},
-                 "sampling_settings": sampling_settings,
-                 "system_prompt": system_prompt,
-                 "custom_title": None
-             }
-
-    # Get filepath again (needed if it was a new thread_id or file didn't exist)
     try:
-        filepath = get_session_filepath(thread_id)
+        validate_thread_id(thread_id)
     except ValueError as e:
-         print(f"Error getting filepath for saving: {e}")
-         raise
-         
-    try:
-        with open(filepath, 'w') as f:
-            json.dump(session_data, f, indent=2)
-    except IOError as e:
-        print(f"Error writing session file {thread_id}: {e}")
-        raise # Re-raise the exception to signal failure
+        print(f"Error saving: {e}")
+        raise
 
+    writer = _writer
+    if writer is None or not writer.submit(thread_id, messages, sampling_settings, system_prompt):
+        _write_messages(thread_id, messages, sampling_settings, system_prompt)
     return thread_id
 
 # --- NEW: Function to update only the custom title ---
@@ -116,125 +277,70 @@ def update_session_title(thread_id: str, new_title: str) -> bool:
     Raises ValueError on invalid thread_id.
     """
     try:
-        filepath = get_session_filepath(thread_id)
+        validate_thread_id(thread_id)
     except ValueError as e:
         print(f"Error updating title (invalid thread_id): {e}")
         raise
 
-    if not os.path.exists(filepath):
-        print(f"Session file not found for title update: {filepath}")
-        return False
-
-    try:
-        with open(filepath, 'r') as f:
-            session_data = json.load(f)
-
-        session_data["custom_title"] = new_title.strip() # Save the stripped title
-        session_data["metadata"]["last_updated"] = datetime.datetime.utcnow().isoformat() # Also update timestamp
-
-        with open(filepath, 'w') as f:
-            json.dump(session_data, f, indent=2)
-        
-        print(f"Successfully updated title for session {thread_id}")
-        return True
-    except (json.JSONDecodeError, IOError, KeyError) as e:
-        print(f"Error updating title for session {thread_id}: {e}")
-        return False
+    flush_thread(thread_id)
+    updated = get_backend().update_title(thread_id, new_title.strip()) # Save the stripped title
+    if updated:
+        _update_search("set_title", thread_id, new_title.strip())
+    return updated
 # --- END NEW FUNCTION ---
 
 def get_session(thread_id: str) -> Optional[Dict[str, Any]]:
-    """Loads a chat session from its JSON file."""
+    """Loads a chat session, or returns None if it does not exist or cannot be read."""
     try:
-        filepath = get_session_filepath(thread_id)
+        validate_thread_id(thread_id)
     except ValueError:
         return None # Invalid thread_id format
-        
-    if not os.path.exists(filepath):
-        return None
-    try:
-        with open(filepath, 'r') as f:
-            session_data = json.load(f)
-        # Ensure custom_title field is present in the response, even if None
-        if "custom_title" not in session_data:
-            session_data["custom_title"] = None
-        return session_data
-    except (json.JSONDecodeError, IOError) as e:
-        print(f"Error reading session file {thread_id}: {e}")
-        return None # Indicate failure to load
+    flush_thread(thread_id)
+    return get_backend().get_session(thread_id)
 
 def list_sessions() -> List[Dict[str, Any]]:
-    """Lists all available chat sessions with basic metadata and title."""
-    sessions_list = []
-    if not os.path.isdir(HISTORY_DIR):
-        print(f"History directory not found: {HISTORY_DIR}")
-        return []
-    try:
-        for filename in os.listdir(HISTORY_DIR):
-            if filename.endswith(".json"):
-                thread_id = filename[:-5] # Remove .json extension
-                # Add basic check for potentially invalid filenames from listdir
-                if ".." in thread_id or "/" in thread_id or "\\" in thread_id:
-                    print(f"Skipping potentially unsafe filename: {filename}")
-                    continue
-                
-                # --- MODIFIED: Read title from session data ---
-                session_data = get_session(thread_id) # Use get_session to load full data
-                if not session_data:
-                    print(f"Skipping session {thread_id} due to loading error.")
-                    continue # Skip if session failed to load
-
-                # Prioritize custom_title
-                title = session_data.get("custom_title")
-                
-                # Fallback to first user message if custom_title is None or empty
-                if not title:
-                    messages = session_data.get("messages", [])
-                    first_user_message = next((msg.get("content") for msg in messages if msg.get("role") == "user"), None)
-                    if first_user_message:
-                         title = first_user_message[:50] + ('...' if len(first_user_message) > 50 else '') # Truncate
-                    else:
-                         title = thread_id # Ultimate fallback to thread_id
-
-                sessions_list.append({
-                    "thread_id": thread_id,
-                    "title": title, # Use the determined title
-                    "last_updated": session_data.get("metadata", {}).get("last_updated"),
-                    "created_at": session_data.get("metadata", {}).get("created_at")
-                    # Removed direct file reading here, use get_session
-                })
-                # --- END MODIFICATION ---
-
-        # Sort sessions, e.g., by last updated descending (most recent first)
-        sessions_list.sort(key=lambda x: x.get("last_updated") or x.get("created_at") or '', reverse=True)
-
-    except OSError as e:
-        print(f"Error listing directory {HISTORY_DIR}: {e}")
-        return [] # Return empty list on error
-
-    return sessions_list
-
-# --- NEW: Function to delete a session file ---
+    """Lists all available chat sessions with basic metadata and title, most recent first.
+
+    Sessions with writes still queued are listed as they will be once written, without waiting for them.
+    """
+    return list_sessions_page()[0]
+
+def list_sessions_page(limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Lists one page of sessions (most recent first) starting after ``cursor``.
+    Returns the page and the cursor for the next one (None on the last page).
+    Raises ValueError on a malformed cursor.
+    """
+    pending = _pending_summaries()
+    if not pending:
+        return get_backend().list_sessions_page(limit, cursor)
+    # Overlay the queued sessions on the stored page; their stored entries are replaced, wherever they sort
+    sessions, next_cursor = get_backend().list_sessions_page(None if limit is None else limit + len(pending), cursor)
+    sessions = [s for s in sessions if s["thread_id"] not in pending]
+    after = decode_cursor(cursor) if cursor else None
+    sessions += [s for s in pending.values() if after is None or session_sort_key(s) < after]
+    sessions.sort(key=session_sort_key, reverse=True)
+    if limit is None or (len(sessions) <= limit and next_cursor is None):
+        return sessions, None
+    page = sessions[:limit]
+    return page, encode_cursor(page[-1])
+
+# --- NEW: Function to delete a session ---
 def delete_session(thread_id: str) -> bool:
     """
-    Deletes a session file based on thread_id.
+    Deletes a session based on thread_id.
     Returns True if successful, False otherwise.
     Raises ValueError on invalid thread_id format.
     """
     try:
-        filepath = get_session_filepath(thread_id)
+        validate_thread_id(thread_id)
     except ValueError as e:
         print(f"Invalid thread_id for deletion: {e}")
         raise # Re-raise the specific error
 
-    if not os.path.exists(filepath):
-        print(f"Session file not found for deletion: {filepath}")
-        return False # Indicate file not found
-
-    try:
-        os.remove(filepath)
-        print(f"Successfully deleted session file: {filepath}")
-        return True
-    except OSError as e:
-        print(f"Error deleting session file {filepath}: {e}")
-        return False # Indicate deletion failed
-# --- End Delete Function --- 
\ No newline at end of file
+    flush_thread(thread_id)
+    deleted = get_backend().delete_session(thread_id)
+    if deleted:
+        _update_search("remove", thread_id)
+    return deleted
+# --- End Delete Function ---
@@ -0,0 +1,876 @@
+import base64
+import binascii
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .history_compression import CODEC_EXTENSIONS, ZstdDictionaries, codec_for_path, compress, decompress
+
+
+def utcnow_iso() -> str:
+    return datetime.datetime.utcnow().isoformat()
+
+
+def validate_thread_id(thread_id: str) -> str:
+    """Rejects thread ids that could escape the history directory."""
+    # Basic sanitization to prevent path traversal
+    if ".." in thread_id or "/" in thread_id or "\\" in thread_id:
+        raise ValueError("Invalid thread_id format containing path elements.")
+    return thread_id
+
+
+def auto_title(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """Title used when a session has no custom title: the start of its first user message."""
+    first_user_message = next((msg.get("content") for msg in messages if msg.get("role") == "user"), None)
+    if not first_user_message:
+        return None
+    return first_user_message[:50] + ('...' if len(first_user_message) > 50 else '')
+
+
+def session_sort_key(summary: Dict[str, Any]) -> Tuple[str, str]:
+    """Order of the session list (applied descending): last activity, then thread id as a tie-break."""
+    return (summary.get("last_updated") or summary.get("created_at") or "", summary.get("thread_id") or "")
+
+
+def encode_cursor(summary: Dict[str, Any]) -> str:
+    """Opaque pagination cursor pointing just past ``summary`` in the session list."""
+    return base64.urlsafe_b64encode(json.dumps(list(session_sort_key(summary))).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        activity, thread_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid session cursor: {cursor!r}") from e
+    return str(activity), str(thread_id)
+
+
+def new_session(thread_id: str, messages: List[Dict[str, Any]], sampling_settings=None, system_prompt=None) -> Dict[str, Any]:
+    """The structure every backend returns from get_session."""
+    return {
+        "thread_id": thread_id,
+        "messages": list(messages),
+        "metadata": {"created_at": utcnow_iso()},
+        "sampling_settings": sampling_settings,
+        "system_prompt": system_prompt,
+        "custom_title": None,
+    }
+
+
+class HistoryBackend:
+    """Storage behind history_manager.
+
+    history_manager keeps the public functions (save_chat_messages,
+    get_session, ...) and validates thread ids; backends only store and
+    retrieve. ``get_session`` returns the same dictionary for every backend
+    (see ``new_session``) and ``list_sessions`` returns summaries with
+    ``thread_id``, ``title``, ``last_updated``, ``created_at`` and
+    ``message_count``, most recent first (see ``session_sort_key``).
+    """
+
+    name = "base"
+
+    def append_messages(
+        self,
+        thread_id: str,
+        messages: List[Dict[str, Any]],
+        sampling_settings: Optional[Dict[str, Any]] = None,
+        system_prompt: Optional[str] = None,
+    ) -> None:
+        """Adds messages to a session, creating it if needed. Settings are only replaced when given."""
+        raise NotImplementedError
+
+    def get_session(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def list_sessions_page(self, limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Returns up to ``limit`` summaries after ``cursor`` and the cursor of the next page (None on the last one)."""
+        sessions = self.list_sessions()
+        if cursor:
+            after = decode_cursor(cursor)
+            sessions = [s for s in sessions if session_sort_key(s) < after]
+        if limit is None or len(sessions) <= limit:
+            return sessions, None
+        page = sessions[:limit]
+        return page, encode_cursor(page[-1])
+
+    def session_summaries(self, thread_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """The list_sessions summaries of those of ``thread_ids`` that are stored, by thread id."""
+        wanted = set(thread_ids)
+        return {s["thread_id"]: s for s in self.list_sessions() if s["thread_id"] in wanted}
+
+    def update_title(self, thread_id: str, title: str) -> bool:
+        raise NotImplementedError
+
+    def delete_session(self, thread_id: str) -> bool:
+        raise NotImplementedError
+
+    def thread_ids(self) -> List[str]:
+        """Every stored thread id (used by migrations)."""
+        raise NotImplementedError
+
+    def import_session(self, session_data: Dict[str, Any]) -> None:
+        """Stores a complete session as returned by get_session, replacing any existing one."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonHistoryBackend(HistoryBackend):
+    """One ``<thread_id>.json`` file per session, rewritten on every change.
+
+    Listing reads a sidecar index (``sessions.index``) of per-session
+    summaries, rather than parsing every conversation. Saves, renames and
+    deletes append their entry to ``sessions.index.log`` instead of
+    rewriting the index, which is compacted (the log folded into it) on
+    load and once the log outgrows it. The first listing reconciles the
+    index with the directory: files whose size or modification time no
+    longer match their entry (edited or copied in by hand) are re-read and
+    entries of removed files are dropped.
+
+    Sessions can also be stored compressed (``<thread_id>.json.gz`` or
+    ``.json.zst``, see ``compress_session``), which reads transparently.
+    Saving to a compressed session writes it back as plain JSON, so only
+    cold sessions stay compressed.
+    """
+
+    name = "json"
+    EXTENSION = ".json"
+    INDEX_FILENAME = "sessions.index"
+    COMPRESSIBLE = True
+    # Index log entries always allowed before compaction (beyond that, as many as the index has sessions)
+    INDEX_LOG_MIN_ENTRIES = 1000
+
+    def __init__(self, history_dir: str):
+        self.history_dir = history_dir
+        self.index_path = os.path.join(history_dir, self.INDEX_FILENAME)
+        self.index_log_path = self.index_path + ".log"
+        os.makedirs(history_dir, exist_ok=True)
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._index_log_entries = 0
+        # Serialises writes, compression and index updates
+        self._lock = threading.RLock()
+        self.zstd_dictionaries = ZstdDictionaries(history_dir)
+
+    def session_path(self, thread_id: str) -> str:
+        return os.path.join(self.history_dir, f"{validate_thread_id(thread_id)}{self.EXTENSION}")
+
+    def _compressed_paths(self, thread_id: str) -> List[str]:
+        if not self.COMPRESSIBLE:
+            return []
+        return [self.session_path(thread_id) + extension for extension in CODEC_EXTENSIONS.values()]
+
+    def stored_path(self, thread_id: str) -> Optional[str]:
+        """The file currently holding a session (plain or compressed), or None if there is none."""
+        for path in [self.session_path(thread_id)] + self._compressed_paths(thread_id):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _read(self, thread_id: str) -> Dict[str, Any]:
+        path = self.stored_path(thread_id) or self.session_path(thread_id)
+        codec = codec_for_path(path)
+        if codec is None:
+            with open(path, 'r') as f:
+                return json.load(f)
+        with open(path, 'rb') as f:
+            return json.loads(decompress(f.read(), codec, self.zstd_dictionaries))
+
+    def _write(self, session_data: Dict[str, Any]) -> None:
+        with open(self.session_path(session_data["thread_id"]), 'w') as f:
+            json.dump(session_data, f, indent=2)
+        for path in self._compressed_paths(session_data["thread_id"]):
+            if os.path.exists(path):
+                os.remove(path) # The session is hot again
+        self._record(session_data["thread_id"], session_data)
+
+    # --- Compression ---
+    def compress_session(self, thread_id: str, codec: str) -> bool:
+        """Rewrites a session compressed with ``codec``; False if it already is or does not exist."""
+        with self._lock:
+            path = self.stored_path(thread_id)
+            if path is None or codec_for_path(path) == codec:
+                return False
+            session_data = self._read(thread_id)
+            payload = json.dumps(session_data, separators=(",", ":")).encode("utf-8")
+            target = self.session_path(thread_id) + CODEC_EXTENSIONS[codec]
+            with open(f"{target}.tmp", 'wb') as f:
+                f.write(compress(payload, codec, self.zstd_dictionaries))
+            os.replace(f"{target}.tmp", target)
+            for other in [self.session_path(thread_id)] + self._compressed_paths(thread_id):
+                if other != target and os.path.exists(other):
+                    os.remove(other)
+            self._record(thread_id, session_data)
+            return True
+
+    def compress_cold_sessions(self, codec: str, idle_seconds: float) -> int:
+        """Compresses plain sessions not modified for ``idle_seconds``; returns how many were compressed."""
+        cutoff = time.time() - idle_seconds
+        compressed = 0
+        for thread_id in self.thread_ids():
+            path = self.session_path(thread_id)
+            try:
+                if not os.path.exists(path) or os.path.getmtime(path) > cutoff:
+                    continue
+                if self.compress_session(thread_id, codec):
+                    compressed += 1
+            except (OSError, ValueError) as e:
+                print(f"Error compressing session {thread_id}: {e}")
+        return compressed
+
+    def sample_payloads(self, limit: int = 1000) -> List[bytes]:
+        """Compact JSON of up to ``limit`` sessions, for training a zstd dictionary."""
+        samples = []
+        for thread_id in self.thread_ids()[:limit]:
+            session_data = self.get_session(thread_id)
+            if session_data:
+                samples.append(json.dumps(session_data, separators=(",", ":")).encode("utf-8"))
+        return samples
+
+    # --- Session index ---
+    def _index_entry(self, thread_id: str, session_data: Dict[str, Any]) -> Dict[str, Any]:
+        stat = os.stat(self.stored_path(thread_id) or self.session_path(thread_id))
+        metadata = session_data.get("metadata") or {}
+        messages = session_data.get("messages") or []
+        return {
+            "custom_title": session_data.get("custom_title"),
+            "auto_title": auto_title(messages),
+            "created_at": metadata.get("created_at"),
+            "last_updated": metadata.get("last_updated"),
+            "message_count": len(messages),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+
+    def _save_index(self) -> None:
+        """Rewrites the whole index and empties its log (compaction)."""
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, self.index_path) # Readers never see a half-written index
+            if os.path.exists(self.index_log_path):
+                os.remove(self.index_log_path) # Replaying it again would be harmless: entries are whole
+            self._index_log_entries = 0
+        except OSError as e:
+            print(f"Error writing session index {self.index_path}: {e}")
+
+    def _log_index_change(self, thread_id: str, entry: Optional[Dict[str, Any]]) -> None:
+        """Appends one session's new entry (None once deleted) to the index log, compacting when it grows too long."""
+        try:
+            with open(self.index_log_path, 'a') as f:
+                f.write(json.dumps([thread_id, entry]) + "\n")
+        except OSError as e:
+            print(f"Error writing session index log {self.index_log_path}: {e}")
+            return
+        self._index_log_entries += 1
+        if self._index_log_entries > max(self.INDEX_LOG_MIN_ENTRIES, len(self._index or {})):
+            self._save_index()
+
+    def _replay_index_log(self, index: Dict[str, Dict[str, Any]]) -> int:
+        """Applies the index log to ``index``; returns how many entries it held. A torn last line is skipped."""
+        applied = 0
+        try:
+            with open(self.index_log_path, 'r', encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        thread_id, entry = json.loads(line)
+                    except (json.JSONDecodeError, TypeError, ValueError):
+                        continue
+                    if entry is None:
+                        index.pop(thread_id, None)
+                    elif isinstance(entry, dict):
+                        index[thread_id] = entry
+                    applied += 1
+        except FileNotFoundError:
+            pass
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Session index log unreadable ({e}); reconciling from the files.")
+        return applied
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the index, reading and reconciling it with the directory on first use."""
+        if self._index is not None:
+            return self._index
+        try:
+            with open(self.index_path, 'r') as f:
+                stored = json.load(f)
+            if not isinstance(stored, dict):
+                stored = {}
+        except FileNotFoundError:
+            stored = {}
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Session index unreadable ({e}); rebuilding it.")
+            stored = {}
+        logged = self._replay_index_log(stored)
+
+        index, changed = {}, bool(logged)
+        for thread_id in self.thread_ids():
+            entry = stored.get(thread_id)
+            try:
+                stat = os.stat(self.stored_path(thread_id) or self.session_path(thread_id))
+            except OSError:
+                continue
+            if not entry or entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+                changed = True
+                session_data = self.get_session(thread_id)
+                if not session_data:
+                    print(f"Skipping session {thread_id} due to loading error.")
+                    continue # Skip if session failed to load
+                entry = self._index_entry(thread_id, session_data)
+            index[thread_id] = entry
+        self._index = index
+        if changed or len(index) != len(stored):
+            self._save_index()
+        return index
+
+    def _record(self, thread_id: str, session_data: Optional[Dict[str, Any]]) -> None:
+        """Updates (or, with ``session_data=None``, removes) a session's index entry."""
+        with self._lock:
+            if self._index is None:
+                return # Built from the files on first listing
+            if session_data is None:
+                self._index.pop(thread_id, None)
+            else:
+                self._index[thread_id] = self._index_entry(thread_id, session_data)
+            self._log_index_change(thread_id, self._index.get(thread_id))
+
+    def append_messages(self, thread_id, messages, sampling_settings=None, system_prompt=None) -> None:
+        with self._lock:
+            self._append_messages(thread_id, messages, sampling_settings, system_prompt)
+
+    def _append_messages(self, thread_id, messages, sampling_settings, system_prompt) -> None:
+        if self.stored_path(thread_id) is not None:
+            try:
+                session_data = self._read(thread_id)
+                # Append new messages
+                session_data["messages"].extend(messages)
+                session_data["metadata"]["last_updated"] = utcnow_iso()
+                # Update settings only if they are explicitly passed in
+                if sampling_settings is not None:
+                    session_data["sampling_settings"] = sampling_settings
+                if system_prompt is not None:
+                    session_data["system_prompt"] = system_prompt
+                # Ensure custom_title field exists if loading older session file
+                session_data.setdefault("custom_title", None)
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"Error reading session file {thread_id}: {e}. Overwriting with new data.")
+                # If file is corrupted, overwrite with current state
+                session_data = new_session(thread_id, messages, sampling_settings, system_prompt)
+                session_data["metadata"] = {"last_updated": utcnow_iso()}
+        else:
+            # If file doesn't exist for the given ID, create it
+            session_data = new_session(thread_id, messages, sampling_settings, system_prompt)
+
+        try:
+            self._write(session_data)
+        except IOError as e:
+            print(f"Error writing session file {thread_id}: {e}")
+            raise # Re-raise the exception to signal failure
+
+    def get_session(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        if self.stored_path(thread_id) is None:
+            return None
+        try:
+            session_data = self._read(thread_id)
+        except (ValueError, IOError) as e: # Also covers corrupt compressed payloads
+            print(f"Error reading session file {thread_id}: {e}")
+            return None # Indicate failure to load
+        # Ensure custom_title field is present in the response, even if None
+        session_data.setdefault("custom_title", None)
+        return session_data
+
+    def update_title(self, thread_id: str, title: str) -> bool:
+        if self.stored_path(thread_id) is None:
+            print(f"Session file not found for title update: {self.session_path(thread_id)}")
+            return False
+        try:
+            with self._lock:
+                session_data = self._read(thread_id)
+                session_data["custom_title"] = title
+                session_data["metadata"]["last_updated"] = utcnow_iso() # Also update timestamp
+                self._write(session_data)
+            print(f"Successfully updated title for session {thread_id}")
+            return True
+        except (ValueError, IOError, KeyError) as e:
+            print(f"Error updating title for session {thread_id}: {e}")
+            return False
+
+    def thread_ids(self) -> List[str]:
+        thread_ids, seen = [], set()
+        extensions = [self.EXTENSION]
+        if self.COMPRESSIBLE:
+            extensions += [self.EXTENSION + extension for extension in CODEC_EXTENSIONS.values()]
+        for filename in os.listdir(self.history_dir):
+            extension = next((e for e in extensions if filename.endswith(e)), None)
+            if extension is None:
+                continue
+            thread_id = filename[:-len(extension)] # Remove the extension
+            if thread_id in seen:
+                continue # Plain and compressed copies left by an interrupted compression
+            # Add basic check for potentially invalid filenames from listdir
+            if ".." in thread_id or "/" in thread_id or "\\" in thread_id:
+                print(f"Skipping potentially unsafe filename: {filename}")
+                continue
+            seen.add(thread_id)
+            thread_ids.append(thread_id)
+        return thread_ids
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        try:
+            with self._lock:
+                index = dict(self._load_index())
+        except OSError as e:
+            print(f"Error listing directory {self.history_dir}: {e}")
+            return [] # Return empty list on error
+
+        sessions_list = [self._summary(thread_id, entry) for thread_id, entry in index.items()]
+        # Sort sessions by last activity descending (most recent first)
+        sessions_list.sort(key=session_sort_key, reverse=True)
+        return sessions_list
+
+    @staticmethod
+    def _summary(thread_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "thread_id": thread_id,
+            # Prioritize custom_title, then the first user message, then the thread_id
+            "title": entry.get("custom_title") or entry.get("auto_title") or thread_id,
+            "last_updated": entry.get("last_updated"),
+            "created_at": entry.get("created_at"),
+            "message_count": entry.get("message_count", 0),
+        }
+
+    def session_summaries(self, thread_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        try:
+            with self._lock:
+                index = self._load_index()
+                return {t: self._summary(t, index[t]) for t in thread_ids if t in index}
+        except OSError as e:
+            print(f"Error listing directory {self.history_dir}: {e}")
+            return {}
+
+    def delete_session(self, thread_id: str) -> bool:
+        filepath = self.stored_path(thread_id)
+        if filepath is None:
+            print(f"Session file not found for deletion: {self.session_path(thread_id)}")
+            return False # Indicate file not found
+        try:
+            with self._lock:
+                for path in [self.session_path(thread_id)] + self._compressed_paths(thread_id):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._record(thread_id, None)
+            print(f"Successfully deleted session file: {filepath}")
+            return True
+        except OSError as e:
+            print(f"Error deleting session file {filepath}: {e}")
+            return False # Indicate deletion failed
+
+    def import_session(self, session_data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._write(session_data)
+
+
+class JsonlHistoryBackend(JsonHistoryBackend):
+    """Append-only journal per session: ``<thread_id>.jsonl``, one JSON event per line.
+
+    Saving a turn appends its messages (and settings) without reading the
+    session back, so writes take constant time, and a crash can at worst
+    leave a torn last line, which replay skips instead of discarding the
+    whole history. Events:
+
+    - ``created`` (``at``): first line of every journal
+    - ``message`` (``message``): one per chat message
+    - ``settings`` (``sampling_settings`` and/or ``system_prompt``)
+    - ``title`` (``custom_title``, ``at``) and ``updated`` (``at``)
+
+    Once a journal holds ``COMPACT_AFTER`` superseded settings/title/update
+    events, the next read rewrites it to its minimal form through a
+    temporary file and an atomic rename.
+    """
+
+    name = "jsonl"
+    EXTENSION = ".jsonl"
+    INDEX_FILENAME = "journal.index"
+    COMPRESSIBLE = False # Journals must stay appendable
+    COMPACT_AFTER = 64
+
+    def __init__(self, history_dir: str):
+        super().__init__(history_dir)
+        # Appends and compaction must not interleave. The backend lock is reused (it is
+        # reentrant) because rebuilding the index replays, and may compact, journals.
+        self._journal_lock = self._lock
+
+    @staticmethod
+    def _dump(events: List[Dict[str, Any]]) -> bytes:
+        return "".join(json.dumps(event) + "\n" for event in events).encode("utf-8")
+
+    def _append_events(self, thread_id: str, events: List[Dict[str, Any]]) -> None:
+        with open(self.session_path(thread_id), 'a+b') as f:
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n") # Isolate a torn line left by a crash instead of extending it
+            f.write(self._dump(events))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replay(self, thread_id: str) -> Tuple[Dict[str, Any], int]:
+        """Rebuilds a session from its journal; also returns how many events are superseded."""
+        session_data = new_session(thread_id, [])
+        session_data["metadata"] = {}
+        state_events = 0
+        with open(self.session_path(thread_id), 'r', encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                    kind = event["event"]
+                    if kind == "message" and not isinstance(event["message"], dict):
+                        raise TypeError("message event without a message")
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    print(f"Skipping unreadable line {line_number} of session journal {thread_id}.")
+                    continue
+                if kind == "created":
+                    if event.get("at"):
+                        session_data["metadata"]["created_at"] = event["at"]
+                elif kind == "message":
+                    session_data["messages"].append(event["message"])
+                elif kind == "settings":
+                    state_events += 1
+                    if "sampling_settings" in event:
+                        session_data["sampling_settings"] = event["sampling_settings"]
+                    if "system_prompt" in event:
+                        session_data["system_prompt"] = event["system_prompt"]
+                elif kind in ("title", "updated"):
+                    state_events += 1
+                    if kind == "title":
+                        session_data["custom_title"] = event.get("custom_title")
+                    if event.get("at"):
+                        session_data["metadata"]["last_updated"] = event["at"]
+        # A compacted journal has one settings event and at most one title/updated event
+        return session_data, max(0, state_events - 2)
+
+    @staticmethod
+    def _snapshot_events(session_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        metadata = session_data.get("metadata") or {}
+        events = [{"event": "created", "at": metadata.get("created_at")}]
+        events.append({
+            "event": "settings",
+            "sampling_settings": session_data.get("sampling_settings"),
+            "system_prompt": session_data.get("system_prompt"),
+        })
+        events.extend({"event": "message", "message": message} for message in session_data.get("messages") or [])
+        if session_data.get("custom_title") is not None:
+            events.append({"event": "title", "custom_title": session_data["custom_title"], "at": metadata.get("last_updated")})
+        elif metadata.get("last_updated"):
+            events.append({"event": "updated", "at": metadata["last_updated"]})
+        return events
+
+    def _read(self, thread_id: str) -> Dict[str, Any]:
+        return self._replay(thread_id)[0]
+
+    def _write(self, session_data: Dict[str, Any]) -> None:
+        """Replaces a journal with its compacted form (temporary file + atomic rename)."""
+        thread_id = session_data["thread_id"]
+        filepath = self.session_path(thread_id)
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self._dump(self._snapshot_events(session_data)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+        self._record(thread_id, session_data)
+
+    def _record_change(self, thread_id: str, messages: List[Dict[str, Any]], now: str, title: Optional[str] = None) -> None:
+        """Updates an existing index entry after an append, without replaying the journal."""
+        with self._lock:
+            entry = (self._index or {}).get(thread_id)
+            if entry is None:
+                return
+            entry["message_count"] += len(messages)
+            entry["auto_title"] = entry.get("auto_title") or auto_title(messages)
+            entry["last_updated"] = now
+            if title is not None:
+                entry["custom_title"] = title
+            stat = os.stat(self.session_path(thread_id))
+            entry["size"], entry["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+            self._log_index_change(thread_id, entry)
+
+    def append_messages(self, thread_id, messages, sampling_settings=None, system_prompt=None) -> None:
+        now = utcnow_iso()
+        events = [{"event": "message", "message": message} for message in messages]
+        settings_event: Dict[str, Any] = {"event": "settings"}
+        if sampling_settings is not None:
+            settings_event["sampling_settings"] = sampling_settings
+        if system_prompt is not None:
+            settings_event["system_prompt"] = system_prompt
+
+        with self._journal_lock:
+            if not os.path.exists(self.session_path(thread_id)):
+                session_data = new_session(thread_id, messages, sampling_settings, system_prompt)
+                session_data["metadata"]["created_at"] = now
+                self._write(session_data)
+                return
+            if len(settings_event) > 1:
+                events.append(settings_event)
+            events.append({"event": "updated", "at": now})
+            try:
+                self._append_events(thread_id, events)
+            except OSError as e:
+                print(f"Error appending to session journal {thread_id}: {e}")
+                raise # Re-raise the exception to signal failure
+            self._record_change(thread_id, messages, now)
+
+    def get_session(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.session_path(thread_id)):
+            return None
+        try:
+            with self._journal_lock:
+                session_data, superseded = self._replay(thread_id)
+                if superseded >= self.COMPACT_AFTER:
+                    self._write(session_data)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Error reading session journal {thread_id}: {e}")
+            return None # Indicate failure to load
+        return session_data
+
+    def update_title(self, thread_id: str, title: str) -> bool:
+        if not os.path.exists(self.session_path(thread_id)):
+            print(f"Session file not found for title update: {self.session_path(thread_id)}")
+            return False
+        now = utcnow_iso()
+        try:
+            with self._journal_lock:
+                self._append_events(thread_id, [{"event": "title", "custom_title": title, "at": now}])
+                self._record_change(thread_id, [], now, title=title)
+        except OSError as e:
+            print(f"Error updating title for session {thread_id}: {e}")
+            return False
+        print(f"Successfully updated title for session {thread_id}")
+        return True
+
+    def compact(self, thread_id: str) -> None:
+        """Rewrites one journal to its minimal form."""
+        with self._journal_lock:
+            self._write(self._replay(thread_id)[0])
+
+    def import_session(self, session_data: Dict[str, Any]) -> None:
+        with self._journal_lock:
+            self._write(session_data)
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """Embedded SQLite store: one row per message, indexed session metadata.
+
+    Saving a turn inserts only the new message rows and updates one session
+    row, so its cost does not grow with the length of the conversation. The
+    database runs in WAL mode so reads are not blocked by a write in
+    progress.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            thread_id TEXT PRIMARY KEY,
+            created_at TEXT,
+            last_updated TEXT,
+            last_activity TEXT NOT NULL,
+            custom_title TEXT,
+            auto_title TEXT,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            sampling_settings TEXT,
+            system_prompt TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_activity_thread ON sessions (last_activity DESC, thread_id DESC);
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            thread_id TEXT NOT NULL REFERENCES sessions (thread_id) ON DELETE CASCADE,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            extra TEXT
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_thread_seq ON messages (thread_id, seq);
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # One shared connection; requests run on a thread pool, so access is serialised by a lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _message_row(thread_id: str, seq: int, message: Dict[str, Any]):
+        extra = {k: v for k, v in message.items() if k not in ("role", "content")}
+        return (thread_id, seq, message.get("role", ""), message.get("content", ""), json.dumps(extra) if extra else None)
+
+    def _insert_messages(self, thread_id: str, first_seq: int, messages: List[Dict[str, Any]]) -> None:
+        self._conn.executemany(
+            "INSERT INTO messages (thread_id, seq, role, content, extra) VALUES (?, ?, ?, ?, ?)",
+            [self._message_row(thread_id, first_seq + i, m) for i, m in enumerate(messages)],
+        )
+
+    def append_messages(self, thread_id, messages, sampling_settings=None, system_prompt=None) -> None:
+        now = utcnow_iso()
+        settings_json = json.dumps(sampling_settings) if sampling_settings is not None else None
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT message_count FROM sessions WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO sessions (thread_id, created_at, last_activity, auto_title, message_count,"
+                    " sampling_settings, system_prompt) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, now, now, auto_title(messages), len(messages), settings_json, system_prompt),
+                )
+                first_seq = 0
+            else:
+                self._conn.execute(
+                    "UPDATE sessions SET last_updated = ?, last_activity = ?, message_count = message_count + ?,"
+                    " sampling_settings = COALESCE(?, sampling_settings), system_prompt = COALESCE(?, system_prompt),"
+                    " auto_title = COALESCE(auto_title, ?) WHERE thread_id = ?",
+                    (now, now, len(messages), settings_json, system_prompt, auto_title(messages), thread_id),
+                )
+                first_seq = row["message_count"]
+            self._insert_messages(thread_id, first_seq, messages)
+
+    def get_session(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._conn.execute("SELECT * FROM sessions WHERE thread_id = ?", (thread_id,)).fetchone()
+            if session is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT role, content, extra FROM messages WHERE thread_id = ? ORDER BY seq", (thread_id,)
+            ).fetchall()
+        messages = []
+        for row in rows:
+            message = {"role": row["role"], "content": row["content"]}
+            if row["extra"]:
+                message.update(json.loads(row["extra"]))
+            messages.append(message)
+        metadata = {"created_at": session["created_at"]} if session["created_at"] else {}
+        if session["last_updated"]:
+            metadata["last_updated"] = session["last_updated"]
+        return {
+            "thread_id": thread_id,
+            "messages": messages,
+            "metadata": metadata,
+            "sampling_settings": json.loads(session["sampling_settings"]) if session["sampling_settings"] else None,
+            "system_prompt": session["system_prompt"],
+            "custom_title": session["custom_title"],
+        }
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        return self.list_sessions_page()[0]
+
+    def list_sessions_page(self, limit=None, cursor=None):
+        # Keyset pagination straight off the (last_activity, thread_id) index
+        query = "SELECT thread_id, custom_title, auto_title, last_updated, created_at, message_count FROM sessions"
+        params: List[Any] = []
+        if cursor:
+            query += " WHERE (last_activity, thread_id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
+        query += " ORDER BY last_activity DESC, thread_id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit + 1) # One extra row tells whether there is a next page
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        sessions = [self._summary(row) for row in rows]
+        if limit is None or len(sessions) <= limit:
+            return sessions, None
+        page = sessions[:limit]
+        return page, encode_cursor(page[-1])
+
+    @staticmethod
+    def _summary(row) -> Dict[str, Any]:
+        return {
+            "thread_id": row["thread_id"],
+            "title": row["custom_title"] or row["auto_title"] or row["thread_id"],
+            "last_updated": row["last_updated"],
+            "created_at": row["created_at"],
+            "message_count": row["message_count"],
+        }
+
+    def session_summaries(self, thread_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not thread_ids:
+            return {}
+        query = (
+            "SELECT thread_id, custom_title, auto_title, last_updated, created_at, message_count FROM sessions"
+            f" WHERE thread_id IN ({', '.join('?' * len(thread_ids))})"
+        )
+        with self._lock:
+            rows = self._conn.execute(query, list(thread_ids)).fetchall()
+        return {row["thread_id"]: self._summary(row) for row in rows}
+
+    def update_title(self, thread_id: str, title: str) -> bool:
+        now = utcnow_iso()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE sessions SET custom_title = ?, last_updated = ?, last_activity = ? WHERE thread_id = ?",
+                (title, now, now, thread_id),
+            )
+        if cursor.rowcount == 0:
+            print(f"Session not found for title update: {thread_id}")
+            return False
+        print(f"Successfully updated title for session {thread_id}")
+        return True
+
+    def delete_session(self, thread_id: str) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+        if cursor.rowcount == 0:
+            print(f"Session not found for deletion: {thread_id}")
+            return False
+        print(f"Successfully deleted session: {thread_id}")
+        return True
+
+    def thread_ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT thread_id FROM sessions")]
+
+    def import_session(self, session_data: Dict[str, Any]) -> None:
+        thread_id = session_data["thread_id"]
+        metadata = session_data.get("metadata") or {}
+        messages = session_data.get("messages") or []
+        sampling_settings = session_data.get("sampling_settings")
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+            self._conn.execute(
+                "INSERT INTO sessions (thread_id, created_at, last_updated, last_activity, custom_title, auto_title,"
+                " message_count, sampling_settings, system_prompt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    metadata.get("created_at"),
+                    metadata.get("last_updated"),
+                    metadata.get("last_updated") or metadata.get("created_at") or "",
+                    session_data.get("custom_title"),
+                    auto_title(messages),
+                    len(messages),
+                    json.dumps(sampling_settings) if sampling_settings is not None else None,
+                    session_data.get("system_prompt"),
+                ),
+            )
+            self._insert_messages(thread_id, 0, messages)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,186 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+class PendingWrite:
+    """Everything queued for one thread since its last write."""
+
+    def __init__(self):
+        self.messages: List[Dict[str, Any]] = []
+        self.sampling_settings: Optional[Dict[str, Any]] = None
+        self.system_prompt: Optional[str] = None
+        self.queued_at = time.time()  # Latest submit, shown as the session's last activity until written
+
+    def merge(self, later: "PendingWrite") -> None:
+        """Coalesces a later write for the same thread into this one."""
+        self.messages.extend(later.messages)
+        if later.sampling_settings is not None:
+            self.sampling_settings = later.sampling_settings
+        if later.system_prompt is not None:
+            self.system_prompt = later.system_prompt
+        self.queued_at = later.queued_at
+
+
+class HistoryWriter:
+    """Persists chat history on a background thread, off the request path.
+
+    ``submit`` only queues the messages; a single worker drains everything
+    queued so far as one batch. Several turns queued for the same thread are
+    coalesced into one write (messages in order, the latest settings). The
+    queue is bounded by ``max_pending_messages``: once it is full, ``submit``
+    blocks until the worker catches up, so a slow disk slows requests down
+    instead of growing memory without limit. Readers wait for one thread
+    with ``flush_thread``, which the worker writes next; ``pending`` lets
+    listings show queued writes without waiting at all.
+    """
+
+    def __init__(self, write: Callable[..., Any], max_pending_messages: int = 1000):
+        self._write = write
+        self.max_pending_messages = max_pending_messages
+        self._pending: "OrderedDict[str, PendingWrite]" = OrderedDict()
+        self._pending_messages = 0
+        self._in_flight: "OrderedDict[str, PendingWrite]" = OrderedDict()  # Taken by the worker, not written yet
+        self._wanted: Dict[str, int] = {}  # Threads readers are waiting for, written first
+        self._closed = False
+        self._cond = threading.Condition()
+        self.batches_written = 0
+        self.threads_written = 0
+        self.failed_writes = 0
+        self.last_batch_seconds: Optional[float] = None
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        thread_id: str,
+        messages: List[Dict[str, Any]],
+        sampling_settings: Optional[Dict[str, Any]] = None,
+        system_prompt: Optional[str] = None,
+    ) -> bool:
+        """Queues a write; returns False if the writer is closed (the caller should write directly)."""
+        with self._cond:
+            while self._pending_messages >= self.max_pending_messages and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return False
+            pending = self._pending.get(thread_id)
+            if pending is None:
+                pending = self._pending[thread_id] = PendingWrite()
+            pending.messages.extend(messages)
+            if sampling_settings is not None:
+                pending.sampling_settings = sampling_settings
+            if system_prompt is not None:
+                pending.system_prompt = system_prompt
+            pending.queued_at = time.time()
+            self._pending_messages += len(messages)
+            self._cond.notify_all()
+        return True
+
+    def _next_write(self) -> Optional[str]:
+        """Picks the next thread of the current batch to write: one a reader is waiting for, else the oldest."""
+        for thread_id in self._wanted:
+            pending = self._pending.pop(thread_id, None)
+            if pending is not None:  # Queued after the batch was taken: written now rather than next batch
+                self._pending_messages -= len(pending.messages)
+                if thread_id in self._in_flight:
+                    self._in_flight[thread_id].merge(pending)
+                else:
+                    self._in_flight[thread_id] = pending
+                self._cond.notify_all()
+            if thread_id in self._in_flight:
+                return thread_id
+        return next(iter(self._in_flight), None)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return # Closed and drained
+                self._in_flight, self._pending = self._pending, OrderedDict()
+                self._pending_messages = 0
+                self._cond.notify_all() # Wake submitters blocked on a full queue
+
+            start = time.perf_counter()
+            written = failed = 0
+            while True:
+                with self._cond:
+                    thread_id = self._next_write()
+                    if thread_id is None:
+                        break
+                    pending = self._in_flight[thread_id]
+                try:
+                    self._write(thread_id, pending.messages, pending.sampling_settings, pending.system_prompt)
+                    written += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"Error saving chat history for {thread_id} ({len(pending.messages)} messages lost): {e}", file=sys.stderr)
+                with self._cond:
+                    del self._in_flight[thread_id]
+                    self._cond.notify_all()
+
+            with self._cond:
+                self.batches_written += 1
+                self.threads_written += written
+                self.failed_writes += failed
+                self.last_batch_seconds = round(time.perf_counter() - start, 4)
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until everything queued so far has been written; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._in_flight, timeout)
+
+    def flush_thread(self, thread_id: str, timeout: Optional[float] = None) -> bool:
+        """Waits until one thread's queued writes are on disk, moving them to the front; False on timeout."""
+        with self._cond:
+            if thread_id not in self._pending and thread_id not in self._in_flight:
+                return True
+            self._wanted[thread_id] = self._wanted.get(thread_id, 0) + 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(
+                    lambda: thread_id not in self._pending and thread_id not in self._in_flight, timeout
+                )
+            finally:
+                self._wanted[thread_id] -= 1
+                if not self._wanted[thread_id]:
+                    del self._wanted[thread_id]
+
+    def pending(self) -> Dict[str, PendingWrite]:
+        """Snapshot of every thread with writes not yet on disk, queued or being written."""
+        with self._cond:
+            snapshot: Dict[str, PendingWrite] = {}
+            for queue in (self._in_flight, self._pending):
+                for thread_id, write in queue.items():
+                    copy = PendingWrite()
+                    copy.merge(write)
+                    if thread_id in snapshot:
+                        snapshot[thread_id].merge(copy)
+                    else:
+                        snapshot[thread_id] = copy
+            return snapshot
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Writes whatever is still queued and stops the worker."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def describe(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending_threads": len(self._pending),
+                "pending_messages": self._pending_messages,
+                "in_flight_threads": len(self._in_flight),
+                "max_pending_messages": self.max_pending_messages,
+                "batches_written": self.batches_written,
+                "threads_written": self.threads_written,
+                "failed_writes": self.failed_writes,
+                "last_batch_seconds": self.last_batch_seconds,
+            }
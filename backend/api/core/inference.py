@@ -1,5 +1,67 @@
+import threading
+from typing import Hashable, Iterator, List, Optional
+
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
+
+from .kv_cache import SystemPromptCache, ThreadKVCacheStore
+from .scheduler import InferenceScheduler
+from .metrics import StepTimer, observe_generation
+from .speculative import DraftModel
+from .stopping import build_stopping_criteria
+from .warmup import static_cache_for
+
+def _take_cached_prefix(
+    kv_cache: Optional[ThreadKVCacheStore],
+    cache_key: Optional[Hashable],
+    input_ids: torch.Tensor,
+    model=None,
+    tokenizer=None,
+    prefix_cache: Optional[SystemPromptCache] = None,
+    system_prompt: Optional[str] = None,
+):
+    """Returns a past_key_values to start generation from, or None.
+
+    The thread's own cache from the previous turn is used unless the pinned
+    system prompt prefix covers more of the prompt.
+    """
+    prompt_ids = input_ids[0].tolist()
+    past_key_values, reused = None, 0
+    if kv_cache is not None and cache_key is not None and kv_cache.enabled:
+        past_key_values, reused = kv_cache.take(cache_key, prompt_ids)
+    if prefix_cache is not None and system_prompt is not None and model is not None:
+        # The pinned prefix wins if it covers more, e.g. after a system prompt change
+        seeded, seeded_reused = prefix_cache.seed(model, tokenizer, system_prompt, prompt_ids, min_tokens=reused)
+        if seeded is not None:
+            print(f"   📌 Seeding from system prompt cache ({seeded_reused}/{len(prompt_ids)} prompt tokens)")
+            return seeded
+    if past_key_values is not None:
+        print(f"   ♻️ Reusing KV cache for {reused}/{len(prompt_ids)} prompt tokens (key: {cache_key})")
+    return past_key_values
+
+def _store_cache(kv_cache: Optional[ThreadKVCacheStore], cache_key: Optional[Hashable], outputs) -> None:
+    """Saves the cache left by generate so the next turn of the thread can extend it."""
+    if kv_cache is None or cache_key is None or not kv_cache.enabled:
+        return
+    past_key_values = getattr(outputs, "past_key_values", None)
+    if past_key_values is None or not hasattr(past_key_values, "crop"):
+        return
+    cached_length = past_key_values.get_seq_length()
+    kv_cache.put(cache_key, outputs.sequences[0][:cached_length].tolist(), past_key_values)
+
+def _assisted_kwargs(draft: Optional[DraftModel], model, tokenizer, static_cache) -> dict:
+    """Returns the generate arguments for speculative decoding with ``draft``, or {} to decode normally."""
+    # Assisted decoding rolls the cache back past rejected drafts, which a compiled model's static cache cannot do
+    if draft is None or static_cache is not None:
+        return {}
+    return draft.generate_kwargs(model, tokenizer)
+
+def _prompt_inputs(tokenizer, prompt: str, prompt_ids: Optional[List[int]], device: str) -> dict:
+    """Tokenizes ``prompt``, or wraps ``prompt_ids`` already assembled for it (see core.prompt_cache)."""
+    if prompt_ids is None:
+        return tokenizer(prompt, return_tensors="pt").to(device)
+    input_ids = torch.tensor([list(prompt_ids)], dtype=torch.long, device=device)
+    return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
 
 def generate_response(
     model: AutoModelForCausalLM,
@@ -9,8 +71,50 @@ def generate_response(
     temperature: float,
     top_p: float,
     max_new_tokens: int,
+    top_k: int = 50,
+    stop_sequences: Optional[List[str]] = None,
+    scheduler: Optional[InferenceScheduler] = None,
+    draft: Optional[DraftModel] = None,
+    kv_cache: Optional[ThreadKVCacheStore] = None,
+    cache_key: Optional[Hashable] = None,
+    prefix_cache: Optional[SystemPromptCache] = None,
+    system_prompt: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+    step_timer: Optional[StepTimer] = None,
+    prompt_ids: Optional[List[int]] = None,
 ) -> str:
-    """Generates a response string using the provided model and parameters."""
+    """Generates a response string using the provided model and parameters.
+
+    When a running InferenceScheduler is passed, the request is queued on it
+    and batched with other in-flight requests instead of calling
+    ``model.generate`` directly. Otherwise, if ``kv_cache`` and ``cache_key``
+    are given, the KV cache from the previous turn under that key is reused
+    for the shared prompt prefix and the new cache is stored afterwards.
+    Without a thread cache hit, a ``prefix_cache`` pinned for
+    ``system_prompt`` seeds the generation instead. Generation halts as
+    soon as the decoded output contains any of ``stop_sequences`` (see
+    core.stopping.resolve_stop_sequences); the returned text still contains
+    the stop sequence, so callers truncate. Setting ``cancel_event`` stops
+    generation after the current step and returns the text so far. A
+    ``step_timer`` passed in can be read afterwards for this generation's
+    own prefill and decode timings. ``prompt_ids``, when given, are the
+    token ids of ``prompt`` and are used instead of tokenizing it again.
+    """
+    if scheduler is not None:
+        if prompt_ids is None:
+            prompt_ids = tokenizer(prompt)["input_ids"]
+        request = scheduler.submit(
+            prompt_ids,
+            temperature=temperature,
+            top_p=top_p,
+            max_new_tokens=max_new_tokens,
+            top_k=top_k,
+            stopping_criteria=build_stopping_criteria(tokenizer, stop_sequences, len(prompt_ids), cancel_event, step_timer or StepTimer()),
+        )
+        generated_ids = request.result()
+        observe_generation(len(prompt_ids), len(generated_ids))
+        return tokenizer.decode(generated_ids, skip_special_tokens=True)
+
     try:
         # Store original device
         original_device = device
@@ -23,7 +127,7 @@ def generate_response(
             model.to(inference_device) # Move model to CPU
 
         # Move inputs to the chosen inference device (CPU or original MPS/CUDA)
-        inputs = tokenizer(prompt, return_tensors="pt").to(inference_device)
+        inputs = _prompt_inputs(tokenizer, prompt, prompt_ids, inference_device)
         input_ids = inputs["input_ids"]
         attention_mask = inputs.get("attention_mask")
         input_length = input_ids.shape[1]
@@ -37,10 +141,24 @@ def generate_response(
         print(f"   Prompt (first 100 chars): {prompt[:100]}...")
         print(f"   Temperature: {temperature}")
         print(f"   Top P: {top_p}")
+        print(f"   Top K: {top_k}")
         print(f"   Max New Tokens: {max_new_tokens}")
         print(f"   Inference Device: {inference_device}")
+        if draft is not None:
+            print(f"   Draft Model: {draft.name}")
         print("------------------------------------")
 
+        # Compiled models decode over a fresh bucketed static cache; eager ones reuse cached prefixes
+        past_key_values = static_cache_for(model, input_length, max_new_tokens)
+        assisted = _assisted_kwargs(draft, model, tokenizer, past_key_values)
+        if past_key_values is None:
+            past_key_values = _take_cached_prefix(
+                kv_cache, cache_key, input_ids, model, tokenizer, prefix_cache, system_prompt
+            )
+
+        timer = step_timer or StepTimer()
+        timer.assisted = bool(assisted)
+        stopping_criteria = build_stopping_criteria(tokenizer, stop_sequences, input_length, cancel_event, timer)
         with torch.no_grad():
             outputs = model.generate(
                 input_ids=input_ids,
@@ -48,20 +166,29 @@ def generate_response(
                 max_new_tokens=max_new_tokens,
                 do_sample=True,
                 temperature=temperature,
-                top_k=50, # Keep default top_k
+                top_k=top_k,
                 top_p=top_p,
-                pad_token_id=tokenizer.pad_token_id
+                pad_token_id=tokenizer.pad_token_id,
+                stopping_criteria=stopping_criteria,
+                past_key_values=past_key_values,
+                return_dict_in_generate=True,
+                **assisted,
             )
+        _store_cache(kv_cache, cache_key, outputs)
+        sequences = outputs.sequences
+        if assisted:
+            draft.stats.record(timer)
 
         # --- Debug: Token Count ---
-        total_tokens = outputs[0].shape[0]
+        total_tokens = sequences[0].shape[0]
         generated_tokens = total_tokens - input_length
         print(f"   Tokens in prompt: {input_length}")
         print(f"   Tokens generated: {generated_tokens} (limit {max_new_tokens})")
+        observe_generation(input_length, generated_tokens)
         print("------------------------------------")
         # --- End Debug ---
 
-        generated_ids = outputs[0][input_length:]
+        generated_ids = sequences[0][input_length:]
         # Decode on CPU is fine
         response_text = tokenizer.decode(generated_ids, skip_special_tokens=True)
         
@@ -76,4 +203,118 @@ def generate_response(
     except Exception as e:
         # Re-raise exceptions to be handled by the calling endpoint
         print(f"Error during core generation: {e}") # Log error here
-        raise e 
\ No newline at end of file
+        raise e 
+
+
+def stream_response(
+    model: AutoModelForCausalLM,
+    tokenizer: AutoTokenizer,
+    device: str,
+    prompt: str,
+    temperature: float,
+    top_p: float,
+    max_new_tokens: int,
+    top_k: int = 50,
+    stop_sequences: Optional[List[str]] = None,
+    scheduler: Optional[InferenceScheduler] = None,
+    draft: Optional[DraftModel] = None,
+    kv_cache: Optional[ThreadKVCacheStore] = None,
+    cache_key: Optional[Hashable] = None,
+    prefix_cache: Optional[SystemPromptCache] = None,
+    system_prompt: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+    step_timer: Optional[StepTimer] = None,
+    prompt_ids: Optional[List[int]] = None,
+) -> Iterator[str]:
+    """Generates a response like generate_response, yielding decoded text chunks as they arrive.
+
+    ``model.generate`` runs on a background thread and feeds a
+    TextIteratorStreamer; this generator drains the streamer so the caller
+    receives text as soon as each token has been decoded. Errors raised by
+    the generation thread are re-raised here once the stream has ended.
+    With a scheduler, the streamer is attached to the batched request instead.
+    The draft, cache, stop, cancel, timer and prompt_ids arguments behave as in generate_response.
+    """
+    if scheduler is not None:
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        if prompt_ids is None:
+            prompt_ids = tokenizer(prompt)["input_ids"]
+        request = scheduler.submit(
+            prompt_ids,
+            temperature=temperature,
+            top_p=top_p,
+            max_new_tokens=max_new_tokens,
+            top_k=top_k,
+            streamer=streamer,
+            stopping_criteria=build_stopping_criteria(tokenizer, stop_sequences, len(prompt_ids), cancel_event, step_timer or StepTimer()),
+        )
+        for chunk in streamer:
+            if chunk:
+                yield chunk
+        observe_generation(len(prompt_ids), len(request.result()))  # Re-raises any scheduler error
+        return
+
+    original_device = device
+    inference_device = device
+    if device == 'mps':
+        print("   ⚠️ MPS device detected. Moving model and inputs to CPU for generation.")
+        inference_device = 'cpu'
+        model.to(inference_device)
+
+    inputs = _prompt_inputs(tokenizer, prompt, prompt_ids, inference_device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    generation_error = []
+
+    past_key_values = static_cache_for(model, inputs["input_ids"].shape[1], max_new_tokens)
+    assisted = _assisted_kwargs(draft, model, tokenizer, past_key_values)
+    timer = step_timer or StepTimer()
+    timer.assisted = bool(assisted)
+    stopping_criteria = build_stopping_criteria(tokenizer, stop_sequences, inputs["input_ids"].shape[1], cancel_event, timer)
+    if past_key_values is None:
+        past_key_values = _take_cached_prefix(
+            kv_cache, cache_key, inputs["input_ids"], model, tokenizer, prefix_cache, system_prompt
+        )
+
+    def run_generation():
+        try:
+            with torch.no_grad():
+                outputs = model.generate(
+                    input_ids=inputs["input_ids"],
+                    attention_mask=inputs.get("attention_mask"),
+                    max_new_tokens=max_new_tokens,
+                    do_sample=True,
+                    temperature=temperature,
+                    top_k=top_k,
+                    top_p=top_p,
+                    pad_token_id=tokenizer.pad_token_id,
+                    stopping_criteria=stopping_criteria,
+                    streamer=streamer,
+                    past_key_values=past_key_values,
+                    return_dict_in_generate=True,
+                    **assisted,
+                )
+            _store_cache(kv_cache, cache_key, outputs)
+            if assisted:
+                draft.stats.record(timer)
+            prompt_tokens = inputs["input_ids"].shape[1]
+            observe_generation(prompt_tokens, outputs.sequences.shape[1] - prompt_tokens)
+        except Exception as e:
+            print(f"Error during streamed generation: {e}")
+            generation_error.append(e)
+            streamer.end() # Unblock the consumer
+        finally:
+            if original_device == 'mps' and inference_device == 'cpu':
+                model.to(original_device)
+
+    print(f"--- Debug: Streaming generation (prompt tokens: {inputs['input_ids'].shape[1]}, limit {max_new_tokens}) ---")
+    thread = threading.Thread(target=run_generation, daemon=True)
+    thread.start()
+    try:
+        for chunk in streamer:
+            if chunk:
+                yield chunk
+    finally:
+        thread.join()
+
+    if generation_error:
+        raise generation_error[0]
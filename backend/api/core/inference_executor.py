@@ -0,0 +1,317 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, Optional
+
+from .metrics import QUEUE_WAIT_SECONDS
+
+DEFAULT_CLIENT = "anonymous"
+
+
+class QueueFullError(Exception):
+    """Raised when a generation cannot be admitted because the queue is at its limit."""
+
+    def __init__(self, queued: int, retry_after: int):
+        super().__init__(f"Generation queue is full ({queued} waiting). Retry in about {retry_after}s.")
+        self.queued = queued
+        self.retry_after = retry_after
+
+
+class GenerationCancelledError(Exception):
+    """Raised to the waiter of a call that was cancelled before it started."""
+
+
+class InferenceJob:
+    """One admitted call: its queue timing, cancel flag and a future holding the outcome."""
+
+    def __init__(
+        self,
+        fn: Callable[..., Any],
+        args,
+        kwargs,
+        client_id: str,
+        request_id: Optional[str] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.client_id = client_id
+        self.request_id = request_id
+        self.cancel_event = cancel_event or threading.Event()
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+
+    @property
+    def queue_wait_ms(self) -> Optional[float]:
+        """Time spent waiting for a worker (None while still queued)."""
+        if self.started_at is None:
+            return None
+        return round((self.started_at - self.enqueued_at) * 1000, 1)
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether ``InferenceExecutor.cancel`` was called for this job."""
+        return self.cancel_event.is_set()
+
+    async def result(self) -> Any:
+        """Awaits the outcome; raises GenerationCancelledError if the job was cancelled before it ran."""
+        try:
+            return await asyncio.wrap_future(self.future)
+        except asyncio.CancelledError:
+            if self.future.cancelled():
+                raise GenerationCancelledError("Generation was cancelled before it started.")
+            raise
+
+
+class _StreamEnd:
+    """Marks the end of a stream, carrying the error that ended it (if any)."""
+
+    def __init__(self, error: Optional[BaseException] = None):
+        self.error = error
+
+
+class InferenceStream:
+    """Async iterator over the items of a streamed job (see InferenceExecutor.stream)."""
+
+    def __init__(self, job: InferenceJob, queue: asyncio.Queue):
+        self.job = job
+        self._queue = queue
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[Any]:
+        while True:
+            item = await self._queue.get()
+            if isinstance(item, _StreamEnd):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+
+
+class InferenceExecutor:
+    """Dedicated worker threads for model calls, with admission control, awaited from async routes.
+
+    Generation used to run on Starlette's shared threadpool, so a burst of
+    chat requests could occupy every thread and leave health checks and
+    status requests queued behind them. Here at most ``workers``
+    generations run at once (one for direct ``model.generate``, or the
+    scheduler's batch size when continuous batching is on) and the rest
+    wait in a bounded queue:
+
+    - Admission: once ``max_queue_depth`` calls are waiting, ``submit``
+      raises QueueFullError with a Retry-After estimate instead of queueing
+      without limit (None means unbounded).
+    - Fairness: each client has its own FIFO and free workers take from the
+      clients in turn, so one client's burst cannot starve the others.
+    - Cancellation: a job submitted with a ``request_id`` can be cancelled
+      by that id; a queued job is dropped and a running one has its
+      ``cancel_event`` set, which the generation checks every step.
+    """
+
+    def __init__(self, workers: int = 1, max_queue_depth: Optional[int] = None):
+        self.workers = workers
+        self.max_queue_depth = max_queue_depth
+        self._queues: "OrderedDict[str, Deque[InferenceJob]]" = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        self._jobs: Dict[str, InferenceJob] = {}
+        self._closed = False
+        self._cond = threading.Condition()
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self._avg_service_seconds: Optional[float] = None
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"inference-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up, from the average generation time."""
+        per_job = self._avg_service_seconds or 1.0
+        return max(1, math.ceil(per_job * max(1, self._queued) / self.workers))
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        client_id: str = DEFAULT_CLIENT,
+        request_id: Optional[str] = None,
+        cancel_event: Optional[threading.Event] = None,
+        **kwargs,
+    ) -> InferenceJob:
+        """Admits a call to run on a worker, or raises QueueFullError.
+
+        A ``cancel_event`` is also passed on to ``fn`` so it can stop early
+        once ``cancel(request_id)`` sets it. Raises ValueError if
+        ``request_id`` belongs to a job that has not finished yet.
+        """
+        if cancel_event is not None:
+            kwargs["cancel_event"] = cancel_event
+        return self._admit(InferenceJob(fn, args, kwargs, client_id, request_id, cancel_event))
+
+    def _admit(self, job: InferenceJob) -> InferenceJob:
+        request_id = job.request_id
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Inference executor is shut down.")
+            if request_id is not None and request_id in self._jobs:
+                raise ValueError(f"A generation with request id '{request_id}' is already in progress.")
+            if self.max_queue_depth is not None and self._queued >= self.max_queue_depth:
+                self.rejected += 1
+                raise QueueFullError(self._queued, self._retry_after())
+            if request_id is not None:
+                self._jobs[request_id] = job
+            self._queues.setdefault(job.client_id, deque()).append(job)
+            self._queued += 1
+            self._cond.notify()
+        return job
+
+    def _next_job(self) -> Optional[InferenceJob]:
+        """Takes the oldest job of the next client in turn (called with the lock held)."""
+        client_id, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        del self._queues[client_id]
+        if queue:
+            self._queues[client_id] = queue # Back of the rotation
+        self._queued -= 1
+        return job
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queues and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                job = self._next_job()
+                self._running += 1
+            job.started_at = time.perf_counter()
+            QUEUE_WAIT_SECONDS.observe(job.started_at - job.enqueued_at)
+            result, error = None, None
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    result = job.fn(*job.args, **job.kwargs)
+                except BaseException as e:
+                    error = e
+            service_seconds = time.perf_counter() - job.started_at
+            with self._cond:
+                # Forget the id before publishing the outcome, so a late cancel cannot flag a finished job
+                if job.request_id is not None:
+                    self._jobs.pop(job.request_id, None)
+                self._running -= 1
+                self.completed += 1
+                previous = self._avg_service_seconds
+                self._avg_service_seconds = service_seconds if previous is None else 0.8 * previous + 0.2 * service_seconds
+            if job.future.running():
+                if error is None:
+                    job.future.set_result(result)
+                else:
+                    job.future.set_exception(error)
+
+    def cancel(self, request_id: str) -> bool:
+        """Cancels the job submitted under ``request_id``; False if there is none (unknown or finished).
+
+        A queued job is removed from the queue and never runs. A running
+        job gets its ``cancel_event`` set and finishes early with whatever
+        it has produced so far.
+        """
+        with self._cond:
+            job = self._jobs.get(request_id)
+            if job is None:
+                return False
+            job.cancel_event.set()
+            queue = self._queues.get(job.client_id)
+            if queue is not None and job in queue:
+                queue.remove(job)
+                if not queue:
+                    del self._queues[job.client_id]
+                self._queued -= 1
+                del self._jobs[request_id]
+            self.cancelled += 1
+        job.future.cancel() # No effect once running; callbacks run outside the lock
+        return True
+
+    async def run(self, fn: Callable[..., Any], *args, client_id: str = DEFAULT_CLIENT, **kwargs) -> Any:
+        """Runs ``fn`` on an inference worker and returns (or raises) its result."""
+        return await self.submit(fn, *args, client_id=client_id, **kwargs).result()
+
+    def stream(
+        self,
+        fn: Callable[..., Iterator[Any]],
+        *args,
+        client_id: str = DEFAULT_CLIENT,
+        request_id: Optional[str] = None,
+        cancel_event: Optional[threading.Event] = None,
+        **kwargs,
+    ) -> InferenceStream:
+        """Admits a generator to be drained on a worker; iterate the result to receive its items.
+
+        Admission happens immediately (so QueueFullError is raised before a
+        response has started). Items are handed to the event loop as they
+        are produced; an error raised by the generator is re-raised after
+        the items before it. ``request_id`` and ``cancel_event`` work as in
+        ``submit``; a stream cancelled before it started raises
+        GenerationCancelledError.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def put(item) -> None:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass # Event loop already closed (shutdown); nobody is listening
+
+        def produce() -> None:
+            try:
+                for item in fn(*args, **kwargs):
+                    put(item)
+            except BaseException as e:
+                put(_StreamEnd(e))
+            else:
+                put(_StreamEnd())
+
+        if cancel_event is not None:
+            kwargs["cancel_event"] = cancel_event
+        job = self._admit(InferenceJob(produce, (), {}, client_id, request_id, cancel_event))
+        # A job cancelled before it started never produces; end the stream instead of hanging
+        job.future.add_done_callback(
+            lambda future: put(_StreamEnd(GenerationCancelledError("Generation was cancelled before it started.")))
+            if future.cancelled() else None
+        )
+        return InferenceStream(job, queue)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "max_queue_depth": self.max_queue_depth,
+                "clients_waiting": len(self._queues),
+                "avg_generation_ms": round(self._avg_service_seconds * 1000, 1) if self._avg_service_seconds else None,
+            }
+
+    def shutdown(self) -> None:
+        """Stops the workers and cancels calls that have not started."""
+        with self._cond:
+            self._closed = True
+            for queue in self._queues.values():
+                for job in queue:
+                    job.future.cancel()
+            self._queues.clear()
+            self._jobs.clear()
+            self._queued = 0
+            self._cond.notify_all()
@@ -0,0 +1,183 @@
+import copy
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+
+import torch
+from transformers import DynamicCache
+
+from .prompt_builder import render_system_prefix
+
+
+def cache_nbytes(cache: DynamicCache) -> int:
+    """Returns the memory held by the key/value tensors of a cache."""
+    return sum(t.numel() * t.element_size() for t in cache.key_cache + cache.value_cache)
+
+
+def common_prefix_length(a: List[int], b: List[int]) -> int:
+    """Returns the number of leading token ids shared by ``a`` and ``b``."""
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+class ThreadKVCacheStore:
+    """Keeps the KV cache of the last turn of each chat thread for reuse on the next turn.
+
+    Entries are the token ids a cache covers plus the cache itself. A
+    generation ``take``s the entry for its thread (so no other request can
+    mutate it concurrently), crops it to the prefix it shares with the new
+    prompt, and ``put``s the extended cache back when it finishes. The store
+    is bounded by ``max_bytes`` and evicts least-recently-used threads first.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[List[int], DynamicCache, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def take(self, key: Hashable, input_ids: List[int]) -> Tuple[Optional[DynamicCache], int]:
+        """Removes the entry for ``key`` and returns it cropped to the prefix shared with ``input_ids``.
+
+        Returns ``(cache, reused_tokens)``; ``(None, 0)`` on a miss. At least
+        one prompt token is always left uncached so generation has an input.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._total_bytes -= entry[2]
+        if entry is None:
+            self.misses += 1
+            return None, 0
+
+        token_ids, cache, _ = entry
+        reused = min(common_prefix_length(token_ids, input_ids), len(input_ids) - 1)
+        if reused <= 0:
+            self.misses += 1
+            return None, 0
+        cache.crop(reused)
+        self.hits += 1
+        return cache, reused
+
+    def put(self, key: Hashable, token_ids: List[int], cache: DynamicCache) -> None:
+        """Stores the cache covering ``token_ids`` for ``key``, evicting old threads as needed."""
+        if not self.enabled:
+            return
+        nbytes = cache_nbytes(cache)
+        if nbytes > self.max_bytes:
+            return  # Larger than the whole budget; not worth keeping
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous[2]
+            self._entries[key] = (list(token_ids), cache, nbytes)
+            self._total_bytes += nbytes
+            while self._total_bytes > self.max_bytes:
+                _, (_, _, evicted_bytes) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_bytes
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._total_bytes -= entry[2]
+
+    def discard_matching(self, predicate) -> None:
+        """Drops every entry whose key satisfies ``predicate`` (e.g. all threads of one model)."""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self._total_bytes -= self._entries.pop(key)[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class SystemPromptCache:
+    """Pins the KV state of the rendered system prompt shared by every request.
+
+    ``refresh`` prefills the system prompt prefix once for the current model;
+    ``seed`` hands each generation its own copy, cropped to the tokens the
+    prompt actually shares with the prefix. The pinned state is rebuilt when
+    the system prompt or model changes and dropped by ``invalidate``.
+    """
+
+    def __init__(self):
+        self._key = None
+        self._token_ids: List[int] = []
+        self._cache: Optional[DynamicCache] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._key = None
+            self._token_ids = []
+            self._cache = None
+
+    def refresh(self, model, tokenizer, system_prompt: str) -> None:
+        """Precomputes the prefix cache for ``system_prompt`` if it is not already pinned."""
+        key = (id(model), id(tokenizer), system_prompt)
+        if self._key == key:
+            return
+        if model.device.type == "mps":
+            return  # Generation runs on CPU for MPS models; a pinned MPS cache would not match
+
+        prefix = render_system_prefix(system_prompt, tokenizer)
+        token_ids = tokenizer(prefix)["input_ids"]
+        if not token_ids:
+            return
+        cache = DynamicCache()
+        with torch.no_grad():
+            model(
+                input_ids=torch.tensor([token_ids], device=model.device),
+                past_key_values=cache,
+                use_cache=True,
+            )
+        with self._lock:
+            self._key = key
+            self._token_ids = token_ids
+            self._cache = cache
+        print(f"   📌 Pinned system prompt prefix cache ({len(token_ids)} tokens).")
+
+    def seed(
+        self, model, tokenizer, system_prompt: str, input_ids: List[int], min_tokens: int = 0
+    ) -> Tuple[Optional[DynamicCache], int]:
+        """Returns ``(cache, reused_tokens)`` to start generating ``input_ids`` from, or ``(None, 0)``.
+
+        Nothing is copied unless the prefix covers more than ``min_tokens``.
+        """
+        self.refresh(model, tokenizer, system_prompt)
+        with self._lock:
+            if self._cache is None or self._key != (id(model), id(tokenizer), system_prompt):
+                return None, 0
+            reused = min(common_prefix_length(self._token_ids, input_ids), len(input_ids) - 1)
+            if reused <= max(min_tokens, 0):
+                return None, 0
+            pinned = self._cache
+        # generate extends the cache in place, so every request gets its own copy
+        cache = copy.deepcopy(pinned)
+        if reused < cache.get_seq_length():
+            cache.crop(reused)
+        self.hits += 1
+        return cache, reused
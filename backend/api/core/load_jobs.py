@@ -0,0 +1,147 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import torch
+
+from .model_manager import list_weight_files
+
+# Finished jobs kept around so clients can still poll their final status
+MAX_FINISHED_JOBS = 50
+
+
+def _resident_bytes(device_kind: str) -> int:
+    """Memory currently held on the device the model is being loaded to."""
+    if device_kind == "cuda" and torch.cuda.is_available():
+        return sum(torch.cuda.memory_allocated(i) for i in range(torch.cuda.device_count()))
+    try:
+        import psutil
+    except ImportError:
+        return 0
+    return psutil.Process().memory_info().rss
+
+
+class LoadJob:
+    """A model load running in the background.
+
+    ``from_pretrained`` offers no progress callback, so progress is estimated
+    from how much device memory (VRAM, or process RSS on CPU) has grown since
+    the weights started loading, relative to the checkpoint size on disk.
+    """
+
+    def __init__(self, model_name: str, model_dir: str):
+        self.id = uuid.uuid4().hex
+        self.model_name = model_name
+        self.model_dir = model_dir
+        self.status = "queued"  # queued -> loading -> ready | failed
+        self.error: Optional[str] = None
+        self.device: Optional[str] = None
+        shards = list_weight_files(model_dir)
+        self.shards_total = len(shards)
+        self.bytes_total = sum(os.path.getsize(p) for p in shards)
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._device_kind = "cuda" if torch.cuda.is_available() else "cpu"
+        self._baseline_bytes = 0
+
+    def track(self, loader: Callable):
+        """Wraps ``loader`` so the memory baseline is taken right before the weights load."""
+        def tracked():
+            self._baseline_bytes = _resident_bytes(self._device_kind)
+            self.started_at = time.time()
+            self.status = "loading"
+            return loader()
+        return tracked
+
+    def _fraction(self) -> float:
+        if self.status == "ready":
+            return 1.0
+        if self.status != "loading" or self.bytes_total <= 0:
+            return 0.0
+        grown = _resident_bytes(self._device_kind) - self._baseline_bytes
+        # Never report completion before the load has actually returned
+        return max(0.0, min(grown / self.bytes_total, 0.99))
+
+    def describe(self) -> Dict[str, object]:
+        fraction = self._fraction()
+        now = self.finished_at or time.time()
+        elapsed = (now - self.started_at) if self.started_at else 0.0
+        eta = None
+        if self.status == "loading" and fraction > 0:
+            eta = round(elapsed * (1 - fraction) / fraction, 1)
+        elif self.status == "ready":
+            eta = 0.0
+        return {
+            "job_id": self.id,
+            "model_name": self.model_name,
+            "status": self.status,
+            "progress": round(fraction, 3),
+            "bytes_loaded": int(self.bytes_total * fraction),
+            "bytes_total": self.bytes_total,
+            "shards_loaded": int(self.shards_total * fraction),
+            "shards_total": self.shards_total,
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": eta,
+            "device": self.device,
+            "error": self.error,
+        }
+
+
+class ModelLoadJobs:
+    """Runs model loads one at a time on a background thread.
+
+    Requests keep being served by the current model while a load runs; the
+    ``install`` callable passed to ``submit`` decides when the new model
+    takes over. Submitting a model that is already queued or loading returns
+    the existing job instead of loading it twice.
+    """
+
+    def __init__(self):
+        # One worker: concurrent loads would compete for the same memory budget
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+        self._jobs: "OrderedDict[str, LoadJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[LoadJob]:
+        return self._jobs.get(job_id)
+
+    def submit(self, model_name: str, model_dir: str, install: Callable[[LoadJob], object]) -> LoadJob:
+        """Queues ``install(job)``, which must load the model and return its ``LoadedModel``."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.model_name == model_name and job.status in ("queued", "loading"):
+                    return job
+            job = LoadJob(model_name, model_dir)
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, install)
+        print(f"📥 Queued background load of '{model_name}' (job {job.id}).")
+        return job
+
+    def _run(self, job: LoadJob, install: Callable[[LoadJob], object]) -> None:
+        try:
+            entry = install(job)
+        except Exception as e:
+            job.finished_at = time.time()
+            job.error = str(e)
+            job.status = "failed"
+            print(f"❌ Background load of '{job.model_name}' failed: {e}", file=sys.stderr)
+            return
+        job.finished_at = time.time()
+        job.device = getattr(entry, "device", None)
+        job.status = "ready"
+        print(f"✅ Background load of '{job.model_name}' finished (job {job.id}).")
+
+    def _prune(self) -> None:
+        finished = [j.id for j in self._jobs.values() if j.status in ("ready", "failed")]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,123 @@
+import time
+from typing import Any, Dict, Optional
+
+import torch
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from transformers import StoppingCriteria
+
+from .gpu_check import cuda_memory_bytes
+
+# Prometheus metrics for the inference and API hot paths, scraped from /metrics.
+# They live in the default registry alongside the process_* collectors.
+
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STEP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.2, 0.5, 1)
+
+PROMPT_TOKENS = Histogram("sigil_prompt_tokens", "Prompt length of each generation, in tokens.", buckets=TOKEN_BUCKETS)
+GENERATED_TOKENS = Histogram("sigil_generated_tokens", "Tokens produced by each generation.", buckets=TOKEN_BUCKETS)
+PREFILL_SECONDS = Histogram(
+    "sigil_prefill_seconds", "Time from the start of a generation to its first token (prompt prefill).",
+    buckets=LATENCY_BUCKETS,
+)
+DECODE_TOKEN_SECONDS = Histogram(
+    "sigil_decode_token_seconds", "Time between consecutive generated tokens.", buckets=STEP_BUCKETS,
+)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "sigil_time_to_first_token_seconds", "Time from a streaming request arriving to its first token event.",
+    buckets=LATENCY_BUCKETS,
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "sigil_queue_wait_seconds", "Time a generation waited for an inference worker.", buckets=LATENCY_BUCKETS,
+)
+HISTORY_SAVE_SECONDS = Histogram(
+    "sigil_history_save_seconds", "Time to write one chat session's new messages to the history backend.",
+    buckets=LATENCY_BUCKETS,
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "sigil_model_load_seconds", "Time to load a model and its tokenizer.",
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600),
+)
+
+VRAM_TOTAL_BYTES = Gauge("sigil_vram_total_bytes", "Total memory of CUDA device 0.")
+VRAM_RESERVED_BYTES = Gauge("sigil_vram_reserved_bytes", "Memory reserved by the PyTorch caching allocator on CUDA device 0.")
+VRAM_ALLOCATED_BYTES = Gauge("sigil_vram_allocated_bytes", "Memory allocated to tensors on CUDA device 0.")
+INFERENCE_QUEUED = Gauge("sigil_inference_queued", "Generations waiting for an inference worker.")
+INFERENCE_RUNNING = Gauge("sigil_inference_running", "Generations currently running.")
+HISTORY_PENDING_MESSAGES = Gauge("sigil_history_pending_messages", "Chat messages queued for the write-behind worker.")
+
+SPECULATIVE_DRAFTED_TOKENS = Counter(
+    "sigil_speculative_drafted_tokens", "Tokens proposed by draft models in speculative decoding.",
+)
+SPECULATIVE_ACCEPTED_TOKENS = Counter(
+    "sigil_speculative_accepted_tokens", "Draft tokens the target model accepted in speculative decoding.",
+)
+
+
+class StepTimer(StoppingCriteria):
+    """Never stops generation; times the steps it is called after.
+
+    Stopping criteria run once per generated token, both in
+    ``model.generate`` and in the batching scheduler, which makes them a
+    hook into the decode loop: the first call ends the prefill and every
+    later one ends a decode step. The timings of the generation are kept
+    on the instance as well (``first_token_at``, ``last_step_at``, ``steps``,
+    and ``tokens`` once build_stopping_criteria has set ``prompt_length``).
+
+    In assisted decoding (``assisted``) generate also calls the criteria on
+    the draft model's candidates before the target verifies them. Those
+    calls only add to ``drafted_tokens``; each verification ends a step
+    that may have produced several tokens.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_step_at: Optional[float] = None
+        self.steps = 0
+        self.tokens = 0
+        self.drafted_tokens = 0
+        self.prompt_length: Optional[int] = None
+        self.assisted = False
+        self._checking_candidates = False
+
+    def __call__(self, input_ids: torch.LongTensor, scores: Optional[torch.FloatTensor], **kwargs) -> torch.BoolTensor:
+        keep_going = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        tokens = input_ids.shape[1] - self.prompt_length if self.prompt_length is not None else self.steps + 1
+        if self.assisted:
+            self._checking_candidates = not self._checking_candidates
+            if self._checking_candidates:
+                self.drafted_tokens += max(tokens - self.tokens, 0)
+                return keep_going
+        now = time.perf_counter()
+        if self.last_step_at is None:
+            self.first_token_at = now
+            PREFILL_SECONDS.observe(now - self.started_at)
+        else:
+            new_tokens = max(tokens - self.tokens, 1)
+            for _ in range(new_tokens):
+                DECODE_TOKEN_SECONDS.observe((now - self.last_step_at) / new_tokens)
+        self.last_step_at = now
+        self.steps += 1
+        self.tokens = tokens
+        return keep_going
+
+
+def observe_generation(prompt_tokens: int, generated_tokens: int) -> None:
+    PROMPT_TOKENS.observe(prompt_tokens)
+    GENERATED_TOKENS.observe(generated_tokens)
+
+
+def render(inference_stats: Optional[Dict[str, Any]] = None, history_stats: Optional[Dict[str, Any]] = None):
+    """Refreshes the point-in-time gauges and returns the exposition text and its content type."""
+    memory = cuda_memory_bytes()
+    if memory is not None:
+        VRAM_TOTAL_BYTES.set(memory["total"])
+        VRAM_RESERVED_BYTES.set(memory["reserved"])
+        VRAM_ALLOCATED_BYTES.set(memory["allocated"])
+    if inference_stats:
+        INFERENCE_QUEUED.set(inference_stats["queued"])
+        INFERENCE_RUNNING.set(inference_stats["running"])
+    if history_stats:
+        HISTORY_PENDING_MESSAGES.set(history_stats.get("pending_messages", 0))
+    return generate_latest(), CONTENT_TYPE_LATEST
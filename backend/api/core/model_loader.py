@@ -1,9 +1,12 @@
 import os
 import sys
+import time
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import json
 from .config import settings
+from .quantization import apply_post_load_quantization, precision_load_kwargs, precision_unavailable_reason
+from .metrics import MODEL_LOAD_SECONDS
 
 # --- Model Registry (REMOVED) ---
 # MODEL_REGISTRY = {
@@ -11,13 +14,38 @@ from .config import settings
 #     "tinyllama": "backend/models/tinyllama",
 # }
 
+# --- Path Resolution Helper ---
+def resolve_model_path(path: str) -> str:
+    """Resolves a model path the same way load_model_internal does (relative to the project root)."""
+    # Calculate project root relative to this file's location (backend/api/core)
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+    return os.path.join(project_root, path)
+
+# --- Per-Model Stop Sequences ---
+def _load_stop_sequences(model_dir: str) -> list:
+    """Reads the optional ``stop_sequences`` list from a model's prompt_config.json.
+
+    This applies whether or not the tokenizer has a chat template, so models
+    that tend to run on into the next turn can list what that looks like.
+    """
+    cfg_path = os.path.join(model_dir, "prompt_config.json")
+    if not os.path.isfile(cfg_path):
+        return []
+    try:
+        with open(cfg_path, "r", encoding="utf-8") as cfg_file:
+            stops = json.load(cfg_file).get("stop_sequences", [])
+    except Exception as cfg_err:
+        print(f"   ⚠️ Failed to read stop_sequences from prompt_config.json: {cfg_err}")
+        return []
+    if stops:
+        print(f"   ✅ Loaded {len(stops)} stop sequence(s) from prompt_config.json.")
+    return [s for s in stops if isinstance(s, str) and s]
+
 # --- Model Loading Helper ---
 def load_model_internal(path: str):
     """Loads the tokenizer and model from the specified path, resolving relative paths from the project root."""
 
-    # Calculate project root relative to this file's location (backend/api/core)
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
-    absolute_path = os.path.join(project_root, path)
+    absolute_path = resolve_model_path(path)
 
     # Check if the resolved absolute path is a directory
     if not os.path.isdir(absolute_path):
@@ -26,6 +54,7 @@ def load_model_internal(path: str):
         raise ValueError(f"Invalid directory path provided or not found: '{path}' (resolved to '{absolute_path}')")
 
     print(f"⏳ Attempting to load model from '{absolute_path}' with accelerate...")
+    load_started = time.perf_counter()
     try:
         # Trust remote code can be necessary for some models, consider security implications
         # For now, keeping it False as in the original code.
@@ -67,10 +96,20 @@ def load_model_internal(path: str):
         # Attach prompt metadata to tokenizer so routes can store in app.state
         tokenizer.prompt_mode = prompt_mode  # e.g. template / custom / fallback
         tokenizer.custom_prompt_config = custom_prompt_config
+        tokenizer.stop_sequences = _load_stop_sequences(absolute_path)  # Halt generation on these as well
         # -------------------------------------------------------------
 
+        precision_setting = settings.model_precision
+        unavailable = precision_unavailable_reason(precision_setting)
+        if unavailable:
+            raise RuntimeError(unavailable)
+
         # Determine the desired device mapping strategy
-        if torch.cuda.is_available():
+        if precision_setting == "int8_dynamic":
+            # Dynamic quantization only has CPU kernels
+            chosen_device_map = "cpu"
+            print("   Precision int8_dynamic runs on CPU. Loading model with device_map='cpu'...")
+        elif torch.cuda.is_available():
             chosen_device_map = "auto"  # Let accelerate place layers on CUDA devices
             print("   Detected CUDA. Loading model with device_map='auto' (CUDA)...")
         else:
@@ -79,13 +118,8 @@ def load_model_internal(path: str):
             print("   CUDA not available. Loading model with device_map='cpu' (force CPU)...")
 
         # ---> ADDED: Get precision setting <---
-        precision_setting = settings.model_precision
-        if precision_setting == "fp16":
-            torch_dtype = torch.float16
-            print(f"   Applying precision: {precision_setting} (torch.float16)")
-        else: # Default to fp32
-            torch_dtype = torch.float32
-            print(f"   Applying precision: fp32 (torch.float32)")
+        load_kwargs = precision_load_kwargs(precision_setting)
+        print(f"   Applying precision: {precision_setting} ({load_kwargs['torch_dtype']})")
         # ---> END ADDED <---
 
         # Load model with the chosen device_map and precision
@@ -94,9 +128,11 @@ def load_model_internal(path: str):
             local_files_only=True,
             trust_remote_code=False,
             device_map=chosen_device_map,
-            torch_dtype=torch_dtype # <-- Pass the determined dtype
+            **load_kwargs # <-- dtype and, for int8/int4, the bitsandbytes config
         )
         model.eval()
+        model = apply_post_load_quantization(model, precision_setting)
+        model.precision_mode = precision_setting  # Reported by the memory footprint endpoint
         
         # Determine the primary device after accelerate placement
         # If any part is on CUDA, consider 'cuda' the primary device for reporting.
@@ -113,6 +149,7 @@ def load_model_internal(path: str):
 
         # The explicit model.to(device) calls are no longer needed as accelerate handles placement.
 
+        MODEL_LOAD_SECONDS.observe(time.perf_counter() - load_started)
         return tokenizer, model, device
 
     except Exception as e:
@@ -0,0 +1,270 @@
+import gc
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+
+from .kv_cache import SystemPromptCache
+from .prompt_cache import forget_tokenizer
+from .quantization import dynamic_quantized_bytes
+from .scheduler import InferenceScheduler
+from .speculative import DraftModel
+
+# Weight file extensions counted when estimating a checkpoint's size before loading
+WEIGHT_FILE_EXTENSIONS = (".safetensors", ".bin", ".pt", ".pth")
+
+
+def list_weight_files(model_dir: str) -> List[str]:
+    """Returns the weight shards in a model directory."""
+    shards = []
+    if not os.path.isdir(model_dir):
+        return shards
+    for root, _, files in os.walk(model_dir):
+        for filename in files:
+            if filename.endswith(WEIGHT_FILE_EXTENSIONS):
+                shards.append(os.path.join(root, filename))
+    return shards
+
+
+def estimate_checkpoint_bytes(model_dir: str) -> int:
+    """Returns the total size of the weight files in a model directory."""
+    return sum(os.path.getsize(p) for p in list_weight_files(model_dir))
+
+
+def estimate_model_memory(model) -> int:
+    """Returns the memory taken by a loaded model's parameters, buffers and quantized weights."""
+    try:
+        footprint = int(model.get_memory_footprint())
+    except Exception:
+        tensors = list(model.parameters()) + list(model.buffers())
+        footprint = sum(t.numel() * t.element_size() for t in tensors)
+    # Dynamically quantized Linear layers keep their weights outside parameters()
+    return footprint + dynamic_quantized_bytes(model)
+
+
+def default_memory_budget(device_kind: str) -> Optional[int]:
+    """Budget used when none is configured: 90% of GPU memory or 80% of system RAM."""
+    if device_kind == "cuda":
+        if not torch.cuda.is_available():
+            return None
+        return int(torch.cuda.get_device_properties(0).total_memory * 0.9)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return int(psutil.virtual_memory().total * 0.8)
+
+
+class LoadedModel:
+    """A resident model together with the per-model state used to serve it."""
+
+    def __init__(self, name: str, path: str, tokenizer, model, device: str):
+        self.name = name
+        self.path = path
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = device
+        self.precision = getattr(model, "precision_mode", None)
+        self.memory_bytes = estimate_model_memory(model)
+        self.prefix_cache = SystemPromptCache()
+        self.scheduler: Optional[InferenceScheduler] = None
+        self.draft: Optional[DraftModel] = None
+        self.compiled = False
+        self.warmup_status = "disabled"  # disabled | warming | warm | failed
+        self.warmup_seconds: Optional[float] = None
+        self.warmup_error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        """True once the model can take traffic without a cold-start latency spike."""
+        return self.warmup_status in ("disabled", "warm")
+
+    def attach_draft(self, draft: DraftModel) -> None:
+        """Pairs the model with a draft model for speculative decoding; its memory is charged here too."""
+        self.draft = draft
+        self.memory_bytes += estimate_model_memory(draft.model)
+
+    @property
+    def device_kind(self) -> str:
+        return "cuda" if self.device == "cuda" else "cpu"
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "path": self.path,
+            "device": self.device,
+            "precision": self.precision,
+            "compiled": self.compiled,
+            "warmup_status": self.warmup_status,
+            "memory_gb": round(self.memory_bytes / 1024**3, 3),
+            "draft_model": self.draft.name if self.draft else None,
+            "speculative": self.draft.stats.describe() if self.draft else None,
+        }
+
+
+class ModelManager:
+    """Holds several loaded models keyed by name with LRU residency.
+
+    Models are charged against a RAM or VRAM budget depending on where they
+    were placed. Before a new model is loaded, ``make_room`` evicts the
+    least-recently-used models until its estimated size fits, and
+    ``enforce_budget`` corrects for the measured size afterwards; evicted models
+    are freed deterministically (scheduler stopped, references dropped,
+    garbage collected and the CUDA cache emptied). ``on_evict`` is called
+    with the name of every model that is removed so callers can drop any
+    state keyed by it.
+    """
+
+    def __init__(
+        self,
+        ram_budget_bytes: Optional[int] = None,
+        vram_budget_bytes: Optional[int] = None,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        self.budgets = {
+            "cpu": ram_budget_bytes if ram_budget_bytes else default_memory_budget("cpu"),
+            "cuda": vram_budget_bytes if vram_budget_bytes else default_memory_budget("cuda"),
+        }
+        self.on_evict = on_evict
+        self.active_name: Optional[str] = None
+        self._models: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+    def get(self, name: str) -> Optional[LoadedModel]:
+        """Returns a resident model and marks it as most recently used."""
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                self._models.move_to_end(name)
+            return entry
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._models
+
+    @property
+    def active(self) -> Optional[LoadedModel]:
+        return self._models.get(self.active_name) if self.active_name else None
+
+    def entries(self) -> List[LoadedModel]:
+        """Returns resident models, most recently used first, without touching their LRU order."""
+        with self._lock:
+            return list(reversed(self._models.values()))
+
+    def loaded(self) -> List[Dict[str, object]]:
+        """Describes resident models, most recently used first."""
+        with self._lock:
+            return [
+                dict(entry.describe(), active=(name == self.active_name))
+                for name, entry in reversed(self._models.items())
+            ]
+
+    def used_bytes(self, device_kind: str) -> int:
+        return sum(e.memory_bytes for e in self._models.values() if e.device_kind == device_kind)
+
+    # ------------------------------------------------------------------
+    # Residency
+    # ------------------------------------------------------------------
+    def make_room(self, incoming_bytes: int, device_kind: str, keep: Tuple[str, ...] = ()) -> List[str]:
+        """Evicts least-recently-used models until ``incoming_bytes`` fits the device budget.
+
+        Models named in ``keep`` are never evicted (e.g. the model still
+        serving traffic while its replacement loads in the background).
+        """
+        evicted = []
+        budget = self.budgets.get(device_kind)
+        if budget is None:
+            return evicted
+        with self._lock:
+            for name in list(self._models.keys()):
+                if self.used_bytes(device_kind) + incoming_bytes <= budget:
+                    break
+                if self._models[name].device_kind != device_kind or name in keep:
+                    continue
+                print(f"♻️ Evicting model '{name}' to stay within the {device_kind.upper()} budget.")
+                self.remove(name)
+                evicted.append(name)
+        if self.used_bytes(device_kind) + incoming_bytes > budget:
+            print(
+                f"⚠️ Model of ~{incoming_bytes / 1024**3:.2f} GB may not fit the "
+                f"{budget / 1024**3:.2f} GB {device_kind.upper()} budget.",
+                file=sys.stderr,
+            )
+        return evicted
+
+    def add(self, entry: LoadedModel, batching_enabled: bool = False, max_batch_size: int = 8) -> LoadedModel:
+        """Registers a freshly loaded model, replacing any resident model with the same name."""
+        with self._lock:
+            if entry.name in self._models:
+                self.remove(entry.name)
+            if batching_enabled:
+                entry.scheduler = InferenceScheduler(
+                    entry.model, entry.tokenizer, entry.device, max_batch_size=max_batch_size
+                )
+                entry.scheduler.start()
+            self._models[entry.name] = entry
+            return entry
+
+    def activate(self, name: str) -> LoadedModel:
+        """Makes a resident model the default for requests that do not name one."""
+        with self._lock:
+            entry = self.get(name)
+            if entry is None:
+                raise KeyError(name)
+            self.active_name = name
+            return entry
+
+    def remove(self, name: str) -> bool:
+        """Unloads a model and frees its memory. Returns False if it was not resident."""
+        with self._lock:
+            entry = self._models.pop(name, None)
+            if entry is None:
+                return False
+            if self.active_name == name:
+                self.active_name = None
+        # Let callers drop their references first so the memory can actually be reclaimed
+        if self.on_evict is not None:
+            self.on_evict(name)
+        self._free(entry)
+        return True
+
+    def clear(self) -> None:
+        for name in list(self._models.keys()):
+            self.remove(name)
+
+    def enforce_budget(self, device_kind: str, keep: str) -> None:
+        """Evicts least-recently-used models (other than ``keep``) while the device is over budget.
+
+        A model that is over budget on its own still stays resident.
+        """
+        budget = self.budgets.get(device_kind)
+        if budget is None:
+            return
+        for name in list(self._models.keys()):
+            if self.used_bytes(device_kind) <= budget:
+                break
+            if name != keep and self._models[name].device_kind == device_kind:
+                print(f"♻️ Evicting model '{name}' to stay within the {device_kind.upper()} budget.")
+                self.remove(name)
+
+    @staticmethod
+    def _free(entry: LoadedModel) -> None:
+        if entry.scheduler is not None:
+            entry.scheduler.stop()
+            entry.scheduler = None
+        entry.prefix_cache.invalidate()
+        forget_tokenizer(entry.tokenizer)
+        if entry.draft is not None:
+            forget_tokenizer(entry.draft.tokenizer)
+        entry.draft = None
+        entry.model = None
+        entry.tokenizer = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"   ✅ Freed model '{entry.name}'.")
@@ -1,6 +1,31 @@
 from transformers import AutoTokenizer
 from typing import Optional, List, Dict
 
+# --- Helper Function for the Shared System Prompt Prefix ---
+def render_system_prefix(system_prompt: str, tokenizer: AutoTokenizer) -> str:
+    """Renders the leading part of every prompt generate_prompt builds for ``system_prompt``.
+
+    Mirrors the system section of each prompt mode so the prefix KV cache
+    can be computed once and shared by all requests.
+    """
+    prompt_mode = getattr(tokenizer, "prompt_mode", "template")
+    custom_cfg = getattr(tokenizer, "custom_prompt_config", None)
+
+    if prompt_mode == "custom" and custom_cfg is not None:
+        sys_pre = custom_cfg.get("system_prefix", "")
+        sys_suf = custom_cfg.get("system_suffix", "\n")
+        return f"{sys_pre}{system_prompt}{sys_suf}"
+
+    if prompt_mode == "template":
+        return tokenizer.apply_chat_template(
+            [{"role": "system", "content": system_prompt}],
+            tokenize=False,
+            add_generation_prompt=False,
+        )
+
+    # Fallback mode starts with the bare system prompt followed by a blank line
+    return f"{system_prompt}\n\n"
+
 # --- Helper Function for Prompt Generation ---
 def generate_prompt(
     mode: str,
@@ -0,0 +1,297 @@
+import hashlib
+import itertools
+import json
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from .prompt_builder import generate_prompt
+
+# Conversations rendered once per tokenizer to check that its prompts split into per-message segments
+PROBE_CONVERSATIONS = (
+    ("You are terse.", [
+        {"role": "user", "content": "Hi there"},
+        {"role": "assistant", "content": "Hello! How can I help?"},
+        {"role": "user", "content": "Tell me a story."},
+    ]),
+    ("Line one\nline two ", [
+        {"role": "user", "content": " spaced  out "},
+        {"role": "assistant", "content": "ok\n"},
+        {"role": "user", "content": "x"},
+        {"role": "assistant", "content": "y"},
+        {"role": "user", "content": "end"},
+    ]),
+)
+
+
+_tokenizer_ids = itertools.count(1)
+
+
+def tokenizer_key(tokenizer) -> Hashable:
+    """Identifies a tokenizer instance for caches that outlive a single request.
+
+    The key is stored on the tokenizer itself, so unlike ``id()`` it is
+    never reused by a tokenizer loaded after this one is freed.
+    """
+    key = getattr(tokenizer, "_prompt_cache_key", None)
+    if key is None:
+        key = (getattr(tokenizer, "name_or_path", None), next(_tokenizer_ids))
+        try:
+            tokenizer._prompt_cache_key = key
+        except AttributeError:
+            return (key[0], id(tokenizer))
+    return key
+
+
+def prompt_format(tokenizer) -> Hashable:
+    """The prompt settings model_loader attaches to a tokenizer; cached renderings are only valid for these."""
+    custom_cfg = getattr(tokenizer, "custom_prompt_config", None)
+    return (
+        getattr(tokenizer, "prompt_mode", "template"),
+        content_digest(json.dumps(custom_cfg, sort_keys=True, default=str)) if custom_cfg is not None else None,
+    )
+
+
+def content_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def encode(tokenizer, text: str, add_special_tokens: bool = False) -> List[int]:
+    return tokenizer(text, add_special_tokens=add_special_tokens)["input_ids"]
+
+
+def _render(tokenizer, messages: List[Dict[str, str]]) -> str:
+    if not messages:
+        return ""
+    return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=False)
+
+
+def render_segment(tokenizer, role: str, content: str) -> Optional[str]:
+    """The text generate_prompt emits for one message, or None if the prompt format cannot be split per message.
+
+    Chat templates are rendered differentially: the message is appended to a
+    short probe conversation (so templates requiring alternating roles still
+    render) and the text it adds is its segment. A system message always
+    opens the prompt, so its segment includes anything the template puts first.
+    """
+    prompt_mode = getattr(tokenizer, "prompt_mode", "template")
+    custom_cfg = getattr(tokenizer, "custom_prompt_config", None)
+    if prompt_mode == "custom" and custom_cfg is not None:
+        prefix, suffix = {
+            "system": (custom_cfg.get("system_prefix", ""), custom_cfg.get("system_suffix", "\n")),
+            "user": (custom_cfg.get("user_prefix", "User: "), custom_cfg.get("user_suffix", "\n")),
+        }.get(role, (custom_cfg.get("assistant_prefix", "Assistant: "), custom_cfg.get("assistant_suffix", "")))
+        return f"{prefix}{content}{suffix}"
+    if prompt_mode == "fallback":
+        if role == "system":
+            return f"{content}\n\n"
+        return f"{'User' if role == 'user' else 'Assistant'}: {content}\n"
+    if prompt_mode != "template":
+        return None
+
+    probe = {"role": "user", "content": "x"}
+    reply = {"role": "assistant", "content": "x"}
+    context = {"system": [], "user": [probe, reply]}.get(role, [probe])
+    try:
+        before = _render(tokenizer, context)
+        after = _render(tokenizer, context + [{"role": role, "content": content}])
+    except Exception:
+        return None
+    if not after.startswith(before):
+        return None
+    return after[len(before):]
+
+
+class Segment:
+    """A rendered message and its token ids."""
+
+    __slots__ = ("text", "ids")
+
+    def __init__(self, text: str, ids: List[int]):
+        self.text = text
+        self.ids = array("i", ids)
+
+
+class SegmentCache:
+    """Rendered, tokenized message segments keyed by tokenizer and message content.
+
+    Unchanged history is neither re-rendered nor re-tokenized on the next
+    turn; prompts are assembled from the cached segments. Bounded by the
+    total number of cached tokens, least-recently-used segments first out.
+    """
+
+    def __init__(self, max_tokens: int = 2_000_000):
+        self.max_tokens = max_tokens
+        self._entries: "OrderedDict[Hashable, Segment]" = OrderedDict()
+        self._tokens = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Segment]:
+        with self._lock:
+            segment = self._entries.get(key)
+            if segment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return segment
+
+    def put(self, key: Hashable, segment: Segment) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._tokens -= len(previous.ids)
+            self._entries[key] = segment
+            self._tokens += len(segment.ids)
+            while self._tokens > self.max_tokens and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._tokens -= len(evicted.ids)
+
+    def discard_matching(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drops every segment whose key matches; returns how many."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._tokens -= len(self._entries.pop(key).ids)
+            return len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"segments": len(self._entries), "tokens": self._tokens, "hits": self.hits, "misses": self.misses}
+
+
+_segments = SegmentCache()
+
+
+def message_segment(tokenizer, role: str, content: str) -> Optional[Segment]:
+    """Returns the cached segment for a message, rendering and tokenizing it on a miss.
+
+    System segments open the prompt, so they carry the special tokens the
+    tokenizer adds to a whole prompt (e.g. BOS). None if the prompt format
+    cannot be split per message.
+    """
+    key = (tokenizer_key(tokenizer), prompt_format(tokenizer), role, content_digest(content))
+    segment = _segments.get(key)
+    if segment is not None:
+        return segment
+    text = render_segment(tokenizer, role, content)
+    if text is None:
+        return None
+    segment = Segment(text, encode(tokenizer, text, add_special_tokens=(role == "system")))
+    _segments.put(key, segment)
+    return segment
+
+
+def _assemble(
+    tokenizer, system_prompt: str, messages: List[Dict[str, str]], suffix: str, suffix_ids: List[int]
+) -> Optional[Tuple[str, List[int]]]:
+    segments = [message_segment(tokenizer, "system", system_prompt)]
+    segments += [message_segment(tokenizer, m.get("role"), m.get("content") or "") for m in messages]
+    if any(s is None for s in segments):
+        return None
+    ids: List[int] = []
+    for segment in segments:
+        ids.extend(segment.ids)
+    ids.extend(suffix_ids)
+    return "".join(s.text for s in segments) + suffix, ids
+
+
+def _probe_layout(tokenizer) -> Optional[Tuple[str, List[int]]]:
+    """Returns the generation prompt suffix and its ids if assembled prompts match generate_prompt exactly, else None.
+
+    Both the text and the token ids are compared with rendering and
+    tokenizing the whole prompt, for a few probe conversations and an
+    instruction prompt, so formats whose segments interact (position
+    dependent templates, tokenizers that merge across message boundaries)
+    fall back to full rendering.
+    """
+    try:
+        system_prompt, messages = PROBE_CONVERSATIONS[0]
+        full = generate_prompt("chat", system_prompt, tokenizer, messages=[dict(m) for m in messages])
+        body = _assemble(tokenizer, system_prompt, messages, "", [])
+        if body is None or not full.startswith(body[0]):
+            return None
+        suffix = full[len(body[0]):]
+        suffix_ids = encode(tokenizer, suffix)
+        probes = [(full, system_prompt, messages)]
+        for system_prompt, messages in PROBE_CONVERSATIONS[1:]:
+            probes.append((generate_prompt("chat", system_prompt, tokenizer, messages=[dict(m) for m in messages]),
+                           system_prompt, messages))
+        instruction = {"role": "user", "content": "Summarize this."}
+        probes.append((generate_prompt("instruction", "Be brief.", tokenizer, message=instruction["content"]),
+                       "Be brief.", [instruction]))
+        for expected, system_prompt, messages in probes:
+            assembled = _assemble(tokenizer, system_prompt, messages, suffix, suffix_ids)
+            if assembled is None or assembled[0] != expected or assembled[1] != encode(tokenizer, expected, True):
+                return None
+    except Exception:
+        return None
+    return suffix, suffix_ids
+
+
+def _layout(tokenizer) -> Optional[Tuple[str, List[int]]]:
+    """The probed layout, kept on the tokenizer so it is freed with it and re-probed if its prompt settings change."""
+    fmt = prompt_format(tokenizer)
+    cached = getattr(tokenizer, "_prompt_layout", None)
+    if cached is not None and cached[0] == fmt:
+        return cached[1]
+    layout = _probe_layout(tokenizer)
+    try:
+        tokenizer._prompt_layout = (fmt, layout)
+    except AttributeError:
+        pass  # Probed again next time
+    return layout
+
+
+def forget_tokenizer(tokenizer) -> None:
+    """Drops everything cached for a tokenizer (its model is being unloaded)."""
+    key = getattr(tokenizer, "_prompt_cache_key", None)
+    if key is not None:
+        _segments.discard_matching(lambda k: k[0] == key)
+    try:
+        del tokenizer._prompt_layout
+    except AttributeError:
+        pass
+
+
+def assemble_prompt(
+    mode: str,
+    system_prompt: str,
+    tokenizer,
+    message: Optional[str] = None,
+    messages: Optional[List[Dict[str, str]]] = None,
+) -> Optional[Tuple[str, List[int]]]:
+    """Builds the same prompt as generate_prompt together with its input_ids, from cached message segments.
+
+    Returns ``(prompt, input_ids)``, or None when the caller should use
+    generate_prompt and tokenize the prompt instead (the tokenizer's prompt
+    format does not split per message, or the request is unusual).
+    """
+    if mode == "instruction":
+        if not message:
+            return None
+        convo = [{"role": "user", "content": message}]
+    else:
+        if not messages:
+            return None
+        convo = messages
+        if convo[0].get("role") == "system":
+            prompt_mode = getattr(tokenizer, "prompt_mode", "template")
+            if prompt_mode == "fallback":
+                return None
+            if prompt_mode == "custom":
+                system_prompt = convo[0].get("content") or ""  # Custom prompts keep the history's own system message
+            convo = convo[1:]
+        if any(m.get("role") not in ("user", "assistant") for m in convo):
+            return None
+    layout = _layout(tokenizer)
+    if layout is None:
+        return None
+    return _assemble(tokenizer, system_prompt, convo, *layout)
+
+
+def prompt_cache_stats() -> Dict[str, int]:
+    return _segments.stats()
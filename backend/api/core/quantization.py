@@ -0,0 +1,134 @@
+import importlib.util
+from typing import Dict, Optional, Tuple
+
+import torch
+
+# torch dtype used for the weights that are not quantized
+PRECISION_DTYPES = {
+    "fp32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+    "int8_dynamic": torch.float32,  # Linear layers are quantized after loading
+    "int8": torch.float16,
+    "int4": torch.float16,
+}
+
+# Weight-only quantization through bitsandbytes (CUDA only)
+BITSANDBYTES_PRECISIONS = {"int8", "int4"}
+
+
+def precision_unavailable_reason(precision: str) -> Optional[str]:
+    """Returns why ``precision`` cannot be used in this environment, or None if it can."""
+    if precision in BITSANDBYTES_PRECISIONS:
+        if importlib.util.find_spec("bitsandbytes") is None:
+            return f"'{precision}' requires the optional 'bitsandbytes' package."
+        if not torch.cuda.is_available():
+            return f"'{precision}' requires a CUDA device; use 'int8_dynamic' on CPU."
+    if precision == "int8_dynamic" and "fbgemm" not in torch.backends.quantized.supported_engines \
+            and "qnnpack" not in torch.backends.quantized.supported_engines:
+        return "'int8_dynamic' requires a torch build with a quantized CPU engine (fbgemm or qnnpack)."
+    return None
+
+
+def precision_load_kwargs(precision: str) -> Dict[str, object]:
+    """Returns the ``from_pretrained`` keyword arguments for a precision mode."""
+    kwargs: Dict[str, object] = {"torch_dtype": PRECISION_DTYPES.get(precision, torch.float32)}
+    if precision in BITSANDBYTES_PRECISIONS:
+        from transformers import BitsAndBytesConfig
+
+        if precision == "int8":
+            kwargs["quantization_config"] = BitsAndBytesConfig(load_in_8bit=True)
+        else:
+            kwargs["quantization_config"] = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_compute_dtype=torch.float16,
+            )
+    return kwargs
+
+
+def apply_post_load_quantization(model, precision: str):
+    """Applies quantization that happens after loading (dynamic int8 for CPU Linear layers)."""
+    if precision != "int8_dynamic":
+        return model
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _dynamic_quantized_linears(model):
+    return [m for m in model.modules() if isinstance(m, torch.ao.nn.quantized.dynamic.Linear)]
+
+
+def dynamic_quantized_bytes(model) -> int:
+    """Memory held by dynamically quantized Linear weights, which ``parameters()`` does not report."""
+    total = 0
+    for module in _dynamic_quantized_linears(model):
+        weight, bias = module._packed_params._weight_bias()
+        total += weight.numel() * weight.element_size()
+        if bias is not None:
+            total += bias.numel() * bias.element_size()
+    return total
+
+
+def memory_breakdown(model) -> Dict[str, int]:
+    """Returns the bytes a loaded model holds, grouped by tensor dtype."""
+    breakdown: Dict[str, int] = {}
+    seen = set()
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        if id(tensor) in seen:
+            continue
+        seen.add(id(tensor))
+        key = str(tensor.dtype).replace("torch.", "")
+        breakdown[key] = breakdown.get(key, 0) + tensor.numel() * tensor.element_size()
+    packed = dynamic_quantized_bytes(model)
+    if packed:
+        breakdown["qint8"] = breakdown.get("qint8", 0) + packed
+    return breakdown
+
+
+def _weight_counts(model) -> Tuple[int, int, int]:
+    """Returns element counts of (Linear weights, lm_head weights, everything else).
+
+    Linear sizes come from ``in_features``/``out_features`` so the counts are
+    the same whether or not the model has already been quantized. Tied
+    weights are only counted once.
+    """
+    linear = head = other = 0
+    seen = set()
+    for name, module in model.named_modules():
+        is_linear = hasattr(module, "in_features") and hasattr(module, "out_features")
+        weight = getattr(module, "weight", None) if is_linear else None
+        if is_linear:
+            if isinstance(weight, torch.Tensor):
+                if id(weight) in seen:
+                    continue
+                seen.add(id(weight))
+            count = module.in_features * module.out_features
+            if name.rsplit(".", 1)[-1] == "lm_head":
+                head += count
+            else:
+                linear += count
+        for param in module.parameters(recurse=False):
+            if param is weight or id(param) in seen:
+                continue
+            seen.add(id(param))
+            other += param.numel()
+    return linear, head, other
+
+
+def estimate_precision_footprints(model) -> Dict[str, int]:
+    """Estimates the weight memory of ``model`` under each precision mode.
+
+    bitsandbytes keeps ``lm_head`` and non-Linear weights in fp16, while
+    dynamic quantization converts every Linear layer (including ``lm_head``)
+    and leaves the rest in fp32.
+    """
+    linear, head, other = _weight_counts(model)
+    total = linear + head + other
+    return {
+        "fp32": total * 4,
+        "fp16": total * 2,
+        "bf16": total * 2,
+        "int8_dynamic": (linear + head) + other * 4,
+        "int8": linear + (head + other) * 2,
+        "int4": linear // 2 + (head + other) * 2,
+    }
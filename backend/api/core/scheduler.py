@@ -0,0 +1,351 @@
+import sys
+import threading
+from collections import deque
+from typing import Deque, List, Optional
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, DynamicCache, StoppingCriteriaList
+from transformers.generation.logits_process import (
+    LogitsProcessorList, TemperatureLogitsWarper, TopKLogitsWarper, TopPLogitsWarper
+)
+
+
+class GenerationRequest:
+    """A single generation tracked by the InferenceScheduler.
+
+    Callers receive one from ``InferenceScheduler.submit`` and block on
+    ``result()``. The optional ``streamer`` and ``stopping_criteria`` follow
+    the same contract as the ``model.generate`` arguments of the same name,
+    so TextIteratorStreamer and the usual StoppingCriteria work unchanged.
+    """
+
+    def __init__(
+        self,
+        input_ids: List[int],
+        temperature: float,
+        top_p: float,
+        top_k: int,
+        max_new_tokens: int,
+        do_sample: bool = True,
+        streamer=None,
+        stopping_criteria: Optional[StoppingCriteriaList] = None,
+    ):
+        self.input_ids = list(input_ids)
+        self.generated_ids: List[int] = []
+        self.max_new_tokens = max_new_tokens
+        self.streamer = streamer
+        self.stopping_criteria = stopping_criteria
+        self.error: Optional[Exception] = None
+        self._done = threading.Event()
+
+        self.logits_processor = LogitsProcessorList()
+        self.do_sample = do_sample and temperature > 0
+        if self.do_sample:
+            if temperature != 1.0:
+                self.logits_processor.append(TemperatureLogitsWarper(temperature))
+            if top_k:
+                self.logits_processor.append(TopKLogitsWarper(top_k))
+            if top_p < 1.0:
+                self.logits_processor.append(TopPLogitsWarper(top_p))
+
+    def result(self, timeout: Optional[float] = None) -> List[int]:
+        """Blocks until generation finishes and returns the generated token ids."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("Generation did not finish within the timeout.")
+        if self.error is not None:
+            raise self.error
+        return self.generated_ids
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def _finish(self, error: Optional[Exception] = None) -> None:
+        self.error = error
+        if self.streamer is not None:
+            self.streamer.end()
+        self._done.set()
+
+
+class InferenceScheduler:
+    """Runs queued generation requests as one continuously batched decode loop.
+
+    A single worker thread owns the model. Each iteration it admits waiting
+    requests (up to ``max_batch_size``), prefills them as a left-padded
+    batch and merges their KV cache into the running batch, then runs one
+    decode step for every active request. Requests leave the batch as soon
+    as they hit EOS, their token limit or a stopping criterion, so short
+    answers never wait for long ones.
+    """
+
+    def __init__(
+        self,
+        model: AutoModelForCausalLM,
+        tokenizer: AutoTokenizer,
+        device: str,
+        max_batch_size: int = 8,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        self.eos_token_ids = self._resolve_eos_token_ids()
+
+        self._waiting: Deque[GenerationRequest] = deque()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        # Batched decode state (touched only by the worker thread)
+        self._active: List[GenerationRequest] = []
+        self._cache: Optional[DynamicCache] = None
+        self._attention_mask: Optional[torch.Tensor] = None  # [batch, cached_len]
+        self._next_tokens: Optional[torch.Tensor] = None     # [batch] sampled but not yet fed
+
+    def _resolve_eos_token_ids(self) -> set:
+        eos = getattr(self.model.generation_config, "eos_token_id", None)
+        if eos is None:
+            eos = self.tokenizer.eos_token_id
+        if eos is None:
+            return set()
+        return set(eos) if isinstance(eos, (list, tuple)) else {eos}
+
+    @property
+    def _input_device(self) -> torch.device:
+        return self.model.device
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="inference-scheduler", daemon=True)
+        self._thread.start()
+        print(f"✅ Inference scheduler started (max batch size {self.max_batch_size}).")
+
+    def stop(self) -> None:
+        """Stops the worker thread, failing any requests that are still pending."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        shutdown_error = RuntimeError("Inference scheduler was stopped.")
+        for req in list(self._waiting) + self._active:
+            if not req.done:
+                req._finish(shutdown_error)
+        self._waiting.clear()
+        self._reset_batch()
+
+    def submit(
+        self,
+        input_ids: List[int],
+        temperature: float,
+        top_p: float,
+        max_new_tokens: int,
+        top_k: int = 50,
+        do_sample: bool = True,
+        streamer=None,
+        stopping_criteria: Optional[StoppingCriteriaList] = None,
+    ) -> GenerationRequest:
+        """Queues a prompt (as token ids) for generation and returns its handle."""
+        if not self._running:
+            raise RuntimeError("Inference scheduler is not running.")
+        req = GenerationRequest(
+            input_ids, temperature, top_p, top_k, max_new_tokens,
+            do_sample=do_sample, streamer=streamer, stopping_criteria=stopping_criteria,
+        )
+        if req.streamer is not None:
+            # Mirror model.generate, which hands the prompt to the streamer first
+            req.streamer.put(torch.tensor([req.input_ids]))
+        with self._condition:
+            self._waiting.append(req)
+            self._condition.notify()
+        return req
+
+    def stats(self) -> dict:
+        """Returns the current queue and batch sizes."""
+        return {"waiting": len(self._waiting), "active": len(self._active), "max_batch_size": self.max_batch_size}
+
+    # ------------------------------------------------------------------
+    # Worker loop
+    # ------------------------------------------------------------------
+    def _loop(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and not self._waiting and not self._active:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                joining = []
+                while self._waiting and len(self._active) + len(joining) < self.max_batch_size:
+                    joining.append(self._waiting.popleft())
+
+            try:
+                with torch.no_grad():
+                    if joining:
+                        self._prefill(joining)
+                    if self._active:
+                        self._decode_step()
+            except Exception as e:
+                print(f"❌ Error in inference scheduler step: {e}", file=sys.stderr)
+                for req in joining + self._active:
+                    if not req.done:
+                        req._finish(e)
+                self._reset_batch()
+
+    def _reset_batch(self) -> None:
+        self._active = []
+        self._cache = None
+        self._attention_mask = None
+        self._next_tokens = None
+
+    def _prefill(self, joining: List[GenerationRequest]) -> None:
+        """Runs the prompt forward pass for new requests and merges them into the batch."""
+        max_len = max(len(req.input_ids) for req in joining)
+        input_ids = torch.full((len(joining), max_len), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(joining), max_len), dtype=torch.long)
+        for row, req in enumerate(joining):
+            # Left-pad so every prompt ends at the same position
+            input_ids[row, max_len - len(req.input_ids):] = torch.tensor(req.input_ids)
+            attention_mask[row, max_len - len(req.input_ids):] = 1
+        input_ids = input_ids.to(self._input_device)
+        attention_mask = attention_mask.to(self._input_device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        cache = DynamicCache()
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=cache,
+            use_cache=True,
+        )
+        next_tokens = self._sample(joining, outputs.logits[:, -1, :])
+        self._merge(joining, outputs.past_key_values, attention_mask, next_tokens)
+        self._record(joining, next_tokens)
+
+    def _decode_step(self) -> None:
+        """Feeds the last sampled token of every active request through the model."""
+        position_ids = self._attention_mask.sum(-1, keepdim=True)
+        ones = torch.ones((len(self._active), 1), dtype=self._attention_mask.dtype, device=self._attention_mask.device)
+        attention_mask = torch.cat([self._attention_mask, ones], dim=-1)
+        outputs = self.model(
+            input_ids=self._next_tokens.unsqueeze(-1),
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=self._cache,
+            use_cache=True,
+        )
+        self._cache = outputs.past_key_values
+        self._attention_mask = attention_mask
+        next_tokens = self._sample(self._active, outputs.logits[:, -1, :])
+        self._next_tokens = next_tokens
+        self._record(list(self._active), next_tokens)
+
+    def _sample(self, requests: List[GenerationRequest], logits: torch.Tensor) -> torch.Tensor:
+        """Picks the next token for each row using that request's own sampling settings."""
+        logits = logits.float()
+        next_tokens = torch.empty(len(requests), dtype=torch.long, device=logits.device)
+        for row, req in enumerate(requests):
+            row_logits = logits[row:row + 1]
+            if req.do_sample:
+                context = torch.tensor([req.input_ids + req.generated_ids], device=logits.device)
+                row_logits = req.logits_processor(context, row_logits)
+                probs = torch.softmax(row_logits, dim=-1)
+                next_tokens[row] = torch.multinomial(probs, num_samples=1)[0, 0]
+            else:
+                next_tokens[row] = row_logits.argmax(dim=-1)[0]
+        return next_tokens
+
+    def _record(self, requests: List[GenerationRequest], next_tokens: torch.Tensor) -> None:
+        """Appends sampled tokens, notifies streamers and retires finished requests."""
+        finished_rows = []
+        tokens = next_tokens.tolist()
+        for req, token in zip(requests, tokens):
+            req.generated_ids.append(token)
+            if req.streamer is not None:
+                req.streamer.put(torch.tensor([token]))
+            if self._is_finished(req, token):
+                finished_rows.append(self._active.index(req))
+        if finished_rows:
+            for row in finished_rows:
+                self._active[row]._finish()
+            self._evict(finished_rows)
+
+    def _is_finished(self, req: GenerationRequest, token: int) -> bool:
+        if token in self.eos_token_ids or len(req.generated_ids) >= req.max_new_tokens:
+            return True
+        if req.stopping_criteria:
+            ids = torch.tensor([req.input_ids + req.generated_ids])
+            return bool(req.stopping_criteria(ids, None).any())
+        return False
+
+    # ------------------------------------------------------------------
+    # Batch bookkeeping
+    # ------------------------------------------------------------------
+    def _merge(self, joining, cache: DynamicCache, attention_mask: torch.Tensor, next_tokens: torch.Tensor) -> None:
+        """Appends newly prefilled rows to the running batch, left-padding the shorter side."""
+        if self._cache is None or not self._active:
+            self._active = list(joining)
+            self._cache = cache
+            self._attention_mask = attention_mask
+            self._next_tokens = next_tokens
+            return
+
+        target_len = max(self._attention_mask.shape[-1], attention_mask.shape[-1])
+        old_legacy = _left_pad_cache(self._cache.to_legacy_cache(), target_len)
+        new_legacy = _left_pad_cache(cache.to_legacy_cache(), target_len)
+        merged = tuple(
+            (torch.cat([old_k, new_k], dim=0), torch.cat([old_v, new_v], dim=0))
+            for (old_k, old_v), (new_k, new_v) in zip(old_legacy, new_legacy)
+        )
+        self._cache = DynamicCache.from_legacy_cache(merged)
+        self._attention_mask = torch.cat([
+            _left_pad_mask(self._attention_mask, target_len),
+            _left_pad_mask(attention_mask, target_len),
+        ], dim=0)
+        self._next_tokens = torch.cat([self._next_tokens, next_tokens], dim=0)
+        self._active.extend(joining)
+
+    def _evict(self, rows: List[int]) -> None:
+        """Drops finished rows from the batch and trims padding no remaining row needs."""
+        keep = [row for row in range(len(self._active)) if row not in set(rows)]
+        if not keep:
+            self._reset_batch()
+            return
+        self._active = [self._active[row] for row in keep]
+        index = torch.tensor(keep, device=self._attention_mask.device)
+        mask = self._attention_mask.index_select(0, index)
+        # Columns that are padding for every remaining row can be cut away
+        start = int((mask.sum(0) > 0).nonzero()[0, 0])
+        self._attention_mask = mask[:, start:]
+        self._next_tokens = self._next_tokens.index_select(0, index)
+        trimmed = tuple(
+            (k.index_select(0, index.to(k.device))[:, :, start:, :], v.index_select(0, index.to(v.device))[:, :, start:, :])
+            for k, v in self._cache.to_legacy_cache()
+        )
+        self._cache = DynamicCache.from_legacy_cache(trimmed)
+
+
+def _left_pad_cache(legacy_cache, target_len: int):
+    """Left-pads every key/value tensor in a legacy cache tuple to ``target_len`` positions."""
+    padded = []
+    for k, v in legacy_cache:
+        missing = target_len - k.shape[2]
+        if missing > 0:
+            k = torch.nn.functional.pad(k, (0, 0, missing, 0))
+            v = torch.nn.functional.pad(v, (0, 0, missing, 0))
+        padded.append((k, v))
+    return tuple(padded)
+
+
+def _left_pad_mask(mask: torch.Tensor, target_len: int) -> torch.Tensor:
+    missing = target_len - mask.shape[-1]
+    if missing <= 0:
+        return mask
+    return torch.nn.functional.pad(mask, (missing, 0))
@@ -1,12 +1,12 @@
 """Deprecated settings manager. Use :pymod:`backend.api.core.config` instead."""
 
-from typing import Literal
+from typing import Literal, get_args
 
 # Re-export from the new central config for backward-compatibility.
 
 from .config import settings, PrecisionType  # noqa: F401  (re-export)
 
-VALID_PRECISIONS = {"fp32", "fp16"}
+VALID_PRECISIONS = set(get_args(PrecisionType))
 
 
 def get_precision() -> PrecisionType:  # type: ignore[override]
@@ -0,0 +1,89 @@
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+from .metrics import SPECULATIVE_ACCEPTED_TOKENS, SPECULATIVE_DRAFTED_TOKENS, StepTimer
+from .model_loader import load_model_by_name
+
+
+class SpeculativeStats:
+    """Running totals of how many of a draft model's proposed tokens the target accepted.
+
+    Every verification step runs one target forward pass over the draft's
+    candidates and keeps the accepted prefix plus one token of the target's
+    own, so ``generated = accepted + steps``.
+    """
+
+    def __init__(self):
+        self.generations = 0
+        self.steps = 0
+        self.drafted_tokens = 0
+        self.accepted_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, timer: StepTimer) -> None:
+        """Adds the counts a StepTimer collected during one assisted generation."""
+        accepted = max(timer.tokens - timer.steps, 0)
+        with self._lock:
+            self.generations += 1
+            self.steps += timer.steps
+            self.drafted_tokens += timer.drafted_tokens
+            self.accepted_tokens += accepted
+        SPECULATIVE_DRAFTED_TOKENS.inc(timer.drafted_tokens)
+        SPECULATIVE_ACCEPTED_TOKENS.inc(accepted)
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            generated = self.accepted_tokens + self.steps
+            return {
+                "generations": self.generations,
+                "verify_steps": self.steps,
+                "drafted_tokens": self.drafted_tokens,
+                "accepted_tokens": self.accepted_tokens,
+                "acceptance_rate": round(self.accepted_tokens / self.drafted_tokens, 4) if self.drafted_tokens else None,
+                "tokens_per_step": round(generated / self.steps, 3) if self.steps else None,
+            }
+
+
+class DraftModel:
+    """A small model that proposes tokens for a larger target model to verify.
+
+    It is handed to ``model.generate`` as the ``assistant_model``: each step
+    the draft decodes a few tokens cheaply and the target checks them all in
+    a single forward pass. With sampling this is speculative sampling, so
+    the output follows the target model's distribution exactly; only the
+    speed depends on how often the draft guesses right.
+    """
+
+    def __init__(self, name: str, tokenizer, model, device: str, num_tokens: int = 5):
+        self.name = name
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = device
+        # Starting draft length; transformers grows it while drafts are accepted and shrinks it on misses
+        model.generation_config.num_assistant_tokens = num_tokens
+        model.generation_config.num_assistant_tokens_schedule = "heuristic"
+        self.stats = SpeculativeStats()
+
+    def generate_kwargs(self, target_model, target_tokenizer) -> Dict[str, Any]:
+        """The extra ``model.generate`` arguments that turn on assisted decoding."""
+        kwargs: Dict[str, Any] = {"assistant_model": self.model}
+        if self.model.config.vocab_size != target_model.config.vocab_size:
+            # Differently sized vocabularies need both tokenizers (universal assisted decoding)
+            kwargs.update(tokenizer=target_tokenizer, assistant_tokenizer=self.tokenizer)
+        return kwargs
+
+
+def load_draft_model(name: str, num_tokens: int = 5) -> Optional[DraftModel]:
+    """Loads a draft model from backend/models through the same path as target models.
+
+    Returns None (after logging why) if it cannot be loaded, so the target
+    model still serves, just without speculative decoding.
+    """
+    try:
+        tokenizer, model, device = load_model_by_name(name)
+    except (ValueError, RuntimeError) as e:
+        print(f"   ⚠️ Draft model '{name}' could not be loaded; speculative decoding disabled: {e}", file=sys.stderr)
+        return None
+    print(f"   ✅ Draft model '{name}' loaded for speculative decoding ({num_tokens} tokens per step to start).")
+    return DraftModel(name, tokenizer, model, device, num_tokens)
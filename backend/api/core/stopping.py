@@ -0,0 +1,86 @@
+import threading
+from typing import List, Optional
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+from .cleaner import DEFAULT_STOP_TOKENS
+from .metrics import StepTimer
+
+
+def resolve_stop_sequences(tokenizer, extra: Optional[List[str]] = None) -> List[str]:
+    """Returns the stop sequences for a generation, without duplicates.
+
+    These are the default stop tokens, then any ``stop_sequences`` listed in
+    the model's prompt_config.json, then the caller's own ``extra`` ones.
+    """
+    model_stops = getattr(tokenizer, "stop_sequences", None)
+    if not isinstance(model_stops, (list, tuple)):
+        model_stops = []
+    resolved = []
+    for stop in list(DEFAULT_STOP_TOKENS) + list(model_stops) + list(extra or []):
+        if stop and stop not in resolved:
+            resolved.append(stop)
+    return resolved
+
+
+class StopSequenceCriteria(StoppingCriteria):
+    """Halts generation as soon as the generated text contains a stop sequence.
+
+    Each step decodes only a short tail of the generated tokens: a stop
+    sequence that just appeared must end in the newest token, and a
+    sequence of n characters spans at most n tokens. Text that belongs to
+    the prompt (the first ``prompt_length`` tokens) is never matched.
+    """
+
+    def __init__(self, tokenizer, stop_sequences: List[str], prompt_length: int):
+        self.tokenizer = tokenizer
+        self.stop_sequences = [s for s in stop_sequences if s]
+        self.prompt_length = prompt_length
+        # A little slack for tokens that decode to nothing (e.g. byte fallback pieces)
+        self.window = max((len(s) for s in self.stop_sequences), default=0) + 2
+
+    def __call__(self, input_ids: torch.LongTensor, scores: Optional[torch.FloatTensor], **kwargs) -> torch.BoolTensor:
+        is_done = []
+        for row in input_ids:
+            tail = row[self.prompt_length:][-self.window:]
+            text = self.tokenizer.decode(tail, skip_special_tokens=False) if len(tail) else ""
+            is_done.append(any(stop in text for stop in self.stop_sequences))
+        return torch.tensor(is_done, dtype=torch.bool, device=input_ids.device)
+
+
+class CancellationCriteria(StoppingCriteria):
+    """Halts generation once ``cancel_event`` is set (client gone or generation cancelled).
+
+    Checked after every decode step, so a cancelled generation stops within
+    one token instead of running on to max_new_tokens.
+    """
+
+    def __init__(self, cancel_event: threading.Event):
+        self.cancel_event = cancel_event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: Optional[torch.FloatTensor], **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.cancel_event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+def build_stopping_criteria(
+    tokenizer,
+    stop_sequences: Optional[List[str]],
+    prompt_length: int,
+    cancel_event: Optional[threading.Event] = None,
+    step_timer: Optional[StepTimer] = None,
+) -> Optional[StoppingCriteriaList]:
+    """Builds the criteria for generate / the scheduler, or returns None if there is nothing to check.
+
+    A ``step_timer`` (see core.metrics.StepTimer) rides along to time the decode loop.
+    """
+    criteria = []
+    if step_timer is not None:
+        step_timer.prompt_length = prompt_length
+        criteria.append(step_timer)
+    stop_sequences = [s for s in (stop_sequences or []) if s]
+    if stop_sequences:
+        criteria.append(StopSequenceCriteria(tokenizer, stop_sequences, prompt_length))
+    if cancel_event is not None:
+        criteria.append(CancellationCriteria(cancel_event))
+    return StoppingCriteriaList(criteria) if criteria else None
@@ -0,0 +1,132 @@
+import sys
+import time
+from typing import List, Optional
+
+import torch
+from transformers import CompileConfig, StaticCache
+
+
+def bucket_length(length: int, buckets: List[int]) -> int:
+    """Rounds ``length`` up to the smallest bucket, or to a multiple of the largest one."""
+    for bucket in sorted(buckets):
+        if length <= bucket:
+            return bucket
+    largest = max(buckets)
+    return -(-length // largest) * largest
+
+
+def static_cache_for(model, prompt_length: int, max_new_tokens: int) -> Optional[StaticCache]:
+    """Returns a fresh bucketed StaticCache for a compiled model, or None for eager models.
+
+    Sizing the cache to a bucket instead of the exact prompt + generation
+    length keeps the decode shapes fixed, so the compiled forward is reused
+    across prompts instead of recompiling for every length.
+    """
+    buckets = getattr(model, "static_cache_buckets", None)
+    if not buckets:
+        return None
+    return StaticCache(
+        config=model.config,
+        max_batch_size=1,
+        max_cache_len=bucket_length(prompt_length + max_new_tokens, buckets),
+        device=model.device,
+        dtype=model.dtype,
+        layer_device_map=model._get_layer_device_map_for_cache_init(),
+    )
+
+
+def enable_compile(model, buckets: List[int]) -> bool:
+    """Switches generate to a compiled decode step over bucketed static caches.
+
+    ``generate`` compiles the forward automatically when it is handed a
+    StaticCache; prefill still runs eagerly, so only decode shapes (one per
+    bucket) are compiled. Returns False if the model cannot be compiled.
+    """
+    if not getattr(model, "_supports_static_cache", False):
+        print("   ⚠️ torch.compile skipped: model does not support static KV caches.", file=sys.stderr)
+        return False
+    if getattr(model, "precision_mode", None) == "int8_dynamic":
+        print("   ⚠️ torch.compile skipped: dynamically quantized models run eagerly.", file=sys.stderr)
+        return False
+    config = CompileConfig(fullgraph=False, dynamic=False)
+    if model.device.type != "cuda":
+        # CUDA graphs ("reduce-overhead") are CUDA only; generate also needs an explicit opt-in off-GPU
+        config.mode = "default"
+        config._compile_all_devices = True
+    model.generation_config.compile_config = config
+    model.static_cache_buckets = list(buckets)
+    return True
+
+
+def warmup_model(model, tokenizer, prompt_lengths: List[int], decode_steps: int, max_new_tokens: int = 0) -> None:
+    """Runs representative prefill/decode shapes so the first real request is not the slow one.
+
+    This triggers lazy kernel selection, allocator growth, tokenizer and chat
+    template initialisation and, for compiled models, compilation of the
+    decode step for each bucket that prompts of those lengths land in when
+    generating up to ``max_new_tokens``.
+    """
+    sample = "Hello"
+    if getattr(tokenizer, "chat_template", None):
+        sample = tokenizer.apply_chat_template(
+            [{"role": "user", "content": sample}], tokenize=False, add_generation_prompt=True
+        )
+    filler = tokenizer(sample)["input_ids"] or [tokenizer.eos_token_id]
+    max_positions = getattr(model.config, "max_position_embeddings", None)
+
+    for length in prompt_lengths:
+        if max_positions:
+            length = min(length, max_positions - decode_steps)
+        if length <= 0:
+            continue
+        input_ids = torch.tensor([(filler * (length // len(filler) + 1))[:length]], device=model.device)
+        with torch.no_grad():
+            model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=decode_steps,
+                min_new_tokens=decode_steps,
+                do_sample=False,
+                pad_token_id=tokenizer.pad_token_id,
+                past_key_values=static_cache_for(model, length, max(decode_steps, max_new_tokens)),
+            )
+
+
+def prepare_for_serving(
+    entry,
+    compile_model: bool,
+    warmup: bool,
+    prompt_lengths: List[int],
+    decode_steps: int,
+    buckets: List[int],
+    max_new_tokens: int = 0,
+) -> None:
+    """Optionally compiles and warms up a freshly loaded model, recording the outcome on ``entry``.
+
+    Compiling always implies a warmup, since the first compile is the
+    latency spike the warmup exists to absorb. A failed warmup is reported
+    rather than raised (and compilation is undone); the model stays loaded
+    but is not marked warm.
+    """
+    if compile_model:
+        entry.compiled = enable_compile(entry.model, buckets)
+    if not (warmup or entry.compiled):
+        return
+
+    entry.warmup_status = "warming"
+    print(f"🔥 Warming up '{entry.name}' (prompt lengths {prompt_lengths}, {decode_steps} decode steps)...")
+    start = time.perf_counter()
+    try:
+        warmup_model(entry.model, entry.tokenizer, prompt_lengths, decode_steps, max_new_tokens)
+    except Exception as e:
+        if entry.compiled:
+            # Fall back to eager generation rather than failing every request the same way
+            entry.model.static_cache_buckets = None
+            entry.compiled = False
+        entry.warmup_status = "failed"
+        entry.warmup_error = str(e)
+        print(f"   ⚠️ Warmup of '{entry.name}' failed: {e}", file=sys.stderr)
+        return
+    entry.warmup_seconds = round(time.perf_counter() - start, 2)
+    entry.warmup_status = "warm"
+    print(f"   ✅ '{entry.name}' is warm ({entry.warmup_seconds}s).")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Maintenance commands for the saved chat history (run from the project root).
+
+import argparse
+import os
+import sys
+
+# Allow running as a plain script from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.api.core.history_manager import DEFAULT_SEARCH_DB, HISTORY_DIR, create_backend
+from backend.api.core.chat_search import ChatSearchIndex
+from backend.api.core.history_compression import CODEC_EXTENSIONS, codec_unavailable_reason
+
+BACKENDS = ["json", "jsonl", "sqlite"]
+
+def migrate(args) -> int:
+    """Copies every session from one backend into another (existing sessions are replaced)."""
+    if args.source == args.target and (args.source != "sqlite" or args.source_db == args.db):
+        print("Source and target backends are the same; nothing to do.", file=sys.stderr)
+        return 1
+    source = create_backend(args.source, history_dir=args.history_dir, db_path=args.source_db)
+    target = create_backend(args.target, history_dir=args.history_dir, db_path=args.db)
+
+    thread_ids = source.thread_ids()
+    print(f"Migrating {len(thread_ids)} session(s) from {source.name} to {target.name}...")
+    migrated, skipped = 0, 0
+    for thread_id in thread_ids:
+        session_data = source.get_session(thread_id)
+        if not session_data:
+            print(f"   ⚠️ Skipping unreadable session {thread_id}", file=sys.stderr)
+            skipped += 1
+            continue
+        session_data["thread_id"] = thread_id
+        target.import_session(session_data)
+        migrated += 1
+    source.close()
+    target.close()
+    print(f"✅ Migrated {migrated} session(s), skipped {skipped}.")
+    if args.target != "json":
+        print(f"Set SIGIL_HISTORY_BACKEND={args.target} to use the migrated history.")
+    return 0
+
+def compact(args) -> int:
+    """Rewrites every JSONL session journal to its minimal form."""
+    backend = create_backend("jsonl", history_dir=args.history_dir)
+    thread_ids = backend.thread_ids()
+    for thread_id in thread_ids:
+        backend.compact(thread_id)
+    print(f"✅ Compacted {len(thread_ids)} session journal(s).")
+    return 0
+
+def reindex(args) -> int:
+    """Rebuilds the full-text search index from the stored sessions."""
+    backend = create_backend(args.backend, history_dir=args.history_dir, db_path=args.db)
+    index = ChatSearchIndex(args.search_db)
+    print(f"✅ Indexed {index.rebuild(backend)} session(s) into {args.search_db}.")
+    index.close()
+    backend.close()
+    return 0
+
+def compress(args) -> int:
+    """Compresses JSON sessions that have not been modified for --older-than-days."""
+    unavailable = codec_unavailable_reason(args.codec)
+    if unavailable:
+        print(unavailable, file=sys.stderr)
+        return 1
+    backend = create_backend("json", history_dir=args.history_dir)
+    compressed = backend.compress_cold_sessions(args.codec, args.older_than_days * 86400)
+    print(f"✅ Compressed {compressed} session(s) with {args.codec}.")
+    return 0
+
+def train_dictionary(args) -> int:
+    """Trains a zstd dictionary on the saved sessions (used for later zstd compression)."""
+    unavailable = codec_unavailable_reason("zstd")
+    if unavailable:
+        print(unavailable, file=sys.stderr)
+        return 1
+    backend = create_backend("json", history_dir=args.history_dir)
+    samples = backend.sample_payloads(args.samples)
+    if len(samples) < 10:
+        print(f"Need at least 10 saved sessions to train a dictionary (found {len(samples)}).", file=sys.stderr)
+        return 1
+    dict_id = backend.zstd_dictionaries.train(samples)
+    print(f"✅ Trained zstd dictionary {dict_id} on {len(samples)} session(s).")
+    return 0
+
+def main():
+    """Parses CLI arguments and runs the requested history maintenance command."""
+    parser = argparse.ArgumentParser(description="Maintain saved chat history.")
+    parser.add_argument("--history-dir", default=HISTORY_DIR, help="Directory holding JSON session files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Copy sessions between storage backends.")
+    migrate_parser.add_argument("--from", dest="source", choices=BACKENDS, default="json")
+    migrate_parser.add_argument("--to", dest="target", choices=BACKENDS, default="sqlite")
+    migrate_parser.add_argument("--source-db", help="SQLite file to read from (when --from sqlite).")
+    migrate_parser.add_argument("--db", help="SQLite file to write to (defaults to saved_chats/history.sqlite3).")
+    migrate_parser.set_defaults(func=migrate)
+
+    compact_parser = subparsers.add_parser("compact", help="Compact the append-only JSONL session journals.")
+    compact_parser.set_defaults(func=compact)
+
+    reindex_parser = subparsers.add_parser("reindex", help="Rebuild the full-text search index.")
+    reindex_parser.add_argument("--backend", choices=BACKENDS, default="json", help="Backend holding the sessions.")
+    reindex_parser.add_argument("--db", help="SQLite history file (when --backend sqlite).")
+    reindex_parser.add_argument("--search-db", default=DEFAULT_SEARCH_DB, help="Search index file to rebuild.")
+    reindex_parser.set_defaults(func=reindex)
+
+    compress_parser = subparsers.add_parser("compress", help="Compress cold JSON sessions.")
+    compress_parser.add_argument("--codec", choices=list(CODEC_EXTENSIONS), default="gzip")
+    compress_parser.add_argument("--older-than-days", type=float, default=30.0, help="Only sessions idle this long (0 for all).")
+    compress_parser.set_defaults(func=compress)
+
+    dictionary_parser = subparsers.add_parser("train-dictionary", help="Train a zstd dictionary on the saved sessions.")
+    dictionary_parser.add_argument("--samples", type=int, default=1000, help="Maximum number of sessions to sample.")
+    dictionary_parser.set_defaults(func=train_dictionary)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
-from fastapi import FastAPI, HTTPException, status, Request
+from fastapi import FastAPI, HTTPException, status, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel, Field, validator
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import torch
@@ -10,7 +10,19 @@ import re # <-- Add import for regex
 from typing import Optional, List, Dict, Any # <-- Add List, Dict, Any
 from contextlib import asynccontextmanager # <-- Import asynccontextmanager
 # Use relative imports for modules within the same package level
-from .core.model_loader import load_model_internal, load_model_by_name
+from .core.model_loader import load_model_internal, load_model_by_name, resolve_model_path
+from .core.model_manager import LoadedModel, ModelManager, estimate_checkpoint_bytes
+from .core.kv_cache import ThreadKVCacheStore
+from .core.load_jobs import ModelLoadJobs
+from .core.inference_executor import InferenceExecutor
+from .core.warmup import prepare_for_serving
+from .core.speculative import load_draft_model
+from .core.gpu_check import cuda_memory_bytes
+from .core import metrics
+from .core.history_manager import (
+    close_backend as close_history_backend, enable_search, start_write_behind, stop_write_behind,
+    start_cold_compression, stop_cold_compression, write_queue_stats,
+)
 from .routes.chat import router as chat_router
 from .routes.settings import router as settings_router
 from .routes.models import router as models_router # <-- Import the new models router
@@ -38,13 +50,45 @@ async def lifespan(app: FastAPI):
     app.state.tokenizer = None
     app.state.device = None
     app.state.model_path = None
+    app.state.model_name = None
+    app.state.scheduler = None
+    app.state.prefix_cache = None
+    app.state.draft = None
+    app.state.kv_cache = ThreadKVCacheStore(settings.kv_cache_max_mb * 1024 * 1024)
+    app.state.model_manager = ModelManager(
+        ram_budget_bytes=int(settings.model_ram_budget_gb * 1024**3),
+        vram_budget_bytes=int(settings.model_vram_budget_gb * 1024**3),
+        on_evict=lambda name: _on_model_evicted(app.state, name),
+    )
+    app.state.load_jobs = ModelLoadJobs()
+    # Generation runs on its own workers: one at a time, or a full batch with continuous batching
+    app.state.inference_executor = InferenceExecutor(
+        settings.max_concurrent_generations or (settings.max_batch_size if settings.batching_enabled else 1),
+        max_queue_depth=settings.max_queue_depth,
+    )
     # Load defaults from central settings
     app.state.system_prompt = settings.default_system_prompt
     app.state.temperature = settings.default_temperature
     app.state.top_p = settings.default_top_p
     app.state.max_new_tokens = settings.default_max_new_tokens
+    if settings.chat_search_enabled:
+        enable_search(settings.chat_search_db_path)
+    if settings.history_write_behind:
+        start_write_behind(settings.history_queue_max_messages)
+    if settings.history_compression != "none":
+        start_cold_compression(
+            settings.history_compression,
+            settings.history_compress_after_days,
+            settings.history_compress_interval_minutes,
+        )
     yield
     # Shutdown logic (if any) can go here
+    app.state.load_jobs.shutdown()
+    app.state.inference_executor.shutdown()
+    app.state.model_manager.clear()
+    stop_cold_compression()
+    stop_write_behind() # Flush queued chat history before closing the store
+    close_history_backend()
     print("Shutting down API.") # Optional shutdown message
 
 app = FastAPI(
@@ -73,6 +117,102 @@ app.add_middleware(
     allow_headers=["*"],         # Allow all HTTP headers
 )
 
+# --- Model Registry Helpers ---
+def sync_active_model(state) -> None:
+    """Mirrors the model manager's active model into app state.
+
+    Routes that do not name a model keep reading ``state.model`` and friends,
+    so these references always point at the current default model.
+    """
+    entry = state.model_manager.active
+    state.model = entry.model if entry else None
+    state.tokenizer = entry.tokenizer if entry else None
+    state.device = entry.device if entry else None
+    state.model_path = entry.path if entry else None
+    state.model_name = entry.name if entry else None
+    state.scheduler = entry.scheduler if entry else None
+    state.prefix_cache = entry.prefix_cache if entry else None
+    state.draft = entry.draft if entry else None
+
+def _on_model_evicted(state, name: str) -> None:
+    """Drops every reference app state holds to a model that is being unloaded."""
+    state.kv_cache.discard_matching(lambda key: isinstance(key, tuple) and key[0] == name)
+    if state.model_name == name:
+        sync_active_model(state)
+
+def install_model(state, name: str, path: str, loader, keep_active: bool = False) -> LoadedModel:
+    """Makes ``name`` the active model, loading it with ``loader()`` unless it is already resident.
+
+    Least-recently-used models are evicted first if the checkpoint would not
+    fit the memory budget; with ``keep_active`` the currently active model is
+    spared so it keeps serving until the new one takes over. ``loader``
+    returns ``(tokenizer, model, device)``. A draft model configured for
+    ``name`` (SIGIL_DRAFT_MODELS) is loaded alongside it for speculative decoding.
+    """
+    manager = state.model_manager
+    entry = manager.get(name)
+    if entry is None:
+        device_kind = "cuda" if torch.cuda.is_available() else "cpu"
+        keep = (manager.active_name,) if keep_active and manager.active_name else ()
+        draft_name = settings.draft_models_map.get(name)
+        incoming_bytes = estimate_checkpoint_bytes(resolve_model_path(path))
+        if draft_name:
+            incoming_bytes += estimate_checkpoint_bytes(resolve_model_path(os.path.join("backend", "models", draft_name)))
+        manager.make_room(incoming_bytes, device_kind, keep=keep)
+        tokenizer, model, device = loader()
+        entry = LoadedModel(name, path, tokenizer, model, device)
+        if draft_name:
+            draft = load_draft_model(draft_name, settings.speculative_num_tokens)
+            if draft is not None:
+                entry.attach_draft(draft)
+        # Warm up before the model is registered so it never serves cold
+        prepare_for_serving(
+            entry,
+            compile_model=settings.torch_compile,
+            warmup=settings.warmup_on_load,
+            prompt_lengths=settings.warmup_prompt_lengths_list,
+            decode_steps=settings.warmup_decode_steps,
+            buckets=settings.compile_cache_buckets_list,
+            max_new_tokens=settings.default_max_new_tokens,
+        )
+        entry = manager.add(
+            entry,
+            batching_enabled=settings.batching_enabled,
+            max_batch_size=settings.max_batch_size,
+        )
+    else:
+        print(f"Model '{name}' is already resident; switching to it.")
+    manager.activate(name)
+    sync_active_model(state)
+    # Switch first, then evict, so requests never see "no model loaded"
+    manager.enforce_budget(entry.device_kind, keep=name)
+
+    try:
+        entry.prefix_cache.refresh(entry.model, entry.tokenizer, state.system_prompt)
+    except Exception as e:
+        # Not fatal: generation simply runs without the pinned prefix
+        print(f"   ⚠️ Could not precompute system prompt cache: {e}", file=sys.stderr)
+    return entry
+
+def queue_model_load(state, name: str, path: str, loader) -> JSONResponse:
+    """Starts loading a model in the background and returns 202 with the job to poll.
+
+    The currently active model keeps serving requests until the new one is
+    ready; only then does it take over as the default.
+    """
+    absolute_path = resolve_model_path(path)
+    if not os.path.isdir(absolute_path):
+        raise ValueError(f"Invalid directory path provided or not found: '{path}' (resolved to '{absolute_path}')")
+    job = state.load_jobs.submit(
+        name,
+        absolute_path,
+        lambda job: install_model(state, name, path, job.track(loader), keep_active=True),
+    )
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=dict(job.describe(), status_url=f"/api/v1/model/load/status/{job.id}"),
+    )
+
 # --- Theme Listing Endpoint ---
 @app.get("/themes")
 def list_themes():
@@ -98,24 +238,18 @@ def list_models():
 # Endpoint to load the model
 @app.post("/api/v1/model/load", response_model=LoadModelResponse, status_code=status.HTTP_200_OK)
 def load_model_endpoint(req: LoadModelRequest):
-    # Basic check if a model is already loaded
-    if app.state.model is not None:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"A model is already loaded from '{app.state.model_path}'. Please restart the backend to load a different model.",
-        )
+    # Loading another model no longer requires a restart: it joins the resident
+    # models (evicting least-recently-used ones if over budget) and becomes active
     try:
         # Resolve relative paths from the backend API directory if necessary
         # For simplicity, assume path is usable as is (e.g., absolute or relative to where backend is run)
         model_path_to_load = req.path
+        model_name = os.path.basename(os.path.normpath(model_path_to_load))
 
-        tokenizer, model, device = load_model_internal(model_path_to_load)
+        if req.background:
+            return queue_model_load(app.state, model_name, model_path_to_load, lambda: load_model_internal(model_path_to_load))
 
-        # Update app state
-        app.state.tokenizer = tokenizer
-        app.state.model = model
-        app.state.device = device
-        app.state.model_path = model_path_to_load # Store the path used
+        install_model(app.state, model_name, model_path_to_load, lambda: load_model_internal(model_path_to_load))
 
         return {
             "message": "Model loaded successfully.",
@@ -136,7 +270,8 @@ def load_model_endpoint(req: LoadModelRequest):
 
 # --- New Endpoint to load model by name ---
 @app.post("/api/v1/model/load/{model_name}", status_code=status.HTTP_200_OK)
-async def load_model_by_name_route(model_name: str, request: Request):
+def load_model_by_name_route(model_name: str, request: Request, background: bool = Query(False)):
+    # A plain def runs in the threadpool: a foreground load (checkpoint, draft, warmup, compile) must not stall /health
     # Basic check if a model is already loaded (optional, decide if replacing is allowed)
     # if request.app.state.model is not None:
     #     raise HTTPException(
@@ -145,14 +280,20 @@ async def load_model_by_name_route(model_name: str, request: Request):
     #     )
     try:
         print(f"Received request to load model: {model_name}")
-        tokenizer, model, device = load_model_by_name(model_name)
-
-        # Update app state
-        request.app.state.tokenizer = tokenizer
-        request.app.state.model = model
-        request.app.state.device = device
-        # Use model_name or resolved path for model_path state? Using name for now.
-        request.app.state.model_path = model_name
+        if background:
+            return queue_model_load(
+                request.app.state,
+                model_name,
+                os.path.join("backend", "models", model_name),
+                lambda: load_model_by_name(model_name),
+            )
+        entry = install_model(
+            request.app.state,
+            model_name,
+            os.path.join("backend", "models", model_name),
+            lambda: load_model_by_name(model_name),
+        )
+        device = entry.device
         # Clear previous settings potentially? Or keep them?
         # request.app.state.system_prompt = "Default prompt for new model" # Example
 
@@ -173,6 +314,43 @@ async def load_model_by_name_route(model_name: str, request: Request):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred: {e}")
 # --- End New Endpoint ---
 
+@app.get("/api/v1/model/load/status/{job_id}")
+def load_status_route(job_id: str):
+    """Reports the progress of a background model load (bytes/shards loaded and ETA)."""
+    job = app.state.load_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Load job '{job_id}' not found.")
+    return job.describe()
+
+# --- Resident Model Management ---
+@app.get("/api/v1/model/loaded")
+def list_loaded_models():
+    """Lists resident models (most recently used first) and the memory budgets."""
+    manager = app.state.model_manager
+    gb = 1024**3
+    return {
+        "models": manager.loaded(),
+        "active": manager.active_name,
+        "budgets_gb": {kind: (round(b / gb, 2) if b else None) for kind, b in manager.budgets.items()},
+    }
+
+@app.post("/api/v1/model/activate/{model_name}")
+def activate_model_route(model_name: str):
+    """Switches the default model to one that is already resident, without reloading."""
+    try:
+        entry = app.state.model_manager.activate(model_name)
+    except KeyError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Model '{model_name}' is not loaded.")
+    sync_active_model(app.state)
+    return {"status": "ok", "message": f"Model '{model_name}' is now active.", "device": entry.device}
+
+@app.delete("/api/v1/model/{model_name}")
+def unload_model_route(model_name: str):
+    """Unloads a resident model and frees its memory."""
+    if not app.state.model_manager.remove(model_name):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Model '{model_name}' is not loaded.")
+    return {"status": "ok", "message": f"Model '{model_name}' unloaded.", "active": app.state.model_manager.active_name}
+
 # Endpoint to check model status
 # @app.get("/api/v1/model/status", response_model=ModelStatusResponse)
 # def get_model_status():
@@ -185,11 +363,21 @@ async def load_model_by_name_route(model_name: str, request: Request):
 #     else:
 #         return {"loaded": False}
 
-# Simplified health check
+# Simplified health check (async: answered on the event loop, never queued behind generation)
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok"}
 
+# Prometheus scrape endpoint: generation, queue, history and model load metrics plus VRAM gauges
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    executor = getattr(app.state, "inference_executor", None)
+    body, content_type = metrics.render(
+        inference_stats=executor.stats() if executor is not None else None,
+        history_stats=write_queue_stats(),
+    )
+    return Response(content=body, media_type=content_type)
+
 # VRAM endpoint - check device status
 @app.get("/api/v1/vram", response_model=VRAMInfoResponse)
 def get_vram_info():
@@ -202,9 +390,8 @@ def get_vram_info():
 
     if app.state.device == 'cuda' and torch.cuda.is_available():
         try:
-            total_mem = torch.cuda.get_device_properties(0).total_memory
-            reserved_mem = torch.cuda.memory_reserved(0)
-            allocated_mem = torch.cuda.memory_allocated(0)
+            memory = cuda_memory_bytes()
+            total_mem, reserved_mem, allocated_mem = memory["total"], memory["reserved"], memory["allocated"]
             free_mem = reserved_mem - allocated_mem
             gb = 1024**3
             return {
@@ -232,9 +419,6 @@ def get_vram_info():
             "message": "CUDA not available or device is not CUDA. No VRAM info.",
         }
 
-# Chat endpoint - check if model is loaded
-MIN_NARRATIVE_TOKENS = 350  # Keep constant here if needed elsewhere, or move to config
-
 app.include_router(chat_router, prefix="/api/v1/chat", tags=["Chat"])
 app.include_router(settings_router, prefix="/api/v1/settings", tags=["Settings"])
 app.include_router(models_router, prefix="/api/v1/models", tags=["Models"]) # <-- Include models router
@@ -1,6 +1,13 @@
 import sys
 import os # <-- Add OS import for file operations
-from fastapi import APIRouter, HTTPException, status, Request, Response # Import Request and Response
+import json
+import asyncio
+import threading
+import time
+import uuid
+from fastapi import APIRouter, HTTPException, status, Request, Response, Query # Import Request and Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List, Dict, Any # Import necessary types
 from pydantic import BaseModel # Import BaseModel for request body
 
@@ -10,25 +17,71 @@ from ..schemas.chat import (
 )
 
 # Import core logic functions using relative paths
-from ..core.inference import generate_response
+from ..core.inference import generate_response, stream_response
+from ..core.inference_executor import (
+    DEFAULT_CLIENT, GenerationCancelledError, InferenceExecutor, InferenceJob, QueueFullError
+)
+from ..core.metrics import TIME_TO_FIRST_TOKEN_SECONDS
 from ..core.prompt_builder import generate_prompt
-from ..core.cleaner import truncate_at_stop_token, clean_response
+from ..core.prompt_cache import assemble_prompt
+from ..core.context_window import context_length, fit_to_context, prompt_token_budget
+from ..core.config import settings
+from ..core.cleaner import truncate_at_stop_token, clean_response, StreamingResponseCleaner
+from ..core.stopping import resolve_stop_sequences
 from ..core.history_manager import (
-    save_chat_messages, get_session, list_sessions, delete_session, update_session_title
+    save_chat_messages, get_session, list_sessions_page, delete_session, update_session_title, generate_thread_id,
+    search_sessions
 )
 
 router = APIRouter()
 
-MIN_NARRATIVE_TOKENS = 350  # Replicate constant or import from a config module
+DEFAULT_TOP_K = 50
+# How often a waiting chat request checks whether its client has gone away
+DISCONNECT_POLL_SECONDS = 0.25
+# Non-standard "Client Closed Request" status for generations cancelled mid-request
+STATUS_CLIENT_CLOSED_REQUEST = 499
 
 # --- ADDED: Pydantic model for rename request ---
 class RenameSessionRequest(BaseModel):
     newName: str
 # --- END ADDITION ---
 
+def _inference_executor(app_state) -> InferenceExecutor:
+    """The executor generation runs on (created here if the app started without its lifespan)."""
+    executor = getattr(app_state, "inference_executor", None)
+    if executor is None:
+        executor = app_state.inference_executor = InferenceExecutor()
+    return executor
+
+def _client_id(request: Request) -> str:
+    """Identifies the caller for fair queueing: the X-Client-Id header, else the client address."""
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else DEFAULT_CLIENT)
+
+def _queue_full(e: QueueFullError) -> HTTPException:
+    """429 telling the client when to retry."""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+def _request_id(request: Request) -> str:
+    """Id a generation can be cancelled by: the X-Request-Id header, else a new one."""
+    return request.headers.get("X-Request-Id") or uuid.uuid4().hex
+
+async def _result_unless_disconnected(job: InferenceJob, request: Request, executor: InferenceExecutor) -> Any:
+    """Awaits a job, cancelling it if the client disconnects while it is queued or running."""
+    result = asyncio.ensure_future(job.result())
+    while not result.done():
+        await asyncio.wait({result}, timeout=DISCONNECT_POLL_SECONDS)
+        if not result.done() and not job.cancelled and await request.is_disconnected():
+            print(f"Client disconnected; cancelling generation {job.request_id}.")
+            executor.cancel(job.request_id)
+    return await result
+
 # Chat endpoint - check if model is loaded
 @router.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest, request: Request): # Add request: Request
+async def chat(req: ChatRequest, request: Request): # Add request: Request
     app_state = request.app.state # Access app state
     # Check if model is loaded
     if not app_state.model or not app_state.tokenizer:
@@ -46,38 +99,53 @@ def chat(req: ChatRequest, request: Request): # Add request: Request
         current_temperature = app_state.temperature
         current_top_p = app_state.top_p
         current_max_new_tokens = app_state.max_new_tokens
-        if current_max_new_tokens < MIN_NARRATIVE_TOKENS:
-            current_max_new_tokens = MIN_NARRATIVE_TOKENS
 
         # --- Updated Prompt Formatting ---
         messages = [
             {"role": "system", "content": current_system_prompt},
             {"role": "user", "content": req.message}
         ]
-        prompt = current_tokenizer.apply_chat_template(
+        # Template rendering runs off the event loop like the rest of the CPU-bound work
+        prompt = await run_in_threadpool(
+            current_tokenizer.apply_chat_template,
             messages,
             tokenize=False,
             add_generation_prompt=True
         )
 
-        # --- Call Refactored Generation Function ---
-        response_text = generate_response(
-            model=current_model,
-            tokenizer=current_tokenizer,
-            device=current_device,
-            prompt=prompt,
-            temperature=current_temperature,
-            top_p=current_top_p,
-            max_new_tokens=current_max_new_tokens
-        )
+        stop_sequences = resolve_stop_sequences(current_tokenizer)
+
+        # --- Call Refactored Generation Function (on the inference executor) ---
+        try:
+            job = _inference_executor(app_state).submit(
+                generate_response,
+                client_id=_client_id(request),
+                model=current_model,
+                tokenizer=current_tokenizer,
+                device=current_device,
+                prompt=prompt,
+                temperature=current_temperature,
+                top_p=current_top_p,
+                max_new_tokens=current_max_new_tokens,
+                stop_sequences=stop_sequences,
+                scheduler=getattr(app_state, "scheduler", None),
+                draft=getattr(app_state, "draft", None),
+                prefix_cache=getattr(app_state, "prefix_cache", None),
+                system_prompt=current_system_prompt
+            )
+        except QueueFullError as e:
+            raise _queue_full(e)
+        response_text = await job.result()
         # --- End Call ---
 
         # Clean the response before returning
         # Considering handling this differently in the future
         cleaned_response_text = clean_response(response_text)
-        truncated_response_text = truncate_at_stop_token(cleaned_response_text)
+        truncated_response_text = truncate_at_stop_token(cleaned_response_text, stop_sequences)
         return {"response": truncated_response_text}
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error during chat generation: {e}", file=sys.stderr)
         raise HTTPException(
@@ -85,39 +153,121 @@ def chat(req: ChatRequest, request: Request): # Add request: Request
             detail=f"Error during generation: {e}"
         )
 
-# --- V2 Chat Endpoint --- (New)
-@router.post("/chat-v2", response_model=ChatResponseV2)
-def chat_v2(req: ChatRequestV2, request: Request): # Add request: Request
-    app_state = request.app.state # Access app state
-    # Check if model is loaded
+# --- V2 Chat Helpers ---
+def _assign_thread_id(req: ChatRequestV2) -> Optional[str]:
+    """Returns the thread_id this request will be saved under.
+
+    New chat-mode threads get their id up front so the KV cache of the first
+    turn can be stored under the same key the next turn will look up.
+    """
+    if req.thread_id:
+        return req.thread_id
+    return generate_thread_id() if req.mode == 'chat' else None
+
+def _resolve_model(req: ChatRequestV2, app_state) -> Dict[str, Any]:
+    """Returns the model components a v2 request should run on.
+
+    Requests naming a ``model`` are routed to that resident model; others use
+    the active model mirrored in app state. Raises 409 if it is not loaded.
+    """
+    if req.model:
+        manager = getattr(app_state, "model_manager", None)
+        entry = manager.get(req.model) if manager is not None else None
+        if entry is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Model '{req.model}' is not loaded. Load it via /api/v1/model/load/{req.model} first.",
+            )
+        return {
+            "name": entry.name,
+            "model": entry.model,
+            "tokenizer": entry.tokenizer,
+            "device": entry.device,
+            "scheduler": entry.scheduler,
+            "prefix_cache": entry.prefix_cache,
+            "draft": entry.draft,
+        }
+
     if not app_state.model or not app_state.tokenizer:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Model is not loaded. Please load a model first.",
         )
-
-    try:
-        # --- ADDED: Debug received messages --- 
-        print(f"--- Received Request Body (Thread: {req.thread_id or 'New'}) ---")
-        print(f"Mode: {req.mode}")
-        print(f"Message: {req.message}")
-        print(f"Messages: {req.messages}")
-        print("-------------------------------------------")
-        # --- End Debug --- 
-
-        # Retrieve components from app_state
-        current_tokenizer = app_state.tokenizer
-        current_model = app_state.model
-        current_device = app_state.device
-        current_system_prompt = app_state.system_prompt
-        current_temperature = app_state.temperature
-        current_top_p = app_state.top_p
-        current_max_new_tokens = app_state.max_new_tokens
-        if getattr(req, 'mode', None) == 'chat' and (current_max_new_tokens is None or current_max_new_tokens < MIN_NARRATIVE_TOKENS):
-            current_max_new_tokens = MIN_NARRATIVE_TOKENS
-
-        messages_list = [msg.dict() for msg in req.messages] if req.messages else None
-
+    return {
+        "name": getattr(app_state, "model_name", None),
+        "model": app_state.model,
+        "tokenizer": app_state.tokenizer,
+        "device": app_state.device,
+        "scheduler": getattr(app_state, "scheduler", None),
+        "prefix_cache": getattr(app_state, "prefix_cache", None),
+        "draft": getattr(app_state, "draft", None),
+    }
+
+def _resolve_sampling(req: ChatRequestV2, app_state, model=None) -> Dict[str, Any]:
+    """Returns the sampling parameters for a request: its own overrides on top of the server defaults.
+
+    Shared app state is only read, never written, so concurrent requests
+    with different settings cannot affect each other. ``max_new_tokens``
+    never exceeds the context window of ``model`` (see _clamp_max_new_tokens
+    for the final limit once the prompt length is known).
+    """
+    overrides = req.sampling_settings.dict(exclude_none=True) if req.sampling_settings else {}
+    return {
+        "temperature": overrides.get("temperature", app_state.temperature),
+        "top_p": overrides.get("top_p", app_state.top_p),
+        "top_k": overrides.get("top_k", DEFAULT_TOP_K),
+        "max_new_tokens": _clamp_max_new_tokens(model, overrides.get("max_new_tokens", app_state.max_new_tokens)),
+        "stop": overrides.get("stop", []),
+    }
+
+def _clamp_max_new_tokens(model, max_new_tokens: int, prompt_length: int = 0) -> int:
+    """Lowers ``max_new_tokens`` to what fits the model's context window after ``prompt_length`` tokens (at least 1).
+
+    Caches sized from it (e.g. a compiled model's static KV cache) then stay
+    bounded by the model, whatever a request asks for.
+    """
+    length = context_length(model)
+    if length is None:
+        return max_new_tokens
+    return max(1, min(max_new_tokens, length - prompt_length))
+
+def _prepare_v2_generation(req: ChatRequestV2, app_state, thread_id: Optional[str] = None) -> Dict[str, Any]:
+    """Builds the prompt and sampling parameters shared by the blocking and streaming v2 endpoints."""
+    # --- ADDED: Debug received messages --- 
+    print(f"--- Received Request Body (Thread: {req.thread_id or 'New'}) ---")
+    print(f"Mode: {req.mode}")
+    print(f"Message: {req.message}")
+    print(f"Messages: {req.messages}")
+    print("-------------------------------------------")
+    # --- End Debug --- 
+
+    # Retrieve components from app_state (or the model the request names)
+    target = _resolve_model(req, app_state)
+    current_tokenizer = target["tokenizer"]
+    current_system_prompt = req.system_prompt if req.system_prompt is not None else app_state.system_prompt
+    sampling = _resolve_sampling(req, app_state, target["model"])
+
+    messages_list = [msg.dict() for msg in req.messages] if req.messages else None
+
+    # Keep the system prompt and the newest turns that fit beside max_new_tokens in the context window
+    budget = prompt_token_budget(target["model"], sampling["max_new_tokens"])
+    if req.mode == 'chat' and messages_list and budget is not None and settings.context_truncation:
+        current_system_prompt, messages_list, dropped = fit_to_context(
+            current_tokenizer,
+            current_system_prompt,
+            messages_list,
+            budget,
+            summarize=settings.context_summary,
+            summary_max_tokens=settings.context_summary_max_tokens,
+        )
+        if dropped:
+            print(f"   ✂️ Dropped {dropped} earlier message(s) to fit the {budget}-token prompt budget.")
+
+    # Assemble the prompt and its input_ids from cached message segments; unchanged history is not re-tokenized
+    assembled = assemble_prompt(req.mode, current_system_prompt, current_tokenizer, req.message, messages_list)
+    if assembled is not None:
+        prompt, prompt_ids = assembled
+    else:
         # Generate the prompt using the helper function
         prompt = generate_prompt(
             mode=req.mode,
@@ -126,100 +276,163 @@ def chat_v2(req: ChatRequestV2, request: Request): # Add request: Request
             message=req.message,
             messages=messages_list
         )
+        prompt_ids = None
+
+    # Generation stops at the end of the context window: cap max_new_tokens by the room the prompt leaves
+    if context_length(target["model"]) is not None:
+        if prompt_ids is None:
+            prompt_ids = current_tokenizer(prompt)["input_ids"]  # Also spares generation tokenizing it again
+        requested = sampling["max_new_tokens"]
+        sampling["max_new_tokens"] = _clamp_max_new_tokens(target["model"], requested, len(prompt_ids))
+        if sampling["max_new_tokens"] < requested:
+            print(f"   ✂️ max_new_tokens lowered from {requested} to {sampling['max_new_tokens']} to fit the context window.")
+
+    # --- ADDED: Print the generated prompt for debugging ---
+    print(f"--- Prompt for Generation (Thread: {req.thread_id or 'New'}) ---")
+    print(prompt)
+    print("--------------------------------------------------")
+    # --- End Debug Print ---
+
+    return {
+        "model": target["model"],
+        "tokenizer": current_tokenizer,
+        "device": target["device"],
+        "prompt": prompt,
+        "prompt_ids": prompt_ids,
+        "temperature": sampling["temperature"],
+        "top_p": sampling["top_p"],
+        "top_k": sampling["top_k"],
+        "max_new_tokens": sampling["max_new_tokens"],
+        # Defaults, the model's prompt_config.json ones and the request's own; generation halts on any
+        "stop_sequences": resolve_stop_sequences(current_tokenizer, sampling["stop"]),
+        "scheduler": target["scheduler"],
+        "draft": target["draft"],
+        # Only chat mode resends history, so only it benefits from cross-turn cache reuse
+        "kv_cache": getattr(app_state, "kv_cache", None) if req.mode == 'chat' else None,
+        "cache_key": (target["name"], thread_id) if req.mode == 'chat' else None,
+        # The pinned prefix only matches the server's system prompt; per-request overrides prefill normally
+        "prefix_cache": target["prefix_cache"] if current_system_prompt == app_state.system_prompt else None,
+        "system_prompt": current_system_prompt,
+    }
+
+def _persist_chat_history(req: ChatRequestV2, app_state, response_text: str, thread_id: Optional[str] = None) -> Optional[str]:
+    """Saves the exchange for a v2 request and returns the thread_id to report to the client.
+
+    ``thread_id`` is the id assigned by _assign_thread_id (defaults to the
+    request's own). Saving errors are logged rather than raised so a storage
+    problem never fails a chat request; the original thread_id is returned
+    in that case.
+    """
+    new_thread_id = None
+    try:
+        # Prepare messages to save
+        # In instruction mode, history starts with the user message and the response
+        # In chat mode, history includes the *input* messages + the new response
+        messages_to_save = []
+        if req.mode == 'instruction':
+            user_message = {"role": "user", "content": req.message}
+            assistant_message = {"role": "assistant", "content": response_text}
+            messages_to_save = [user_message, assistant_message]
+        elif req.mode == 'chat' and req.messages:
+            # Get the latest user message (should be the last one in the list)
+            last_user_message_obj = req.messages[-1] 
+            if last_user_message_obj.role != 'user':
+                print("Warning: Expected last message in chat history to be from user for saving.", file=sys.stderr)
+                # Decide how to handle this - maybe save only assistant? For now, proceed cautiously.
+                last_user_message_dict = None 
+            else:
+                last_user_message_dict = last_user_message_obj.dict()
 
-        # --- ADDED: Print the generated prompt for debugging ---
-        print(f"--- Prompt for Generation (Thread: {req.thread_id or 'New'}) ---")
-        print(prompt)
-        print("--------------------------------------------------")
-        # --- End Debug Print ---
+            assistant_message = {"role": "assistant", "content": response_text}
+            
+            if req.thread_id:
+                # If continuing a thread, save the last user message AND the new assistant response
+                messages_to_save = []
+                if last_user_message_dict:
+                    messages_to_save.append(last_user_message_dict)
+                messages_to_save.append(assistant_message)
+            else:
+                # If starting a new thread, save all provided input messages + the new response
+                input_message_dicts = [msg.dict() for msg in req.messages] # Includes the last user message
+                messages_to_save = input_message_dicts + [assistant_message]
+        
+        if messages_to_save: # Only save if we have something to save
+            # --- ADDED: Gather the settings this request actually used for saving ---
+            current_settings = _resolve_sampling(req, app_state)
+            current_sys_prompt = req.system_prompt if req.system_prompt is not None else app_state.system_prompt
+            # --- End gather ---
+
+            new_thread_id = save_chat_messages(
+                thread_id or req.thread_id, 
+                messages_to_save,
+                sampling_settings=current_settings,  # <-- Pass settings
+                system_prompt=current_sys_prompt     # <-- Pass system prompt
+            )
+        else:
+             # Should not happen with validation, but handle defensively
+             print("Warning: No messages to save.", file=sys.stderr)
+             new_thread_id = req.thread_id # Return original thread_id if nothing was saved
+
+    except Exception as save_e:
+        # Log the saving error but don't fail the chat request
+        print(f"Error saving chat history: {save_e}", file=sys.stderr)
+        # Keep new_thread_id as None or the original req.thread_id
+        new_thread_id = req.thread_id
+    return new_thread_id
+
+def _sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Formats a single Server-Sent Event frame with a JSON payload."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
 
-        # --- Call Refactored Generation Function ---
-        response_text = generate_response(
-            model=current_model,
-            tokenizer=current_tokenizer,
-            device=current_device,
-            prompt=prompt,
-            temperature=current_temperature,
-            top_p=current_top_p,
-            max_new_tokens=current_max_new_tokens
-        )
+# --- V2 Chat Endpoint --- (New)
+@router.post("/chat-v2", response_model=ChatResponseV2)
+async def chat_v2(req: ChatRequestV2, request: Request, response: Response): # Add request: Request
+    app_state = request.app.state # Access app state
+    # Model availability is checked by _resolve_model (409 if not loaded)
+
+    try:
+        thread_id = _assign_thread_id(req)
+        # Tokenizing, template rendering and history fitting are CPU work: keep them off the event loop
+        generation = await run_in_threadpool(_prepare_v2_generation, req, app_state, thread_id)
+
+        # --- Call Refactored Generation Function (on the inference executor) ---
+        executor = _inference_executor(app_state)
+        try:
+            job = executor.submit(
+                generate_response, client_id=_client_id(request), request_id=_request_id(request),
+                cancel_event=threading.Event(), **generation
+            )
+        except QueueFullError as e:
+            raise _queue_full(e)
+        try:
+            response_text = await _result_unless_disconnected(job, request, executor)
+        except GenerationCancelledError as e:
+            raise HTTPException(status_code=STATUS_CLIENT_CLOSED_REQUEST, detail=str(e))
+        if job.cancelled: # Stopped mid-way: nobody is waiting for a partial answer, so it is not saved
+            raise HTTPException(status_code=STATUS_CLIENT_CLOSED_REQUEST, detail="Generation was cancelled.")
+        response.headers["X-Request-Id"] = job.request_id
+        response.headers["X-Queue-Wait-Ms"] = str(job.queue_wait_ms)
         # --- End Call ---
 
         # Clean the response
         cleaned_response_text = clean_response(response_text)
-        truncated_response_text = truncate_at_stop_token(cleaned_response_text)
+        truncated_response_text = truncate_at_stop_token(cleaned_response_text, generation["stop_sequences"])
 
-        # --- Save Chat History ---
-        new_thread_id = None
-        try:
-            # Prepare messages to save
-            # In instruction mode, history starts with the user message and the response
-            # In chat mode, history includes the *input* messages + the new response
-            messages_to_save = []
-            if req.mode == 'instruction':
-                user_message = {"role": "user", "content": req.message}
-                assistant_message = {"role": "assistant", "content": truncated_response_text}
-                messages_to_save = [user_message, assistant_message]
-            elif req.mode == 'chat' and req.messages:
-                # Get the latest user message (should be the last one in the list)
-                last_user_message_obj = req.messages[-1] 
-                if last_user_message_obj.role != 'user':
-                    print("Warning: Expected last message in chat history to be from user for saving.", file=sys.stderr)
-                    # Decide how to handle this - maybe save only assistant? For now, proceed cautiously.
-                    last_user_message_dict = None 
-                else:
-                    last_user_message_dict = last_user_message_obj.dict()
-
-                assistant_message = {"role": "assistant", "content": truncated_response_text}
-                
-                if req.thread_id:
-                    # If continuing a thread, save the last user message AND the new assistant response
-                    messages_to_save = []
-                    if last_user_message_dict:
-                        messages_to_save.append(last_user_message_dict)
-                    messages_to_save.append(assistant_message)
-                else:
-                    # If starting a new thread, save all provided input messages + the new response
-                    input_message_dicts = [msg.dict() for msg in req.messages] # Includes the last user message
-                    messages_to_save = input_message_dicts + [assistant_message]
-            
-            if messages_to_save: # Only save if we have something to save
-                # --- ADDED: Gather current settings for saving ---
-                current_settings = {
-                    "temperature": app_state.temperature,
-                    "top_p": app_state.top_p,
-                    "max_new_tokens": app_state.max_new_tokens 
-                    # Add any other relevant sampling params stored in app_state here
-                }
-                current_sys_prompt = app_state.system_prompt
-                # --- End gather ---
-
-                new_thread_id = save_chat_messages(
-                    req.thread_id, 
-                    messages_to_save,
-                    sampling_settings=current_settings,  # <-- Pass settings
-                    system_prompt=current_sys_prompt     # <-- Pass system prompt
-                )
-            else:
-                 # Should not happen with validation, but handle defensively
-                 print("Warning: No messages to save.", file=sys.stderr)
-                 new_thread_id = req.thread_id # Return original thread_id if nothing was saved
-
-        except Exception as save_e:
-            # Log the saving error but don't fail the chat request
-            print(f"Error saving chat history: {save_e}", file=sys.stderr)
-            # Keep new_thread_id as None or the original req.thread_id
-            new_thread_id = req.thread_id
-        # --- End Save Chat History ---
+        # --- Save Chat History (may block on storage, so off the event loop) ---
+        new_thread_id = await run_in_threadpool(_persist_chat_history, req, app_state, truncated_response_text, thread_id)
 
         response_data = {
             "response": truncated_response_text,
-            "thread_id": new_thread_id # Include the thread_id in the response
+            "thread_id": new_thread_id, # Include the thread_id in the response
+            "queue_wait_ms": job.queue_wait_ms,
         }
         if req.return_prompt:
-            response_data["raw_prompt"] = prompt
+            response_data["raw_prompt"] = generation["prompt"]
         return response_data
 
+    except HTTPException:
+        raise
     except ValueError as ve: # Catch specific errors from prompt generation or validation
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
     except Exception as e:
@@ -229,14 +442,111 @@ def chat_v2(req: ChatRequestV2, request: Request): # Add request: Request
             detail=f"Error during generation (v2): {e}"
         )
 
+# --- V2 Streaming Chat Endpoint ---
+@router.post("/chat-v2/stream")
+async def chat_v2_stream(req: ChatRequestV2, request: Request):
+    """Streams the v2 chat response as Server-Sent Events.
+
+    Each ``token`` event carries a chunk of cleaned text. The stream ends with
+    a ``done`` event holding the full response, thread_id and queue_wait_ms
+    (history is saved just before it is sent), or an ``error`` event if
+    generation fails. A full generation queue is answered with 429 before
+    the stream starts. The X-Request-Id response header names the
+    generation for DELETE /generation/{request_id}; a cancelled stream ends
+    with a ``cancelled`` event and is not saved. Disconnecting cancels it too.
+    """
+    arrived_at = time.perf_counter()
+    app_state = request.app.state
+    executor = _inference_executor(app_state)
+
+    try:
+        thread_id = _assign_thread_id(req)
+        # Tokenizing, template rendering and history fitting are CPU work: keep them off the event loop
+        generation = await run_in_threadpool(_prepare_v2_generation, req, app_state, thread_id)
+        tokens = executor.stream(
+            stream_response, client_id=_client_id(request), request_id=_request_id(request),
+            cancel_event=threading.Event(), **generation
+        )
+    except QueueFullError as e:
+        raise _queue_full(e)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+
+    async def event_stream():
+        cleaner = StreamingResponseCleaner(generation["stop_sequences"])
+        ended = False
+        first_token = True
+        try:
+            async for chunk in tokens:
+                text = cleaner.feed(chunk)
+                if text:
+                    if first_token:
+                        TIME_TO_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - arrived_at)
+                        first_token = False
+                    yield _sse_event({"token": text}, event="token")
+            ended = True
+            text = cleaner.finish()
+            if text:
+                yield _sse_event({"token": text}, event="token")
+        except GenerationCancelledError:
+            ended = True # Reported below like a generation stopped mid-way
+        except Exception as e:
+            ended = True
+            print(f"Error during streamed chat generation (v2): {e}", file=sys.stderr)
+            yield _sse_event({"detail": f"Error during generation (v2): {e}"}, event="error")
+            return
+        finally:
+            if not ended: # The client disconnected mid-stream (the response task was cancelled)
+                print(f"Client disconnected; cancelling generation {tokens.job.request_id}.")
+                executor.cancel(tokens.job.request_id)
+        if tokens.job.cancelled:
+            yield _sse_event({"request_id": tokens.job.request_id}, event="cancelled")
+            return
+
+        response_text = cleaner.text
+        new_thread_id = await run_in_threadpool(_persist_chat_history, req, app_state, response_text, thread_id)
+        done_data = {"response": response_text, "thread_id": new_thread_id, "queue_wait_ms": tokens.job.queue_wait_ms}
+        if req.return_prompt:
+            done_data["raw_prompt"] = generation["prompt"]
+        yield _sse_event(done_data, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Request-Id": tokens.job.request_id},
+    )
+
+@router.delete("/generation/{request_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_generation(request_id: str, request: Request):
+    """Cancels a queued or running chat-v2 generation by its X-Request-Id; 404 if none is in progress."""
+    if not _inference_executor(request.app.state).cancel(request_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No generation in progress with request id '{request_id}'.",
+        )
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
 # --- Session Management Endpoints --- ADDED
 
 @router.get("/sessions", response_model=List[Dict[str, Any]])
-def get_saved_sessions():
-    """Lists all saved chat sessions with metadata and title."""
+def get_saved_sessions(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+):
+    """Lists saved chat sessions with metadata and title, most recent first.
+
+    Without ``limit`` every session is returned. With it, at most ``limit``
+    are returned and, if more remain, the ``X-Next-Cursor`` response header
+    holds the ``cursor`` to pass for the next page.
+    """
     try:
-        sessions = list_sessions()
+        sessions, next_cursor = list_sessions_page(limit, cursor)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         return sessions
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         print(f"Error listing sessions: {e}", file=sys.stderr)
         raise HTTPException(
@@ -244,10 +554,32 @@ def get_saved_sessions():
             detail="Failed to retrieve saved sessions"
         )
 
+@router.get("/search", response_model=Dict[str, Any])
+def search_saved_sessions(q: str = Query(..., min_length=1, max_length=500), limit: int = Query(20, ge=1, le=100)):
+    """Full-text search over saved chats (message content and titles).
+
+    Returns the matching sessions ranked best first, each with a snippet of
+    its best hit (matched words in [brackets]) and the index of that message.
+    """
+    try:
+        return {"query": q, "results": search_sessions(q, limit)}
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        print(f"Error searching sessions: {e}", file=sys.stderr)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to search saved sessions"
+        )
+
 @router.get("/session/{thread_id}", response_model=Dict[str, Any])
-def get_specific_session(thread_id: str, request: Request): # <-- Added request: Request
-    """Loads a specific chat session by its thread_id and updates app state."""
-    app_state = request.app.state # <-- Added access to app_state
+def get_specific_session(thread_id: str):
+    """Loads a specific chat session by its thread_id.
+
+    The session's saved ``sampling_settings`` and ``system_prompt`` are
+    returned for the client to send with its next requests; server-wide
+    defaults are left untouched.
+    """
     try:
         session_data = get_session(thread_id)
         if session_data is None:
@@ -256,26 +588,6 @@ def get_specific_session(thread_id: str, request: Request): # <-- Added request:
                 detail=f"Session with ID '{thread_id}' not found."
             )
         
-        # --- ADDED: Update app_state with loaded settings --- 
-        loaded_settings = session_data.get("sampling_settings")
-        loaded_prompt = session_data.get("system_prompt")
-
-        if loaded_settings is not None and isinstance(loaded_settings, dict):
-            app_state.temperature = loaded_settings.get("temperature", app_state.temperature) # Keep old value if missing
-            app_state.top_p = loaded_settings.get("top_p", app_state.top_p)
-            app_state.max_new_tokens = loaded_settings.get("max_new_tokens", app_state.max_new_tokens)
-            # Update any other settings similarly
-            print(f"Loaded settings for thread {thread_id}: Temp={app_state.temperature}, TopP={app_state.top_p}, MaxTokens={app_state.max_new_tokens}")
-        else:
-            print(f"No valid sampling_settings found in thread {thread_id}, keeping current app state values.")
-
-        if loaded_prompt is not None:
-            app_state.system_prompt = loaded_prompt
-            print(f"Loaded system prompt for thread {thread_id}")
-        else:
-            print(f"No system_prompt found in thread {thread_id}, keeping current app state value.")
-        # --- End Update ---
-        
         # Ensure custom_title is included in the response (get_session already does this)
         return session_data # Return the full session data as before
     except ValueError: # Catch invalid thread_id from get_session
@@ -330,10 +642,14 @@ def rename_specific_session(thread_id: str, req: RenameSessionRequest):
 
 # --- MODIFIED: Endpoint to Delete a Session (Uses history_manager) ---
 @router.delete("/session/{thread_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_specific_session(thread_id: str):
+def delete_specific_session(thread_id: str, request: Request):
     """Deletes a specific chat session file by its thread_id using the history manager."""
     try:
         deleted = delete_session(thread_id)
+        kv_cache = getattr(request.app.state, "kv_cache", None)
+        if kv_cache is not None:
+            # Free the cached KV state of the deleted thread (for every model)
+            kv_cache.discard_matching(lambda key: isinstance(key, tuple) and key[-1] == thread_id)
         if not deleted:
             # delete_session returns False if file not found or if deletion fails
             # We need to check if the file existed before attempting deletion
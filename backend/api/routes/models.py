@@ -76,17 +76,25 @@ async def get_huggingface_token_status():
 
 
 @router.get("/status", response_model=ModelStatusResponse)
-def get_model_status(request: Request):
+async def get_model_status(request: Request):
     """Checks if a model is currently loaded and returns its status."""
     app_state = request.app.state
+    manager = getattr(app_state, "model_manager", None)
+    resident = [m["name"] for m in manager.loaded()] if manager is not None else []
+    entry = manager.active if manager is not None else None
     if app_state.model and app_state.tokenizer:
         return {
             "loaded": True,
+            "ready": entry.ready if entry else True,
+            "warmup_status": entry.warmup_status if entry else None,
+            "compiled": entry.compiled if entry else False,
             "path": app_state.model_path,
-            "device": app_state.device
+            "device": app_state.device,
+            "name": getattr(app_state, "model_name", None),
+            "resident_models": resident,
         }
     else:
-        return {"loaded": False}
+        return {"loaded": False, "resident_models": resident}
 
 
 @router.get("/search", response_model=List[ModelSearchResult])
@@ -1,8 +1,21 @@
 from fastapi import APIRouter, HTTPException, status, Request
+from ..schemas.chat import MAX_NEW_TOKENS
 from ..schemas.common import ModelSettings, SettingsUpdateResponse
 
 router = APIRouter()
 
+def _refresh_prefix_cache(app_state) -> None:
+    """Re-pins the system prompt prefix cache after the system prompt changed."""
+    prefix_cache = getattr(app_state, "prefix_cache", None)
+    if prefix_cache is None:
+        return
+    prefix_cache.invalidate()
+    if getattr(app_state, "model", None) is not None and getattr(app_state, "tokenizer", None) is not None:
+        try:
+            prefix_cache.refresh(app_state.model, app_state.tokenizer, app_state.system_prompt)
+        except Exception as e:
+            print(f"⚠️ Could not precompute system prompt cache: {e}")
+
 @router.post("/update", response_model=SettingsUpdateResponse)
 def update_generation_settings(settings: ModelSettings, request: Request):
     """Update generation parameters stored in application state."""
@@ -13,6 +26,7 @@ def update_generation_settings(settings: ModelSettings, request: Request):
         app_state.system_prompt = settings.system_prompt
         updated_settings["system_prompt"] = app_state.system_prompt
         print(f"🔄 System prompt updated to: '{app_state.system_prompt}'")
+        _refresh_prefix_cache(app_state)
     if settings.temperature is not None:
         if not (0 < settings.temperature <= 2.0): # Allow slightly higher temp range
             raise HTTPException(status_code=400, detail="Temperature must be between 0 (exclusive) and 2.0 (inclusive).")
@@ -26,8 +40,8 @@ def update_generation_settings(settings: ModelSettings, request: Request):
         updated_settings["top_p"] = app_state.top_p
         print(f"🔄 Top P updated to: {app_state.top_p}")
     if settings.max_new_tokens is not None:
-        if settings.max_new_tokens <= 0:
-            raise HTTPException(status_code=400, detail="Max new tokens must be positive.")
+        if not (0 < settings.max_new_tokens <= MAX_NEW_TOKENS):
+            raise HTTPException(status_code=400, detail=f"Max new tokens must be between 1 and {MAX_NEW_TOKENS}.")
         app_state.max_new_tokens = settings.max_new_tokens
         updated_settings["max_new_tokens"] = app_state.max_new_tokens
         print(f"🔄 Max new tokens updated to: {app_state.max_new_tokens}")
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from backend.api.core.gpu_check import get_device_status
 from backend.api.core.settings_manager import get_precision, set_precision, VALID_PRECISIONS
+from backend.api.core.history_manager import write_queue_stats
+from backend.api.core.context_window import token_count_stats
+from backend.api.core.prompt_cache import prompt_cache_stats
+from backend.api.core.quantization import estimate_precision_footprints, memory_breakdown, precision_unavailable_reason
 
 router = APIRouter()
 
@@ -12,7 +16,7 @@ def read_device_status():
 
 @router.get("/get_precision", tags=["System"])
 def read_precision():
-    """Returns the current global precision setting (fp32 or fp16)."""
+    """Returns the current global precision setting (e.g. fp32, fp16, bf16, int8_dynamic, int8, int4)."""
     return {"current_precision": get_precision()}
 
 class PrecisionRequest(BaseModel):
@@ -20,8 +24,56 @@ class PrecisionRequest(BaseModel):
 
 @router.post("/set_precision", tags=["System"])
 def update_precision(req: PrecisionRequest):
-    """Sets the global precision setting. Accepts 'fp32' or 'fp16'."""
+    """Sets the global precision used for the next model load.
+
+    Accepts 'fp32', 'fp16', 'bf16', 'int8_dynamic' (CPU Linear layers), and
+    'int8' / 'int4' (weight-only, requires bitsandbytes and CUDA).
+    """
     if req.precision not in VALID_PRECISIONS:
         raise HTTPException(status_code=400, detail=f"Invalid precision '{req.precision}'. Must be one of {VALID_PRECISIONS}.")
+    unavailable = precision_unavailable_reason(req.precision)
+    if unavailable:
+        raise HTTPException(status_code=400, detail=unavailable)
     set_precision(req.precision)
-    return {"status": "ok", "new_precision": get_precision()}
\ No newline at end of file
+    return {"status": "ok", "new_precision": get_precision()}
+
+@router.get("/memory_footprint", tags=["System"])
+def read_memory_footprint(request: Request):
+    """Reports the memory of each resident model by dtype, plus estimates for every precision mode."""
+    gb = 1024**3
+    manager = getattr(request.app.state, "model_manager", None)
+    models = []
+    for entry in (manager.entries() if manager else []):
+        if entry.model is None:
+            continue
+        breakdown = memory_breakdown(entry.model)
+        estimates = estimate_precision_footprints(entry.model)
+        models.append({
+            "name": entry.name,
+            "precision": entry.precision,
+            "device": entry.device,
+            "memory_gb": round(entry.memory_bytes / gb, 3),
+            "bytes_by_dtype": breakdown,
+            "estimated_bytes_by_precision": {
+                mode: {"weights_bytes": n, "available": precision_unavailable_reason(mode) is None}
+                for mode, n in estimates.items()
+            },
+        })
+    return {"current_precision": get_precision(), "models": models}
+
+
+@router.get("/history_queue", tags=["System"])
+def read_history_queue():
+    """Reports the depth and counters of the background chat history writer."""
+    return write_queue_stats()
+
+@router.get("/inference_queue", tags=["System"])
+async def read_inference_queue(request: Request):
+    """Reports the inference executor's workers and how many generations are queued and running."""
+    executor = getattr(request.app.state, "inference_executor", None)
+    return executor.stats() if executor is not None else {"workers": 0, "queued": 0, "running": 0, "completed": 0}
+
+@router.get("/prompt_cache", tags=["System"])
+def read_prompt_cache():
+    """Reports the tokenized message segment cache and the fallback token count cache."""
+    return {"segments": prompt_cache_stats(), "token_counts": token_count_stats()}
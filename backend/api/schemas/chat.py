@@ -16,12 +16,26 @@ class MessageV2(BaseModel):
     role: str = Field(..., pattern="^(user|assistant|system)$")
     content: str
 
+# Most tokens a request may ask for; generation is further clamped to what fits the model's context window
+MAX_NEW_TOKENS = 32768
+
+class SamplingSettings(BaseModel):
+    """Per-request generation parameters; unset fields fall back to the server defaults."""
+    temperature: Optional[float] = Field(None, gt=0, le=2.0)
+    top_p: Optional[float] = Field(None, gt=0, le=1.0)
+    top_k: Optional[int] = Field(None, ge=0)  # 0 disables top-k filtering
+    max_new_tokens: Optional[int] = Field(None, gt=0, le=MAX_NEW_TOKENS)
+    stop: Optional[List[str]] = None  # Extra stop sequences; generation ends when one is produced
+
 class ChatRequestV2(BaseModel):
     mode: str = Field(..., pattern="^(instruction|chat)$")
     message: Optional[str] = None
     messages: Optional[List[MessageV2]] = None
     thread_id: Optional[str] = None
     return_prompt: Optional[bool] = False
+    model: Optional[str] = None  # Name of a resident model; defaults to the active one
+    sampling_settings: Optional[SamplingSettings] = None
+    system_prompt: Optional[str] = None  # Overrides the server's system prompt for this request only
 
     @field_validator('message', mode='before')
     @classmethod
@@ -55,4 +69,5 @@ class ChatRequestV2(BaseModel):
 class ChatResponseV2(BaseModel):
     response: str
     thread_id: Optional[str] = None
-    raw_prompt: Optional[str] = None
\ No newline at end of file
+    raw_prompt: Optional[str] = None
+    queue_wait_ms: Optional[float] = None  # Time spent waiting for an inference worker
\ No newline at end of file
@@ -1,10 +1,11 @@
-from typing import Optional, Dict, Union
+from typing import Optional, Dict, List, Union
 from pydantic import BaseModel, Field
 
 # --- General (non-chat) API Schemas ---
 
 class LoadModelRequest(BaseModel):
     path: str = Field(..., description="Absolute or relative path to the model directory.")
+    background: bool = Field(False, description="Load in the background and return a job id to poll instead of waiting.")
 
 class LoadModelResponse(BaseModel):
     message: str
@@ -15,6 +16,11 @@ class ModelStatusResponse(BaseModel):
     loaded: bool
     path: Optional[str] = None
     device: Optional[str] = None
+    name: Optional[str] = None
+    ready: bool = False  # Loaded and warm (or warmup disabled); safe to route traffic here
+    warmup_status: Optional[str] = None
+    compiled: bool = False
+    resident_models: List[str] = []
 
 class ModelSettings(BaseModel):
     system_prompt: Optional[str] = None
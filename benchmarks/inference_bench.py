@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""Reproducible inference benchmark for release gating and regression comparison.
+
+Runs a matrix of prompt lengths x output lengths x concurrency levels (x
+precisions x devices) and reports, per case, time to first token, end-to-end
+latency percentiles, tokens/sec and peak memory as JSON.
+
+Two targets:
+
+- ``direct`` loads the model with load_model_internal (so precision and
+  quantization behave as in the server) and calls generate_response in
+  process, timing each request's first token and decode steps with its
+  own StepTimer. With ``--draft`` it decodes speculatively with that
+  draft model and also reports the draft acceptance rate.
+- ``http`` drives a running server through /api/v1/chat/chat-v2/stream.
+
+It runs on a CPU-only box with the tiny model from benchmarks/tiny_model.py:
+
+    python -m benchmarks.tiny_model backend/models/tiny
+    python -m benchmarks.inference_bench --model backend/models/tiny --output bench.json
+    python -m benchmarks.inference_bench --model backend/models/tiny --baseline bench.json
+
+With ``--baseline`` the exit status is 1 when any case regressed by more
+than ``--tolerance``.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)  # Allow `python benchmarks/inference_bench.py` as well as -m
+
+from benchmarks.stats import PeakMemory, compare, environment, summarize, write_report
+
+FILLER = "The quick brown fox jumps over the lazy dog while the river keeps running to the sea. "
+
+
+def int_list(text: str) -> List[int]:
+    return [int(part) for part in text.split(",") if part.strip()]
+
+
+def str_list(text: str) -> List[str]:
+    return [part.strip() for part in text.split(",") if part.strip()]
+
+
+def synthetic_prompt(tokenizer, n_tokens: int) -> str:
+    """Filler text that tokenizes to ``n_tokens`` tokens (as closely as the tokenizer allows)."""
+    ids: List[int] = []
+    repeats = 1
+    while len(ids) < n_tokens:
+        ids = tokenizer(FILLER * repeats, add_special_tokens=False)["input_ids"]
+        repeats *= 2
+    return tokenizer.decode(ids[:n_tokens], skip_special_tokens=True)
+
+
+def case_report(target, precision, device, prompt_tokens, output_tokens, concurrency, samples, wall_seconds, peak) -> Dict[str, Any]:
+    """Aggregates the per-request samples of one case."""
+    generated = sum(s["tokens"] for s in samples)
+    drafted = sum(s.get("drafted", 0) for s in samples)
+    decode_rates = [
+        (s["tokens"] - 1) / (s["last"] - s["first"]) for s in samples
+        if s["first"] is not None and s["tokens"] > 1 and s["last"] > s["first"]
+    ]
+    return {
+        "target": target,
+        "precision": precision,
+        "device": device,
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if s.get("error")),
+        "generated_tokens": generated,
+        "ttft_ms": summarize([(s["first"] - s["start"]) * 1000 for s in samples if s["first"] is not None]),
+        "latency_ms": summarize([(s["end"] - s["start"]) * 1000 for s in samples]),
+        # Aggregate throughput of the case and the decode speed a single request sees
+        "tokens_per_second": round(generated / wall_seconds, 2) if wall_seconds else None,
+        "per_request_decode_tokens_per_second": summarize(decode_rates),
+        "peak_memory_bytes": peak,
+        # Speculative decoding only: share of drafted tokens the model accepted
+        "acceptance_rate": round(sum(s["tokens"] - s["steps"] for s in samples) / drafted, 4) if drafted else None,
+    }
+
+
+# --- In-process target ---
+def load_direct(model_path: str, precision: str, device: str):
+    """Loads the model the way the server does, with ``precision``, then places it on ``device``."""
+    import torch
+    from backend.api.core.config import settings
+    from backend.api.core.model_loader import load_model_internal
+
+    if device == "cuda" and not torch.cuda.is_available():
+        raise RuntimeError("CUDA is not available on this machine.")
+    object.__setattr__(settings, "model_precision", precision)  # Runtime-only, like settings_manager.set_precision
+    tokenizer, model, loaded_device = load_model_internal(model_path)
+    if loaded_device != device:
+        model.to(device)
+    return tokenizer, model
+
+
+def run_direct_case(model, tokenizer, device, prompt, output_tokens, concurrency, requests, batching, seed, draft=None) -> List[Dict[str, Any]]:
+    import torch
+    from backend.api.core.inference import generate_response
+    from backend.api.core.metrics import StepTimer
+    from backend.api.core.scheduler import InferenceScheduler
+
+    torch.manual_seed(seed)
+    scheduler = None
+    if batching:
+        scheduler = InferenceScheduler(model, tokenizer, device, max_batch_size=concurrency)
+        scheduler.eos_token_ids = set()  # Fixed output length, as min_new_tokens does for generate
+        scheduler.start()
+    pending = list(range(requests))
+    lock = threading.Lock()
+    samples: List[Dict[str, Any]] = []
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                pending.pop()
+            timer = StepTimer()
+            sample = {"start": timer.started_at}
+            try:
+                generate_response(
+                    model=model, tokenizer=tokenizer, device=device, prompt=prompt, temperature=1.0, top_p=1.0,
+                    max_new_tokens=output_tokens, scheduler=scheduler, draft=draft, step_timer=timer,
+                )
+            except Exception as e:
+                sample["error"] = str(e)
+            sample.update(end=time.perf_counter(), first=timer.first_token_at, last=timer.last_step_at,
+                          tokens=timer.tokens, steps=timer.steps, drafted=timer.drafted_tokens)
+            with lock:
+                samples.append(sample)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if scheduler is not None:
+            scheduler.stop()
+    return samples
+
+
+def bench_direct(args) -> List[Dict[str, Any]]:
+    import torch
+    from backend.api.core.speculative import DraftModel
+
+    results = []
+    for precision in args.precisions:
+        for device in args.devices:
+            print(f"⏳ Loading {args.model} ({precision}, {device})...")
+            try:
+                tokenizer, model = load_direct(args.model, precision, device)
+            except Exception as e:
+                print(f"   ⚠️ Skipping {precision}/{device}: {e}")
+                results.append({"target": "direct", "precision": precision, "device": device, "skipped": str(e)})
+                continue
+            draft = None
+            if args.draft:
+                draft_tokenizer, draft_model = load_direct(args.draft, precision, device)
+                draft = DraftModel(args.draft, draft_tokenizer, draft_model, device, args.draft_tokens)
+            for prompt_tokens in args.prompt_tokens:
+                prompt = synthetic_prompt(tokenizer, prompt_tokens)
+                for output_tokens in args.output_tokens:
+                    # Every request produces exactly output_tokens tokens, so runs stay comparable
+                    model.generation_config.min_new_tokens = output_tokens
+                    for concurrency in args.concurrency:
+                        if args.warmup:
+                            run_direct_case(model, tokenizer, device, prompt, output_tokens, concurrency,
+                                            args.warmup, args.batching, args.seed, draft)
+                        requests = args.requests or concurrency * 4
+                        with PeakMemory(device) as peak:
+                            start = time.perf_counter()
+                            samples = run_direct_case(model, tokenizer, device, prompt, output_tokens, concurrency,
+                                                      requests, args.batching, args.seed, draft)
+                            wall = time.perf_counter() - start
+                        case = case_report("direct", precision, device, prompt_tokens, output_tokens, concurrency,
+                                           samples, wall, peak.peak)
+                        case["draft"] = args.draft
+                        print_case(case)
+                        results.append(case)
+            model.generation_config.min_new_tokens = None
+            del model, tokenizer, draft
+            gc.collect()
+            if device == "cuda":
+                torch.cuda.empty_cache()
+    return results
+
+
+# --- HTTP target ---
+async def http_request(client, url: str, message: str, output_tokens: int, tokenizer) -> Dict[str, Any]:
+    sample = {"start": time.perf_counter(), "first": None, "last": None, "tokens": 0}
+    body = {"mode": "instruction", "message": message, "sampling_settings": {"max_new_tokens": output_tokens}}
+    response_text = ""
+    try:
+        async with client.stream("POST", f"{url}/api/v1/chat/chat-v2/stream", json=body) as response:
+            if response.status_code != 200:
+                sample["error"] = f"HTTP {response.status_code}"
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "token":
+                        sample["last"] = time.perf_counter()
+                        sample["first"] = sample["first"] or sample["last"]
+                    elif event == "done":
+                        response_text = data.get("response", "")
+                    elif event in ("error", "cancelled"):
+                        sample["error"] = data.get("detail", event)
+    except Exception as e:
+        sample["error"] = str(e)
+    sample["end"] = time.perf_counter()
+    sample["tokens"] = len(tokenizer(response_text, add_special_tokens=False)["input_ids"])
+    return sample
+
+
+async def run_http_case(url, message, output_tokens, concurrency, requests, tokenizer, timeout) -> List[Dict[str, Any]]:
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        async def one():
+            async with semaphore:
+                return await http_request(client, url, message, output_tokens, tokenizer)
+
+        return await asyncio.gather(*(one() for _ in range(requests)))
+
+
+def bench_http(args) -> List[Dict[str, Any]]:
+    import httpx
+    from transformers import AutoTokenizer
+
+    from backend.api.core.model_loader import resolve_model_path
+
+    # The tokenizer builds prompts of the requested length and counts generated tokens
+    tokenizer = AutoTokenizer.from_pretrained(resolve_model_path(args.model), local_files_only=True)
+    model_name = os.path.basename(os.path.normpath(args.model))
+    device = httpx.get(f"{args.url}/api/v1/system/device", timeout=args.timeout).json().get("device", "server")
+    results = []
+    for precision in args.precisions:
+        print(f"⏳ Loading '{model_name}' on {args.url} ({precision})...")
+        response = httpx.post(f"{args.url}/api/v1/system/set_precision", json={"precision": precision}, timeout=args.timeout)
+        if response.status_code == 200:
+            response = httpx.post(f"{args.url}/api/v1/model/load/{model_name}", timeout=None)
+        if response.status_code != 200:
+            print(f"   ⚠️ Skipping {precision}: {response.text}")
+            results.append({"target": "http", "precision": precision, "device": device, "skipped": response.text})
+            continue
+        for prompt_tokens in args.prompt_tokens:
+            message = synthetic_prompt(tokenizer, prompt_tokens)
+            for output_tokens in args.output_tokens:
+                for concurrency in args.concurrency:
+                    if args.warmup:
+                        asyncio.run(run_http_case(args.url, message, output_tokens, concurrency, args.warmup,
+                                                  tokenizer, args.timeout))
+                    requests = args.requests or concurrency * 4
+                    start = time.perf_counter()
+                    samples = asyncio.run(run_http_case(args.url, message, output_tokens, concurrency, requests,
+                                                        tokenizer, args.timeout))
+                    wall = time.perf_counter() - start
+                    # Peak memory is the server's concern here; see its /metrics and /api/v1/vram
+                    case = case_report("http", precision, device, prompt_tokens, output_tokens, concurrency,
+                                       samples, wall, None)
+                    print_case(case)
+                    results.append(case)
+    return results
+
+
+def print_case(case: Dict[str, Any]) -> None:
+    print(
+        f"   {case['precision']:>12} {case['device']:>5} prompt={case['prompt_tokens']:<5} "
+        f"output={case['output_tokens']:<5} c={case['concurrency']:<3} "
+        f"ttft p50={case['ttft_ms']['p50']}ms latency p50/p95/p99={case['latency_ms']['p50']}/"
+        f"{case['latency_ms']['p95']}/{case['latency_ms']['p99']}ms {case['tokens_per_second']} tok/s"
+        + (f" acceptance={case['acceptance_rate']}" if case.get("acceptance_rate") is not None else "")
+        + (f" ({case['errors']} errors)" if case["errors"] else "")
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Benchmark inference (in process or over HTTP) and report latency, throughput and memory as JSON."
+    )
+    parser.add_argument("--target", choices=["direct", "http"], default="direct")
+    parser.add_argument("--model", required=True,
+                        help="Model directory relative to the project root (e.g. backend/models/tiny)")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server URL for --target http")
+    parser.add_argument("--prompt-tokens", type=int_list, default=[32, 256], help="Comma-separated prompt lengths")
+    parser.add_argument("--output-tokens", type=int_list, default=[16, 64], help="Comma-separated output lengths")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4], help="Comma-separated concurrency levels")
+    parser.add_argument("--precisions", type=str_list, default=["fp32"], help="Comma-separated precisions")
+    parser.add_argument("--devices", type=str_list, default=["cpu"], help="Comma-separated devices (direct only)")
+    parser.add_argument("--requests", type=int, default=None, help="Requests per case (default: 4 x concurrency)")
+    parser.add_argument("--warmup", type=int, default=1, help="Warm-up requests per case, not measured")
+    parser.add_argument("--batching", action="store_true", help="Use the continuous batching scheduler (direct only)")
+    parser.add_argument("--draft", help="Draft model directory for speculative decoding (direct only, not with --batching)")
+    parser.add_argument("--draft-tokens", type=int, default=5, help="Tokens the draft proposes per step to start with")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300.0, help="HTTP timeout in seconds")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed relative regression against --baseline (default 0.15)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    results = bench_direct(args) if args.target == "direct" else bench_http(args)
+    report = {"environment": environment(), "arguments": vars(args), "results": results}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        report["regressions"] = compare(
+            [r for r in results if "skipped" not in r], [r for r in baseline if "skipped" not in r], args.tolerance
+        )
+    write_report(report, args.output)
+    if report.get("regressions"):
+        print(f"❌ {len(report['regressions'])} regression(s) beyond {args.tolerance:.0%}:", file=sys.stderr)
+        for line in report["regressions"]:
+            print(f"   {line}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""HTTP load generator and latency SLO benchmark for the FastAPI server.
+
+Scripted multi-turn conversations arrive open-loop (Poisson arrivals at a
+fixed rate, independent of how fast the server answers), so queueing shows
+up as latency instead of silently lowering the offered load. Each
+conversation sends ``--turns`` chat-v2 requests in chat mode, re-reads its
+session after a turn with probability ``--read-ratio`` and lists sessions
+once at the end. Sweeping ``--rates`` gives a throughput-vs-latency curve
+per endpoint.
+
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --rates 0.5,1,2
+    python -m benchmarks.load_test --stub --rates 5,10,20,40 --slo-p95-ms 500
+
+``--stub`` starts the app in process, loads the model named by ``--model``
+through the API as usual and then replaces generate_response with a fake
+that sleeps ``--stub-prefill-ms`` + ``--stub-token-ms`` per token. This keeps
+the model's cost fixed and known, so what remains is API, queueing and
+history overhead. Stub runs write history to a temporary directory,
+never to saved_chats.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)  # Allow `python benchmarks/load_test.py` as well as -m
+
+from benchmarks.stats import environment, summarize, write_report
+
+USER_TURNS = [
+    "Can you explain how a hash map handles collisions?",
+    "What changes if the load factor gets too high?",
+    "Show me a short example in Python.",
+    "How would you test that?",
+    "Summarize the trade-offs in two sentences.",
+]
+
+
+def log(message: str) -> None:
+    # Progress goes to stderr so stdout stays clean for the JSON report (and stub server output is muted)
+    print(message, file=sys.__stderr__, flush=True)
+
+
+def float_list(text: str) -> List[float]:
+    return [float(part) for part in text.split(",") if part.strip()]
+
+
+class Recorder:
+    """Latency samples and outcomes per endpoint for one arrival rate."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.completed = 0
+
+    async def call(self, client, endpoint: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            outcome = str(response.status_code)
+        except Exception as e:
+            response, outcome = None, type(e).__name__
+        self.statuses[endpoint][outcome] += 1
+        if response is not None and response.status_code < 400:
+            self.latencies[endpoint].append((time.perf_counter() - start) * 1000)
+            self.completed += 1
+        return response
+
+
+async def conversation(client, base_url: str, args, recorder: Recorder, rng: random.Random) -> None:
+    """One scripted multi-turn chat, followed by a session listing."""
+    messages: List[Dict[str, str]] = []
+    thread_id: Optional[str] = None
+    for turn in range(args.turns):
+        messages.append({"role": "user", "content": USER_TURNS[turn % len(USER_TURNS)]})
+        body = {"mode": "chat", "messages": messages, "sampling_settings": {"max_new_tokens": args.max_new_tokens}}
+        if thread_id:
+            body["thread_id"] = thread_id
+        response = await recorder.call(client, "chat-v2", "POST", f"{base_url}/api/v1/chat/chat-v2", json=body)
+        if response is None or response.status_code != 200:
+            return  # A rejected or failed turn ends the conversation, as it would for a user
+        data = response.json()
+        thread_id = data.get("thread_id") or thread_id
+        messages.append({"role": "assistant", "content": data["response"]})
+        if thread_id and rng.random() < args.read_ratio:
+            await recorder.call(client, "session", "GET", f"{base_url}/api/v1/chat/session/{thread_id}")
+        if args.think_ms:
+            await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+    await recorder.call(client, "sessions", "GET", f"{base_url}/api/v1/chat/sessions", params={"limit": 20})
+
+
+async def run_rate(base_url: str, rate: float, args, seed: int) -> Dict[str, Any]:
+    """Starts conversations at ``rate`` per second for ``--duration`` seconds and measures the outcome."""
+    import httpx
+
+    rng = random.Random(seed)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        tasks = []
+        start = time.perf_counter()
+        next_arrival = start
+        while next_arrival < start + args.duration:
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            tasks.append(asyncio.create_task(conversation(client, base_url, args, recorder, random.Random(rng.random()))))
+            next_arrival += rng.expovariate(rate)
+        _, unfinished = await asyncio.wait(tasks, timeout=args.drain_timeout) if tasks else (None, [])
+        for task in unfinished:
+            task.cancel()
+        elapsed = time.perf_counter() - start
+
+    endpoints = {
+        endpoint: {
+            "completed": len(recorder.latencies[endpoint]),
+            "throughput_rps": round(len(recorder.latencies[endpoint]) / elapsed, 2) if elapsed else None,
+            "statuses": dict(recorder.statuses[endpoint]),
+            "latency_ms": summarize(recorder.latencies[endpoint]),
+        }
+        for endpoint in sorted(recorder.statuses)
+    }
+    return {
+        "arrival_rate": rate,
+        "conversations": len(tasks),
+        "unfinished_conversations": len(unfinished),
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(recorder.completed / elapsed, 2) if elapsed else None,
+        "endpoints": endpoints,
+    }
+
+
+# --- Stub model mode ---
+def stub_generation(prefill_ms: float, token_ms: float, reply_tokens: int):
+    """A generate_response / stream_response pair that only spends the configured time."""
+
+    def tokens_for(max_new_tokens: int) -> int:
+        return max(1, min(reply_tokens, max_new_tokens))
+
+    def generate_response(*, max_new_tokens: int, cancel_event=None, **kwargs) -> str:
+        n = tokens_for(max_new_tokens)
+        time.sleep((prefill_ms + token_ms * n) / 1000)
+        return " ".join(["lorem"] * n)
+
+    def stream_response(*, max_new_tokens: int, cancel_event=None, **kwargs):
+        time.sleep(prefill_ms / 1000)
+        for _ in range(tokens_for(max_new_tokens)):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            time.sleep(token_ms / 1000)
+            yield "lorem "
+
+    return generate_response, stream_response
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def stub_server(args):
+    """Runs the app in process on a free port with a fake model and a throwaway history store."""
+    import httpx
+    import uvicorn
+    from unittest.mock import patch
+
+    from backend.api.core import history_manager
+    from backend.api.core.config import settings
+    from backend.api.main import app
+
+    history_dir = tempfile.mkdtemp(prefix="sigil-loadtest-")
+    history_manager.set_backend(history_manager.create_backend(
+        args.history_backend, history_dir=history_dir, db_path=os.path.join(history_dir, "history.sqlite3")
+    ))
+    if settings.chat_search_enabled:
+        # Opened here on the throwaway store; the app's lifespan then reuses this index
+        history_manager.enable_search(os.path.join(history_dir, "search.sqlite3"))
+    generate, stream = stub_generation(args.stub_prefill_ms, args.stub_token_ms, args.stub_tokens)
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="load-test-server", daemon=True)
+    base_url = f"http://127.0.0.1:{port}"
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+            patch("backend.api.routes.chat.generate_response", generate), \
+            patch("backend.api.routes.chat.stream_response", stream):
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+        response = httpx.post(f"{base_url}/api/v1/model/load/{args.model}", timeout=None)
+        if response.status_code != 200:
+            raise RuntimeError(f"Could not load '{args.model}' for the stub server: {response.text}")
+        log(f"Stub server on {base_url} (history: {args.history_backend} in {history_dir})")
+        try:
+            yield base_url
+        finally:
+            server.should_exit = True
+            thread.join()
+
+
+def curve(results: List[Dict[str, Any]], endpoint: str) -> List[Dict[str, Any]]:
+    """Throughput vs latency of one endpoint across the arrival rates."""
+    points = []
+    for result in results:
+        stats = result["endpoints"].get(endpoint)
+        if stats is None:
+            continue
+        points.append({
+            "arrival_rate": result["arrival_rate"],
+            "throughput_rps": stats["throughput_rps"],
+            "rejected_429": stats["statuses"].get("429", 0),
+            **{k: stats["latency_ms"][k] for k in ("p50", "p95", "p99")},
+        })
+    return points
+
+
+def print_curve(name: str, points: List[Dict[str, Any]]) -> None:
+    log(f"\n{name}: arrival/s  throughput/s  p50 ms  p95 ms  p99 ms  429s")
+    for p in points:
+        log(f"   {p['arrival_rate']:>10g}  {p['throughput_rps']:>12}  {p['p50']!s:>6}  {p['p95']!s:>6}  "
+            f"{p['p99']!s:>6}  {p['rejected_429']:>4}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Open-loop HTTP load test of the chat and history endpoints.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server to test (ignored with --stub)")
+    parser.add_argument("--rates", type=float_list, default=[1.0, 2.0, 4.0],
+                        help="Comma-separated conversation arrival rates per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of arrivals per rate")
+    parser.add_argument("--drain-timeout", type=float, default=60.0,
+                        help="Seconds to wait for in-flight conversations after the arrivals stop")
+    parser.add_argument("--turns", type=int, default=3, help="Chat turns per conversation")
+    parser.add_argument("--read-ratio", type=float, default=0.5,
+                        help="Probability of re-reading the session after a turn")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean user think time between turns")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stub", action="store_true", help="Run the app in process with a timing-controlled fake model")
+    parser.add_argument("--model", default="tiny", help="Model under backend/models to load in stub mode")
+    parser.add_argument("--stub-prefill-ms", type=float, default=20.0)
+    parser.add_argument("--stub-token-ms", type=float, default=5.0)
+    parser.add_argument("--stub-tokens", type=int, default=32, help="Tokens per stub reply (capped by --max-new-tokens)")
+    parser.add_argument("--history-backend", choices=["json", "jsonl", "sqlite"], default="json",
+                        help="History backend of the stub server")
+    parser.add_argument("--slo-p95-ms", type=float, default=None,
+                        help="chat-v2 p95 latency objective; reports the highest rate that meets it")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--csv", help="Also write the chat-v2 throughput-vs-latency curve as CSV")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    def sweep(base_url: str) -> List[Dict[str, Any]]:
+        results = []
+        for i, rate in enumerate(args.rates):
+            log(f"⏳ {rate:g} conversations/s for {args.duration:g}s against {base_url}...")
+            results.append(asyncio.run(run_rate(base_url, rate, args, args.seed + i)))
+        return results
+
+    if args.stub:
+        with stub_server(args) as base_url:
+            results = sweep(base_url)
+    else:
+        results = sweep(args.url.rstrip("/"))
+
+    curves = {endpoint: curve(results, endpoint) for endpoint in ("chat-v2", "session", "sessions")}
+    for endpoint, points in curves.items():
+        if points:
+            print_curve(endpoint, points)
+    report = {"environment": environment(), "arguments": vars(args), "results": results, "curves": curves}
+    exit_code = 0
+    if args.slo_p95_ms is not None:
+        passing = [p["arrival_rate"] for p in curves["chat-v2"]
+                   if p["p95"] is not None and p["p95"] <= args.slo_p95_ms and not p["rejected_429"]]
+        report["slo"] = {"chat_v2_p95_ms": args.slo_p95_ms, "max_rate_within_slo": max(passing, default=None)}
+        log(f"\nHighest arrival rate within p95 <= {args.slo_p95_ms:g}ms: {report['slo']['max_rate_within_slo']}")
+        exit_code = 0 if passing else 1
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8") as f:
+            f.write("arrival_rate,throughput_rps,p50_ms,p95_ms,p99_ms,rejected_429\n")
+            for p in curves["chat-v2"]:
+                f.write(f"{p['arrival_rate']},{p['throughput_rps']},{p['p50']},{p['p95']},{p['p99']},{p['rejected_429']}\n")
+    write_report(report, args.output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
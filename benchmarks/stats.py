@@ -0,0 +1,157 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import psutil
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Metrics compared against a baseline, and whether a higher value is better
+COMPARED_METRICS = {
+    "ttft_ms.p50": False,
+    "ttft_ms.p95": False,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "tokens_per_second": True,
+    "peak_memory_bytes": False,
+}
+
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """Linearly interpolated percentile (numpy's default method); None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    """Mean and p50/p95/p99 of a list of samples, rounded for the report."""
+    def rounded(value):
+        return round(value, 3) if value is not None else None
+
+    return {
+        "mean": rounded(sum(values) / len(values)) if values else None,
+        "p50": rounded(percentile(values, 50)),
+        "p95": rounded(percentile(values, 95)),
+        "p99": rounded(percentile(values, 99)),
+        "max": rounded(max(values)) if values else None,
+    }
+
+
+class PeakMemory:
+    """Tracks peak memory during a benchmark case: CUDA allocations on a GPU, process RSS otherwise.
+
+    RSS is sampled on a background thread (every ``interval`` seconds), so
+    very short spikes between samples can be missed.
+    """
+
+    def __init__(self, device: str, interval: float = 0.01):
+        self.device = device
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        process = psutil.Process()
+        while True:
+            self.peak = max(self.peak, process.memory_info().rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self) -> "PeakMemory":
+        if self.device == "cuda":
+            import torch
+
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+        else:
+            self._thread = threading.Thread(target=self._sample, name="peak-memory", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.device == "cuda":
+            import torch
+
+            torch.cuda.synchronize()
+            self.peak = torch.cuda.max_memory_allocated()
+        else:
+            self._stop.set()
+            self._thread.join()
+
+
+def environment() -> Dict[str, Any]:
+    """What a result was measured on, so reports from different machines are not confused."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    info = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    try:
+        import torch
+
+        info["torch"] = torch.__version__
+        info["cuda_device"] = torch.cuda.get_device_name(0) if torch.cuda.is_available() else None
+    except ImportError:
+        pass
+    return info
+
+
+def write_report(report: Dict[str, Any], path: Optional[str]) -> None:
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"✅ Report written to {path}")
+    else:
+        print(text)
+
+
+def _case_key(case: Dict[str, Any]) -> tuple:
+    return tuple(case.get(k) for k in ("target", "precision", "device", "prompt_tokens", "output_tokens", "concurrency", "draft"))
+
+
+def _lookup(case: Dict[str, Any], metric: str) -> Optional[float]:
+    value: Any = case
+    for part in metric.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Lists the metrics of matching cases that got worse than the baseline by more than ``tolerance``."""
+    baseline_cases = {_case_key(case): case for case in baseline}
+    regressions = []
+    for case in results:
+        before = baseline_cases.get(_case_key(case))
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = _lookup(before, metric), _lookup(case, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                label = ", ".join(f"{k}={v}" for k, v in zip(
+                    ("target", "precision", "device", "prompt", "output", "concurrency", "draft"), _case_key(case)
+                ) if v is not None)
+                regressions.append(f"{label}: {metric} {old} -> {new} ({change:+.1%})")
+    return regressions
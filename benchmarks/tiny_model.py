@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Builds a tiny randomly initialised Llama model for CPU benchmarks and smoke tests.
+
+The model is a few hundred KB, loads in well under a second and has a
+character-level tokenizer with a chat template, so it exercises the same
+loading, templating and generation paths as a real checkpoint:
+
+    python -m benchmarks.tiny_model backend/models/tiny
+"""
+import argparse
+import string
+
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+CHAT_TEMPLATE = (
+    "{% for m in messages %}<s>{{ m['role'] }}: {{ m['content'] }}\n{% endfor %}"
+    "{% if add_generation_prompt %}assistant:{% endif %}"
+)
+
+
+def make_tiny_model(output_dir: str, seed: int = 0) -> str:
+    """Saves the tokenizer and model to ``output_dir`` and returns it."""
+    vocab = {"<unk>": 0, "<s>": 1, "</s>": 2}
+    for char in string.printable:
+        vocab.setdefault(char, len(vocab))
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Split(pattern="", behavior="isolated")
+    backend.decoder = decoders.Fuse()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, unk_token="<unk>", bos_token="<s>", eos_token="</s>")
+    tokenizer.chat_template = CHAT_TEMPLATE
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(vocab), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=4096,
+        bos_token_id=1, eos_token_id=2,
+    )
+    tokenizer.save_pretrained(output_dir)
+    LlamaForCausalLM(config).save_pretrained(output_dir)
+    return output_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a tiny random Llama model for CPU benchmarks.")
+    parser.add_argument("output_dir", help="Directory to write the model to (e.g. backend/models/tiny)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(f"✅ Tiny model written to {make_tiny_model(args.output_dir, args.seed)}")
@@ -0,0 +1,22 @@
+import pytest
+from types import SimpleNamespace
+
+
+@pytest.fixture(scope="session")
+def tiny_model():
+    """A randomly initialised two-layer Llama small enough to run on CPU in tests.
+
+    Returns ``(model, tokenizer)`` where the tokenizer only carries the pad/eos
+    ids the core modules need; tests work directly with token ids.
+    """
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256,
+        bos_token_id=1, eos_token_id=2, pad_token_id=2,
+    )
+    model = transformers.LlamaForCausalLM(config).eval()
+    tokenizer = SimpleNamespace(pad_token_id=2, eos_token_id=2)
+    return model, tokenizer
@@ -0,0 +1,65 @@
+import pytest
+import os
+import sys
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.insert(0, project_root)
+
+try:
+    from backend.api.core import history_manager
+    from backend.api.core.chat_search import fts5_available, to_match_query
+except ImportError as e:
+    pytest.skip(f"Could not import chat search, skipping search tests: {e}", allow_module_level=True)
+
+if not fts5_available():
+    pytest.skip("SQLite was built without FTS5", allow_module_level=True)
+
+
+@pytest.fixture
+def history(tmp_path):
+    """A JSON history with a search index in a temporary directory."""
+    backend = history_manager.create_backend("json", history_dir=str(tmp_path))
+    backend.append_messages("old", [{"role": "user", "content": "How do I bake sourdough bread?"}])
+    history_manager.set_backend(backend)
+    history_manager.enable_search(str(tmp_path / "search.sqlite3"))
+    yield history_manager
+    history_manager.disable_search()
+    history_manager.set_backend(None)
+    backend.close()
+
+def test_match_query_quotes_user_input():
+    assert to_match_query('python "AND" OR (x') == '"python" "AND" "OR" "x"*'
+    assert to_match_query("?!") is None
+
+def test_existing_history_is_indexed_and_new_turns_incrementally(history):
+    assert [r["thread_id"] for r in history.search_sessions("sourdough")] == ["old"]
+
+    history.save_chat_messages("new", [
+        {"role": "user", "content": "Tell me about rust"},
+        {"role": "assistant", "content": "Rust is a systems language. Rust has ownership."},
+    ])
+    history.save_chat_messages("new", [{"role": "user", "content": "And cargo?"}])
+    results = history.search_sessions("rust")
+    assert [r["thread_id"] for r in results] == ["new"]
+    assert results[0]["message_matches"] == 2
+    assert "[rust]" in results[0]["snippet"].lower()
+    assert history.search_sessions("carg")[0]["message_index"] == 2 # Prefix match on the last word
+
+def test_titles_rank_and_deletes_are_removed(history):
+    history.save_chat_messages("a", [{"role": "user", "content": "notes about gardening tomatoes"}])
+    history.save_chat_messages("b", [{"role": "user", "content": "unrelated"}])
+    history.update_session_title("b", "Tomatoes")
+    results = history.search_sessions("tomatoes")
+    assert [r["thread_id"] for r in results] == ["b", "a"]
+    assert results[0]["title_match"] and results[0]["title"] == "Tomatoes"
+    assert results[1]["title"] == "notes about gardening tomatoes" # Automatic title
+
+    history.delete_session("b")
+    assert [r["thread_id"] for r in history.search_sessions("tomatoes")] == ["a"]
+    assert history.search_sessions("zzz") == []
+
+def test_search_requires_the_index(tmp_path):
+    history_manager.disable_search()
+    with pytest.raises(RuntimeError):
+        history_manager.search_sessions("anything")
@@ -0,0 +1,105 @@
+import pytest
+import os
+import sys
+from types import SimpleNamespace
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.insert(0, project_root)
+
+try:
+    from backend.api.core.context_window import (
+        SUMMARY_HEADER, count_message_tokens, fit_to_context, prompt_token_budget
+    )
+    from backend.api.core.prompt_cache import prompt_cache_stats
+    from backend.api.core.prompt_builder import generate_prompt
+except ImportError as e:
+    pytest.skip(f"transformers not available, skipping context window tests: {e}", allow_module_level=True)
+
+
+class CharTokenizer:
+    """One token per character, with a tag-style chat template."""
+    prompt_mode = "template"
+
+    def __init__(self, name="chars"):
+        self.name_or_path = name
+        self.encoded = []
+
+    def __call__(self, text, add_special_tokens=True):
+        self.encoded.append(text)
+        return {"input_ids": [ord(c) for c in text]}
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=False):
+        text = "".join(f"<{m['role']}>{m['content']}\n" for m in messages)
+        return text + ("<assistant>" if add_generation_prompt else "")
+
+
+def conversation(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "q" * 40})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "a" * 40})
+    messages.append({"role": "user", "content": "latest question"})
+    return messages
+
+
+def test_prompt_budget_leaves_room_for_generation():
+    model = SimpleNamespace(config=SimpleNamespace(max_position_embeddings=2048))
+    assert prompt_token_budget(model, 512) == 1536
+    assert prompt_token_budget(SimpleNamespace(config=SimpleNamespace()), 512) is None
+
+def test_message_counts_match_the_template_and_are_cached():
+    tokenizer = CharTokenizer()
+    message = {"role": "user", "content": "hello there"}
+    assert count_message_tokens(tokenizer, message) == len("<user>hello there\n")
+    tokenizer.encoded.clear()
+    hits = prompt_cache_stats()["hits"]
+    assert count_message_tokens(tokenizer, dict(message)) == len("<user>hello there\n")
+    assert tokenizer.encoded == []  # Not tokenized again
+    assert prompt_cache_stats()["hits"] == hits + 1
+
+def test_fit_keeps_system_prompt_and_newest_turns_within_budget():
+    tokenizer = CharTokenizer("fit")
+    messages = conversation(20)
+    budget = 600
+    system_prompt, kept, dropped = fit_to_context(tokenizer, "Be brief.", messages, budget)
+    assert dropped > 0 and kept == messages[dropped:]
+    assert kept[0]["role"] == "user" and kept[-1]["content"] == "latest question"
+    prompt = generate_prompt("chat", system_prompt, tokenizer, messages=kept)
+    assert prompt.startswith("<system>Be brief.\n")
+    assert len(prompt) <= budget
+    # One more message would not have fit
+    assert len(generate_prompt("chat", system_prompt, tokenizer, messages=messages[dropped - 2:])) > budget - 8
+
+    # Short chats pass through untouched
+    assert fit_to_context(tokenizer, "Be brief.", messages[-3:], budget) == ("Be brief.", messages[-3:], 0)
+
+def test_dropped_turns_can_be_summarized():
+    tokenizer = CharTokenizer("summary")
+    messages = conversation(20)
+    system_prompt, kept, dropped = fit_to_context(
+        tokenizer, "Be brief.", messages, 900, summarize=True, summary_max_tokens=300
+    )
+    assert dropped > 0
+    assert system_prompt.startswith("Be brief.\n\n" + SUMMARY_HEADER)
+    summary = system_prompt[len("Be brief.\n\n" + SUMMARY_HEADER):]
+    # The summary covers the most recent dropped messages, oldest first
+    assert summary.splitlines()[-1].startswith(f"- assistant: answer {dropped // 2 - 1}")
+    assert len(generate_prompt("chat", system_prompt, tokenizer, messages=kept)) <= 900
+
+def test_custom_prompts_keep_the_history_system_message():
+    tokenizer = CharTokenizer("custom")
+    tokenizer.prompt_mode = "custom"
+    tokenizer.custom_prompt_config = {"system_prefix": "[S]", "user_prefix": "[U]", "assistant_prefix": "[A]"}
+    messages = [{"role": "system", "content": "History's own system text."}] + conversation(20)
+    # Everything fits: the messages come back untouched, system message included
+    assert fit_to_context(tokenizer, "Server prompt.", messages[:4], 2000) == ("Server prompt.", messages[:4], 0)
+
+    system_prompt, kept, dropped = fit_to_context(
+        tokenizer, "Server prompt.", messages, 900, summarize=True, summary_max_tokens=200
+    )
+    assert dropped > 0 and system_prompt == "Server prompt."
+    assert kept[0]["content"].startswith("History's own system text.\n\n" + SUMMARY_HEADER)
+    assert kept[1:] == messages[1 + dropped:]
+    prompt = generate_prompt("chat", system_prompt, tokenizer, messages=kept)
+    assert prompt.startswith("[S]History's own system text.") and len(prompt) <= 900
@@ -0,0 +1,301 @@
+import pytest
+import json
+import os
+import sys
+import threading
+import time
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.insert(0, project_root)
+
+try:
+    from backend.api.core import history_manager
+    from backend.api.core.history_writer import HistoryWriter
+except ImportError as e:
+    pytest.skip(f"Could not import history manager, skipping history tests: {e}", allow_module_level=True)
+
+
+@pytest.fixture(params=["json", "jsonl", "sqlite"])
+def history(request, tmp_path):
+    """Points history_manager at a fresh backend of each kind."""
+    backend = history_manager.create_backend(
+        request.param, history_dir=str(tmp_path), db_path=str(tmp_path / "history.sqlite3")
+    )
+    history_manager.set_backend(backend)
+    yield history_manager
+    history_manager.set_backend(None)
+    backend.close()
+
+def test_turns_are_appended_and_settings_kept(history):
+    thread_id = history.save_chat_messages(
+        None, [{"role": "user", "content": "Hello there"}, {"role": "assistant", "content": "Hi!"}],
+        sampling_settings={"temperature": 0.5}, system_prompt="Be kind.",
+    )
+    history.save_chat_messages(thread_id, [{"role": "user", "content": "More"}, {"role": "assistant", "content": "Sure"}])
+
+    session = history.get_session(thread_id)
+    assert [m["content"] for m in session["messages"]] == ["Hello there", "Hi!", "More", "Sure"]
+    assert session["sampling_settings"] == {"temperature": 0.5}  # Not cleared by a save without settings
+    assert session["system_prompt"] == "Be kind."
+    assert session["custom_title"] is None
+    assert "created_at" in session["metadata"] and "last_updated" in session["metadata"]
+
+def test_sessions_are_listed_most_recent_first_with_titles(history):
+    first = history.save_chat_messages("t1", [{"role": "user", "content": "x" * 60}])
+    second = history.save_chat_messages("t2", [{"role": "user", "content": "Second"}])
+    assert history.update_session_title(first, "  Renamed  ")
+
+    listed = history.list_sessions()
+    assert [s["thread_id"] for s in listed] == [first, second]
+    assert [s["title"] for s in listed] == ["Renamed", "Second"]
+
+def test_missing_and_invalid_sessions(history):
+    assert history.get_session("nope") is None
+    assert history.get_session("../etc") is None
+    assert not history.update_session_title("nope", "x")
+    assert not history.delete_session("nope")
+    with pytest.raises(ValueError):
+        history.delete_session("../etc")
+
+def test_delete_removes_session(history):
+    thread_id = history.save_chat_messages(None, [{"role": "user", "content": "Bye"}])
+    assert history.delete_session(thread_id)
+    assert history.get_session(thread_id) is None
+    assert history.list_sessions() == []
+
+def test_json_sessions_migrate_to_sqlite(tmp_path):
+    source = history_manager.create_backend("json", history_dir=str(tmp_path))
+    source.append_messages("t1", [{"role": "user", "content": "Hi"}], {"top_p": 0.9}, "Sys")
+    source.update_title("t1", "Kept title")
+    target = history_manager.create_backend("sqlite", db_path=str(tmp_path / "history.sqlite3"))
+
+    for thread_id in source.thread_ids():
+        target.import_session(source.get_session(thread_id))
+
+    assert target.get_session("t1") == source.get_session("t1")
+    target.append_messages("t1", [{"role": "assistant", "content": "Hello"}])
+    assert [m["content"] for m in target.get_session("t1")["messages"]] == ["Hi", "Hello"]
+    target.close()
+
+def test_sessions_are_paginated_with_a_cursor(history):
+    for i in range(5):
+        history.save_chat_messages(f"t{i}", [{"role": "user", "content": f"Chat {i}"}])
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = history.list_sessions_page(limit=2, cursor=cursor)
+        seen.extend(s["thread_id"] for s in page)
+        if cursor is None:
+            break
+    assert seen == [s["thread_id"] for s in history.list_sessions()] == ["t4", "t3", "t2", "t1", "t0"]
+    assert history.list_sessions()[0]["message_count"] == 1
+    with pytest.raises(ValueError):
+        history.list_sessions_page(limit=2, cursor="not-a-cursor")
+
+def test_json_index_is_reused_and_reconciled(tmp_path):
+    backend = history_manager.create_backend("json", history_dir=str(tmp_path))
+    backend.append_messages("t1", [{"role": "user", "content": "One"}])
+    backend.append_messages("t2", [{"role": "user", "content": "Two"}])
+    assert len(backend.list_sessions()) == 2
+    backend.append_messages("t1", [{"role": "assistant", "content": "Reply"}]) # Kept up to date by saves
+    assert backend.list_sessions()[0]["message_count"] == 2
+
+    # A fresh instance lists from the index without parsing unchanged sessions
+    reopened = history_manager.create_backend("json", history_dir=str(tmp_path))
+    reopened._read = lambda thread_id: pytest.fail(f"parsed {thread_id}")
+    assert [s["title"] for s in reopened.list_sessions()] == ["One", "Two"]
+
+    # Files changed or removed behind its back are picked up on the next start
+    os.remove(tmp_path / "t2.json")
+    edited = history_manager.create_backend("json", history_dir=str(tmp_path))
+    edited.update_title("t1", "Edited")
+    rebuilt = history_manager.create_backend("json", history_dir=str(tmp_path))
+    assert [(s["thread_id"], s["title"]) for s in rebuilt.list_sessions()] == [("t1", "Edited")]
+
+def test_json_index_changes_are_logged_and_compacted(tmp_path):
+    backend = history_manager.create_backend("json", history_dir=str(tmp_path))
+    backend.INDEX_LOG_MIN_ENTRIES = 3
+    backend.append_messages("t1", [{"role": "user", "content": "One"}])
+    assert backend.list_sessions()[0]["title"] == "One" # Loads (and compacts) the index
+    index_bytes = (tmp_path / "sessions.index").read_bytes()
+
+    backend.append_messages("t2", [{"role": "user", "content": "Two"}])
+    backend.update_title("t1", "Renamed")
+    assert backend.delete_session("t2")
+    assert (tmp_path / "sessions.index").read_bytes() == index_bytes # Saves only appended to the log
+    assert len((tmp_path / "sessions.index.log").read_text().splitlines()) == 3
+    with open(tmp_path / "sessions.index.log", "a") as f:
+        f.write('["t3", {"auto_ti') # Torn by a crash
+
+    reopened = history_manager.create_backend("json", history_dir=str(tmp_path))
+    reopened._read = lambda thread_id: pytest.fail(f"parsed {thread_id}")
+    assert [(s["thread_id"], s["title"]) for s in reopened.list_sessions()] == [("t1", "Renamed")]
+    assert not (tmp_path / "sessions.index.log").exists() # Folded into the index on load
+
+    del reopened._read
+    reopened.INDEX_LOG_MIN_ENTRIES = 3
+    for i in range(4):
+        reopened.append_messages("t1", [{"role": "user", "content": f"More {i}"}])
+    assert not (tmp_path / "sessions.index.log").exists() # Compacted once the log outgrew the index
+    assert json.loads((tmp_path / "sessions.index").read_text())["t1"]["message_count"] == 5
+
+def test_jsonl_journal_survives_a_torn_write_and_compacts(tmp_path):
+    backend = history_manager.create_backend("jsonl", history_dir=str(tmp_path))
+    backend.append_messages("t1", [{"role": "user", "content": "Hi"}], {"temperature": 0.5}, "Sys")
+    backend.append_messages("t1", [{"role": "assistant", "content": "Hello"}], {"temperature": 0.7})
+    with open(tmp_path / "t1.jsonl", "a") as f:
+        f.write('{"event": "message", "message": {"role": "us') # Crash mid-append
+    backend.append_messages("t1", [{"role": "user", "content": "Still here"}])
+    with open(tmp_path / "t1.jsonl", "a") as f:
+        f.write('{"event": "message"}\n{"event": "message", "message": "text"}\n[1]\n') # Well-formed but invalid
+
+    session = backend.get_session("t1")
+    assert [m["content"] for m in session["messages"]] == ["Hi", "Hello", "Still here"]
+    assert [s["message_count"] for s in history_manager.create_backend("jsonl", history_dir=str(tmp_path)).list_sessions()] == [3]
+    assert session["sampling_settings"] == {"temperature": 0.7} and session["system_prompt"] == "Sys"
+
+    backend.COMPACT_AFTER = 2
+    for i in range(3):
+        backend.update_title("t1", f"Title {i}")
+    compacted = backend.get_session("t1")
+    lines = (tmp_path / "t1.jsonl").read_text().splitlines()
+    assert len(lines) == 1 + 1 + 3 + 1  # created, settings, messages, title
+    assert backend.get_session("t1") == compacted
+    assert compacted["custom_title"] == "Title 2"
+    assert not os.path.exists(tmp_path / "t1.jsonl.tmp")
+
+def test_write_behind_coalesces_and_flushes_before_reads(tmp_path):
+    backend = history_manager.create_backend("json", history_dir=str(tmp_path))
+    history_manager.set_backend(backend)
+    writes = []
+    release = threading.Event()
+    original = backend.append_messages
+    def slow_append(thread_id, messages, *args):
+        release.wait(5)
+        writes.append((thread_id, len(messages)))
+        original(thread_id, messages, *args)
+    backend.append_messages = slow_append
+    writer = history_manager.start_write_behind(max_pending_messages=100)
+    try:
+        history_manager.save_chat_messages("first", [{"role": "user", "content": "Blocks the worker"}])
+        time.sleep(0.05) # Worker picks "first" up and waits on the slow disk
+        for i in range(3):
+            history_manager.save_chat_messages("t1", [{"role": "user", "content": f"Turn {i}"}], {"temperature": i})
+        assert history_manager.write_queue_stats()["pending_messages"] == 3
+        release.set()
+
+        session = history_manager.get_session("t1") # Flushes first
+        assert [m["content"] for m in session["messages"]] == ["Turn 0", "Turn 1", "Turn 2"]
+        assert session["sampling_settings"] == {"temperature": 2}
+        assert writes == [("first", 1), ("t1", 3)] # Three turns, one write
+    finally:
+        history_manager.stop_write_behind()
+        history_manager.set_backend(None)
+    assert not history_manager.write_queue_stats()["enabled"]
+    assert writer.describe()["threads_written"] == 2
+
+def test_reads_only_wait_for_their_own_thread(tmp_path):
+    backend = history_manager.create_backend("sqlite", db_path=str(tmp_path / "history.sqlite3"))
+    backend.append_messages("stored", [{"role": "user", "content": "Already saved"}])
+    backend.append_messages("old", [{"role": "user", "content": "Old chat"}])
+    backend.update_title("old", "Renamed")
+    history_manager.set_backend(backend)
+    release = threading.Event()
+    original = backend.append_messages
+    backend.append_messages = lambda thread_id, *args: (thread_id != "other" or release.wait(5), original(thread_id, *args))
+    history_manager.start_write_behind(max_pending_messages=100)
+    try:
+        history_manager.save_chat_messages("other", [{"role": "user", "content": "Slow disk"}])
+        time.sleep(0.05) # Worker is stuck writing "other"
+        history_manager.save_chat_messages("new", [{"role": "user", "content": "Queued chat"}])
+        history_manager.save_chat_messages("old", [{"role": "assistant", "content": "Queued reply"}])
+
+        start = time.perf_counter()
+        assert history_manager.get_session("stored")["messages"][0]["content"] == "Already saved"
+        listed = {s["thread_id"]: s for s in history_manager.list_sessions()}
+        assert time.perf_counter() - start < 1 # Neither read waited for the slow write
+        assert not release.is_set()
+        assert listed["new"]["title"] == "Queued chat" and listed["new"]["message_count"] == 1
+        assert listed["old"]["title"] == "Renamed" and listed["old"]["message_count"] == 2
+        assert listed["other"]["message_count"] == 1
+
+        page, cursor = history_manager.list_sessions_page(limit=2)
+        rest, end = history_manager.list_sessions_page(limit=2, cursor=cursor)
+        assert end is None and len(page) + len(rest) == 4
+        assert [s["thread_id"] for s in page + rest] == [s["thread_id"] for s in history_manager.list_sessions()]
+        assert page[-1]["thread_id"] != "stored" # Queued sessions sort as just updated
+    finally:
+        release.set()
+        history_manager.stop_write_behind()
+        history_manager.set_backend(None)
+        backend.close()
+
+def test_write_behind_applies_backpressure_and_drains_on_stop(tmp_path):
+    backend = history_manager.create_backend("json", history_dir=str(tmp_path))
+    release = threading.Event()
+    writer = HistoryWriter(lambda *args: (release.wait(5), backend.append_messages(*args)), max_pending_messages=2)
+    writer.submit("a", [{"role": "user", "content": "1"}])
+    time.sleep(0.05)
+    writer.submit("b", [{"role": "user", "content": "2"}, {"role": "user", "content": "3"}]) # Queue now full
+
+    blocked = threading.Thread(target=writer.submit, args=("c", [{"role": "user", "content": "4"}]))
+    blocked.start()
+    blocked.join(0.1)
+    assert blocked.is_alive()
+    release.set()
+    blocked.join(5)
+    writer.close(5)
+    assert sorted(backend.thread_ids()) == ["a", "b", "c"]
+    assert not writer.submit("d", [{"role": "user", "content": "5"}]) # Closed: caller writes directly
+
+def test_cold_json_sessions_compress_transparently(tmp_path):
+    backend = history_manager.create_backend("json", history_dir=str(tmp_path))
+    backend.append_messages("cold", [{"role": "user", "content": "Old chat " * 50}], {"temperature": 0.5})
+    backend.append_messages("hot", [{"role": "user", "content": "New chat"}])
+    os.utime(tmp_path / "cold.json", (0, 0))
+    original = backend.get_session("cold")
+    listed = backend.list_sessions()
+
+    assert backend.compress_cold_sessions("gzip", idle_seconds=3600) == 1
+    assert sorted(os.listdir(tmp_path)) == ["cold.json.gz", "hot.json", "sessions.index", "sessions.index.log"]
+    assert backend.get_session("cold") == original
+    reopened = history_manager.create_backend("json", history_dir=str(tmp_path))
+    assert reopened.thread_ids() == backend.thread_ids() and reopened.list_sessions() == listed
+
+    reopened.append_messages("cold", [{"role": "assistant", "content": "Back again"}]) # Hot again: plain JSON
+    assert (tmp_path / "cold.json").exists() and not (tmp_path / "cold.json.gz").exists()
+    assert len(reopened.get_session("cold")["messages"]) == 2
+    reopened.compress_session("cold", "gzip")
+    assert reopened.delete_session("cold") and reopened.thread_ids() == ["hot"]
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_corrupt_compressed_sessions_are_skipped(tmp_path, codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    backend = history_manager.create_backend("json", history_dir=str(tmp_path))
+    backend.append_messages("damaged", [{"role": "user", "content": "Cold chat " * 50}])
+    backend.append_messages("fine", [{"role": "user", "content": "Still readable"}])
+    assert backend.compress_session("damaged", codec)
+    compressed = tmp_path / f"damaged.json.{'gz' if codec == 'gzip' else 'zst'}"
+    compressed.write_bytes(compressed.read_bytes()[:20]) # Truncated
+
+    fresh = history_manager.create_backend("json", history_dir=str(tmp_path))
+    assert fresh.get_session("damaged") is None
+    assert [s["thread_id"] for s in fresh.list_sessions()] == ["fine"]
+
+def test_zstd_compression_with_a_trained_dictionary(tmp_path):
+    pytest.importorskip("zstandard")
+    backend = history_manager.create_backend("json", history_dir=str(tmp_path))
+    for i in range(40):
+        backend.append_messages(f"t{i}", [
+            {"role": "user", "content": f"Question {i} about the weather in city number {i * 7}"},
+            {"role": "assistant", "content": f"The weather in city {i * 7} is sunny with {i} degrees."},
+        ], {"temperature": 0.7, "top_p": 0.95, "top_k": 50, "max_new_tokens": 512}, "You are a helpful assistant.")
+    dict_id = backend.zstd_dictionaries.train(backend.sample_payloads(), size=4096)
+    originals = {t: backend.get_session(t) for t in backend.thread_ids()}
+
+    assert backend.compress_cold_sessions("zstd", idle_seconds=0) == 40
+    assert (tmp_path / f"zstd-{dict_id}.dict").exists()
+    fresh = history_manager.create_backend("json", history_dir=str(tmp_path)) # Loads the dictionary from disk
+    assert all(fresh.get_session(t) == session for t, session in originals.items())
@@ -0,0 +1,248 @@
+import asyncio
+import pytest
+import threading
+from fastapi.testclient import TestClient
+from unittest.mock import patch, MagicMock
+import os
+import sys
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.insert(0, project_root)
+
+try:
+    from backend.api.main import app
+    from backend.api.core.inference_executor import GenerationCancelledError, InferenceExecutor, QueueFullError
+except ImportError as e:
+    pytest.skip(f"Could not import inference executor, skipping executor tests: {e}", allow_module_level=True)
+
+
+def test_run_returns_results_and_raises_errors():
+    executor = InferenceExecutor()
+
+    async def scenario():
+        assert await executor.run(lambda a, b=0: a + b, 1, b=2) == 3
+        with pytest.raises(ValueError):
+            await executor.run(lambda: (_ for _ in ()).throw(ValueError("boom")))
+
+    asyncio.run(scenario())
+    stats = executor.stats()
+    assert {k: stats[k] for k in ("workers", "queued", "running", "completed", "rejected")} == {
+        "workers": 1, "queued": 0, "running": 0, "completed": 2, "rejected": 0
+    }
+    executor.shutdown()
+
+def test_queue_limit_rejects_and_clients_take_turns():
+    executor = InferenceExecutor(workers=1, max_queue_depth=4)
+    release = threading.Event()
+    order = []
+    blocker = executor.submit(release.wait, 5)
+    for _ in range(100):
+        if executor.stats()["running"] == 1:
+            break
+        threading.Event().wait(0.01)
+
+    # One client's burst is queued first, then a second client arrives
+    jobs = [executor.submit(order.append, f"a{i}", client_id="a") for i in range(3)]
+    jobs.append(executor.submit(order.append, "b0", client_id="b"))
+    with pytest.raises(QueueFullError) as excinfo:
+        executor.submit(order.append, "b1", client_id="b")
+    assert excinfo.value.retry_after >= 1
+    assert executor.stats()["rejected"] == 1
+
+    release.set()
+    for job in [blocker, *jobs]:
+        job.future.result(5)
+    assert order == ["a0", "b0", "a1", "a2"]
+    assert all(job.queue_wait_ms is not None for job in jobs)
+    executor.shutdown()
+
+def test_cancel_drops_queued_jobs_and_signals_running_ones():
+    executor = InferenceExecutor(workers=1)
+    steps = []
+
+    def generate(cancel_event):
+        while not cancel_event.wait(0.01): # One "decode step" per wait
+            steps.append(1)
+        return "partial"
+
+    running = executor.submit(generate, request_id="r1", cancel_event=threading.Event())
+    queued = executor.submit(generate, request_id="r2", cancel_event=threading.Event())
+    for _ in range(100):
+        if steps:
+            break
+        threading.Event().wait(0.01)
+    with pytest.raises(ValueError):
+        executor.submit(generate, request_id="r1")
+
+    assert executor.cancel("r2")
+    assert executor.stats()["queued"] == 0
+    with pytest.raises(GenerationCancelledError):
+        asyncio.run(queued.result())
+
+    assert executor.cancel("r1")
+    assert running.future.result(5) == "partial" and running.cancelled
+    assert not executor.cancel("r1") # Finished jobs are forgotten
+    assert executor.stats()["cancelled"] == 2
+    executor.shutdown()
+
+def test_shutdown_cancels_queued_jobs():
+    executor = InferenceExecutor(workers=1)
+    release = threading.Event()
+    executor.submit(release.wait, 5)
+    queued = executor.submit(lambda: "never")
+    executor.shutdown()
+    release.set()
+    assert queued.future.cancelled()
+
+def test_stream_yields_items_then_reraises():
+    executor = InferenceExecutor()
+
+    def chunks(fail):
+        yield "a"
+        yield "b"
+        if fail:
+            raise RuntimeError("generation failed")
+
+    async def collect(fail):
+        received = []
+        try:
+            async for chunk in executor.stream(chunks, fail):
+                received.append(chunk)
+        except RuntimeError:
+            received.append("error")
+        return received
+
+    assert asyncio.run(collect(False)) == ["a", "b"]
+    assert asyncio.run(collect(True)) == ["a", "b", "error"]
+    executor.shutdown()
+
+@patch('backend.api.routes.chat.save_chat_messages', return_value="thread_1")
+@patch('backend.api.routes.chat.generate_response')
+def test_health_answers_while_generation_is_busy(mock_generate, mock_save):
+    """Chat requests queue on the inference executor, not on the threadpool health checks use."""
+    release = threading.Event()
+    mock_generate.side_effect = lambda **kwargs: (release.wait(5), "Done")[1]
+    app.state.model, app.state.tokenizer = MagicMock(), MagicMock()
+    app.state.device, app.state.model_path = "cpu", "fake-model"
+    app.state.system_prompt, app.state.temperature, app.state.top_p, app.state.max_new_tokens = "Sys", 0.7, 0.9, 10
+    app.state.inference_executor = InferenceExecutor(workers=1)
+    client = TestClient(app)
+    try:
+        responses = []
+        chats = [
+            threading.Thread(target=lambda: responses.append(client.post(
+                "/api/v1/chat/chat-v2", json={"mode": "instruction", "message": "Hi"}
+            ))) for _ in range(3)
+        ]
+        for chat in chats:
+            chat.start()
+        for _ in range(100):
+            if app.state.inference_executor.stats()["queued"] == 2:
+                break
+            threading.Event().wait(0.02)
+        assert app.state.inference_executor.stats()["running"] == 1
+
+        assert client.get("/health").json() == {"status": "ok"}
+        assert client.get("/api/v1/system/inference_queue").json()["queued"] == 2
+        release.set()
+        for chat in chats:
+            chat.join(5)
+        assert [r.json()["response"] for r in responses] == ["Done"] * 3
+    finally:
+        release.set()
+        app.state.inference_executor.shutdown()
+        app.state.inference_executor = None
+        app.state.model, app.state.tokenizer = None, None
+
+@patch('backend.api.main.enable_search')  # The lifespan below must not touch the real saved_chats
+@patch('backend.api.main.start_write_behind')
+@patch('backend.api.routes.chat.save_chat_messages', return_value="thread_1")
+@patch('backend.api.routes.chat.generate_response', return_value="Done")
+@patch('backend.api.routes.chat.assemble_prompt', return_value=None)
+@patch('backend.api.routes.chat.generate_prompt')
+def test_health_answers_while_a_prompt_is_prepared(mock_prompt, mock_assemble, mock_generate, mock_save, *_):
+    """Prompt rendering and tokenization run off the event loop too."""
+    release, prepared = threading.Event(), threading.Event()
+    mock_prompt.side_effect = lambda **kwargs: (release.wait(5), prepared.set(), "prompt")[2]
+    with TestClient(app) as client:  # One event loop shared by every request
+        app.state.model, app.state.tokenizer = MagicMock(), MagicMock()
+        app.state.device, app.state.model_path = "cpu", "fake-model"
+        try:
+            responses = []
+            chat = threading.Thread(target=lambda: responses.append(client.post(
+                "/api/v1/chat/chat-v2", json={"mode": "instruction", "message": "Hi"}
+            )))
+            chat.start()
+            for _ in range(100):
+                if mock_prompt.called:
+                    break
+                threading.Event().wait(0.02)
+            assert mock_prompt.called
+
+            assert client.get("/health").json() == {"status": "ok"}
+            assert not prepared.is_set()  # Answered while the prompt was still being built
+            release.set()
+            chat.join(5)
+            assert responses[0].json()["response"] == "Done"
+        finally:
+            release.set()
+            app.state.model, app.state.tokenizer = None, None
+
+@patch('backend.api.routes.chat.save_chat_messages', return_value="thread_1")
+@patch('backend.api.routes.chat.generate_response', return_value="Done")
+def test_chat_reports_queue_wait_and_rejects_when_full(mock_generate, mock_save):
+    app.state.model, app.state.tokenizer = MagicMock(), MagicMock()
+    app.state.device, app.state.model_path = "cpu", "fake-model"
+    app.state.system_prompt, app.state.temperature, app.state.top_p, app.state.max_new_tokens = "Sys", 0.7, 0.9, 10
+    app.state.inference_executor = InferenceExecutor(workers=1, max_queue_depth=0)
+    client = TestClient(app)
+    try:
+        response = client.post("/api/v1/chat/chat-v2", json={"mode": "instruction", "message": "Hi"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+        app.state.inference_executor.max_queue_depth = 1
+        response = client.post(
+            "/api/v1/chat/chat-v2", json={"mode": "instruction", "message": "Hi"}, headers={"X-Client-Id": "alice"}
+        )
+        assert response.status_code == 200
+        assert response.json()["queue_wait_ms"] >= 0
+        assert "X-Queue-Wait-Ms" in response.headers
+    finally:
+        app.state.inference_executor.shutdown()
+        app.state.inference_executor = None
+        app.state.model, app.state.tokenizer = None, None
+
+@patch('backend.api.routes.chat.save_chat_messages', return_value="thread_1")
+@patch('backend.api.routes.chat.generate_response')
+def test_cancel_endpoint_stops_a_running_chat(mock_generate, mock_save):
+    started = threading.Event()
+
+    def generate(cancel_event=None, **kwargs):
+        started.set()
+        cancel_event.wait(5)
+        return "partial"
+
+    mock_generate.side_effect = generate
+    app.state.model, app.state.tokenizer = MagicMock(), MagicMock()
+    app.state.device, app.state.model_path = "cpu", "fake-model"
+    app.state.system_prompt, app.state.temperature, app.state.top_p, app.state.max_new_tokens = "Sys", 0.7, 0.9, 10
+    app.state.inference_executor = InferenceExecutor(workers=1)
+    client = TestClient(app)
+    try:
+        assert client.delete("/api/v1/chat/generation/unknown").status_code == 404
+        responses = []
+        chat = threading.Thread(target=lambda: responses.append(client.post(
+            "/api/v1/chat/chat-v2", json={"mode": "instruction", "message": "Hi"}, headers={"X-Request-Id": "req-1"}
+        )))
+        chat.start()
+        assert started.wait(5)
+        assert client.delete("/api/v1/chat/generation/req-1").status_code == 204
+        chat.join(5)
+        assert responses[0].status_code == 499
+        mock_save.assert_not_called() # Abandoned answers are not saved
+    finally:
+        app.state.inference_executor.shutdown()
+        app.state.inference_executor = None
+        app.state.model, app.state.tokenizer = None, None
@@ -0,0 +1,101 @@
+import pytest
+import os
+import sys
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.insert(0, project_root)
+
+try:
+    import torch
+    from transformers import DynamicCache
+    from backend.api.core.kv_cache import SystemPromptCache, ThreadKVCacheStore, cache_nbytes
+except ImportError as e:
+    pytest.skip(f"torch/transformers not available, skipping KV cache tests: {e}", allow_module_level=True)
+
+
+def greedy(model, prompt_ids, past_key_values=None, max_new_tokens=6):
+    input_ids = torch.tensor([prompt_ids])
+    return model.generate(
+        input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=max_new_tokens,
+        do_sample=False, pad_token_id=2, past_key_values=past_key_values, return_dict_in_generate=True,
+    )
+
+def test_next_turn_reuses_cached_prefix(tiny_model):
+    """A follow-up prompt sharing the previous turn's tokens only prefills the new suffix."""
+    model, _ = tiny_model
+    store = ThreadKVCacheStore(max_bytes=10 * 1024 * 1024)
+    first_turn = [5, 6, 7, 8, 9]
+    outputs = greedy(model, first_turn)
+    cached_len = outputs.past_key_values.get_seq_length()
+    store.put("thread", outputs.sequences[0][:cached_len].tolist(), outputs.past_key_values)
+
+    second_turn = outputs.sequences[0].tolist() + [10, 11, 12]
+    cache, reused = store.take("thread", second_turn)
+    assert reused == cached_len
+    assert store.stats()["entries"] == 0  # Taken entries are owned by the caller
+
+    with_cache = greedy(model, second_turn, past_key_values=cache).sequences
+    without_cache = greedy(model, second_turn).sequences
+    assert torch.equal(with_cache, without_cache)
+
+def test_mismatched_prefix_is_cropped(tiny_model):
+    model, _ = tiny_model
+    store = ThreadKVCacheStore(max_bytes=10 * 1024 * 1024)
+    outputs = greedy(model, [5, 6, 7, 8, 9])
+    cached_len = outputs.past_key_values.get_seq_length()
+    store.put("thread", outputs.sequences[0][:cached_len].tolist(), outputs.past_key_values)
+
+    cache, reused = store.take("thread", [5, 6, 7, 20, 21])
+    assert reused == 3
+    assert cache.get_seq_length() == 3
+
+def test_store_evicts_least_recently_used_over_budget(tiny_model):
+    model, _ = tiny_model
+    outputs = greedy(model, [5, 6, 7], max_new_tokens=2)
+    entry_bytes = cache_nbytes(outputs.past_key_values)
+    store = ThreadKVCacheStore(max_bytes=entry_bytes * 2)
+    for key in ("a", "b", "c"):
+        cache = DynamicCache.from_legacy_cache(outputs.past_key_values.to_legacy_cache())
+        store.put(key, [5, 6, 7, 8], cache)
+    assert store.stats()["entries"] == 2
+    assert store.take("a", [5, 6, 7, 8]) == (None, 0)
+    assert store.take("c", [5, 6, 7, 8])[1] == 3
+
+
+class CharTokenizer:
+    """Maps each character to a token id; uses the plain fallback prompt format."""
+    prompt_mode = "fallback"
+    custom_prompt_config = None
+
+    def __call__(self, text):
+        return {"input_ids": [3 + ord(ch) % 60 for ch in text]}
+
+def test_system_prompt_cache_seeds_generation(tiny_model):
+    """Seeding from the pinned system prompt gives the same output as a full prefill."""
+    model, _ = tiny_model
+    tokenizer = CharTokenizer()
+    prefix_cache = SystemPromptCache()
+    prompt_ids = tokenizer("Be brief.\n\nUser: hi\nAssistant:")["input_ids"]
+
+    cache, reused = prefix_cache.seed(model, tokenizer, "Be brief.", prompt_ids)
+    assert reused == len("Be brief.\n\n")
+    seeded = greedy(model, prompt_ids, past_key_values=cache).sequences
+    assert torch.equal(seeded, greedy(model, prompt_ids).sequences)
+
+    # Each request gets its own copy, so the pinned state is untouched by generate
+    again, _ = prefix_cache.seed(model, tokenizer, "Be brief.", prompt_ids)
+    assert again.get_seq_length() == reused
+    # Not worth copying when another cache already covers more tokens
+    assert prefix_cache.seed(model, tokenizer, "Be brief.", prompt_ids, min_tokens=reused) == (None, 0)
+
+def test_system_prompt_cache_follows_prompt_changes(tiny_model):
+    model, _ = tiny_model
+    tokenizer = CharTokenizer()
+    prefix_cache = SystemPromptCache()
+    prefix_cache.refresh(model, tokenizer, "Be brief.")
+    prompt_ids = tokenizer("Be verbose.\n\nUser: hi\nAssistant:")["input_ids"]
+    _, reused = prefix_cache.seed(model, tokenizer, "Be verbose.", prompt_ids)
+    assert reused == len("Be verbose.\n\n")
+    prefix_cache.invalidate()
+    assert prefix_cache._cache is None
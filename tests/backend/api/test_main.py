@@ -27,6 +27,15 @@ def test_health_check():
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
 
+def test_metrics_endpoint_exposes_prometheus_metrics():
+    """The /metrics endpoint serves the generation, queue and history metrics in text format."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for name in ("sigil_prompt_tokens", "sigil_decode_token_seconds", "sigil_queue_wait_seconds",
+                 "sigil_history_save_seconds", "sigil_model_load_seconds", "sigil_inference_queued"):
+        assert f"# TYPE {name} " in response.text
+
 @patch('os.path.isdir')
 @patch('os.listdir')
 @patch('os.path.abspath')
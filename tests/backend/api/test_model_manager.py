@@ -0,0 +1,89 @@
+import pytest
+import os
+import sys
+import threading
+from unittest.mock import MagicMock
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.insert(0, project_root)
+
+try:
+    from backend.api.core.model_manager import LoadedModel, ModelManager
+    from backend.api.core.load_jobs import ModelLoadJobs
+except ImportError as e:
+    pytest.skip(f"Could not import model manager, skipping tests: {e}", allow_module_level=True)
+
+
+def fake_entry(name, size_bytes, device="cpu"):
+    model = MagicMock()
+    model.get_memory_footprint.return_value = size_bytes
+    return LoadedModel(name, f"backend/models/{name}", MagicMock(), model, device)
+
+def test_least_recently_used_model_is_evicted_first():
+    evicted = []
+    manager = ModelManager(ram_budget_bytes=250, vram_budget_bytes=1000, on_evict=evicted.append)
+    manager.add(fake_entry("a", 100))
+    manager.add(fake_entry("b", 100))
+    manager.get("a")  # Touch 'a' so 'b' becomes least recently used
+
+    manager.make_room(100, "cpu")
+    manager.add(fake_entry("c", 100))
+
+    assert evicted == ["b"]
+    assert [m["name"] for m in manager.loaded()] == ["c", "a"]
+
+def test_budgets_are_tracked_per_device():
+    manager = ModelManager(ram_budget_bytes=150, vram_budget_bytes=150)
+    manager.add(fake_entry("gpu-model", 100, device="cuda"))
+    manager.add(fake_entry("cpu-model", 100, device="cpu"))
+    assert "gpu-model" in manager and "cpu-model" in manager
+
+def test_removing_active_model_clears_it_and_drops_references():
+    manager = ModelManager(ram_budget_bytes=1000)
+    entry = manager.add(fake_entry("a", 100))
+    manager.activate("a")
+    assert manager.remove("a") is True
+    assert manager.active is None
+    assert entry.model is None and entry.tokenizer is None
+    assert manager.remove("a") is False
+    with pytest.raises(KeyError):
+        manager.activate("a")
+
+def test_make_room_spares_models_listed_in_keep():
+    manager = ModelManager(ram_budget_bytes=150, vram_budget_bytes=1000)
+    manager.add(fake_entry("serving", 100))
+    manager.activate("serving")
+    manager.make_room(100, "cpu", keep=("serving",))
+    assert "serving" in manager
+
+def test_background_load_job_reports_progress_and_dedupes(tmp_path):
+    (tmp_path / "model.safetensors").write_bytes(b"\0" * 1024)
+    jobs = ModelLoadJobs()
+    release = threading.Event()
+
+    def install(job):
+        job.track(release.wait)()
+        return fake_entry("m", 100)
+
+    job = jobs.submit("m", str(tmp_path), install)
+    assert jobs.submit("m", str(tmp_path), install) is job  # Already in flight
+    assert job.describe()["shards_total"] == 1
+    assert job.describe()["bytes_total"] == 1024
+
+    release.set()
+    jobs._executor.shutdown(wait=True)
+    status = jobs.get(job.id).describe()
+    assert status["status"] == "ready"
+    assert status["progress"] == 1.0 and status["eta_seconds"] == 0.0
+
+def test_failed_background_load_records_the_error(tmp_path):
+    jobs = ModelLoadJobs()
+
+    def install(job):
+        raise RuntimeError("out of memory")
+
+    job = jobs.submit("broken", str(tmp_path), install)
+    jobs._executor.shutdown(wait=True)
+    assert job.status == "failed"
+    assert job.error == "out of memory"
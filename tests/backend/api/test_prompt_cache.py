@@ -0,0 +1,100 @@
+import pytest
+import os
+import sys
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.insert(0, project_root)
+
+try:
+    from backend.api.core.prompt_cache import assemble_prompt, forget_tokenizer, prompt_cache_stats, tokenizer_key
+    from backend.api.core.prompt_builder import generate_prompt
+except ImportError as e:
+    pytest.skip(f"transformers not available, skipping prompt cache tests: {e}", allow_module_level=True)
+
+BOS = 1
+
+
+class TagTokenizer:
+    """One token per character plus a BOS id, with a tag-style chat template."""
+    prompt_mode = "template"
+
+    def __init__(self, name):
+        self.name_or_path = name
+        self.encoded = []
+
+    def __call__(self, text, add_special_tokens=True):
+        self.encoded.append(text)
+        return {"input_ids": ([BOS] if add_special_tokens else []) + [ord(c) for c in text]}
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=False):
+        text = "".join(f"<{m['role']}>{m['content']}\n" for m in messages)
+        return text + ("<assistant>" if add_generation_prompt else "")
+
+
+class NumberedTokenizer(TagTokenizer):
+    """Numbers every message, so a message renders differently depending on its position."""
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=False):
+        text = "".join(f"{i}. {m['role']}: {m['content']}\n" for i, m in enumerate(messages))
+        return text + (f"{len(messages)}. assistant:" if add_generation_prompt else "")
+
+
+def chat(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i}"})
+        messages.append({"role": "assistant", "content": f"answer {i}"})
+    return messages + [{"role": "user", "content": "and now?"}]
+
+
+def test_assembled_prompt_matches_rendering_and_tokenizing_it():
+    tokenizer = TagTokenizer("tags")
+    messages = chat(3)
+    prompt, ids = assemble_prompt("chat", "Be brief.", tokenizer, messages=messages)
+    assert prompt == generate_prompt("chat", "Be brief.", tokenizer, messages=[dict(m) for m in messages])
+    assert ids == tokenizer(prompt)["input_ids"]
+
+    prompt, ids = assemble_prompt("instruction", "Be brief.", tokenizer, message="Summarize this.")
+    assert prompt == generate_prompt("instruction", "Be brief.", tokenizer, message="Summarize this.")
+    assert ids == tokenizer(prompt)["input_ids"]
+
+def test_next_turn_only_tokenizes_the_new_messages():
+    tokenizer = TagTokenizer("turns")
+    messages = chat(3)
+    assemble_prompt("chat", "Be brief.", tokenizer, messages=messages)
+    tokenizer.encoded.clear()
+    hits = prompt_cache_stats()["hits"]
+
+    messages += [{"role": "assistant", "content": "it depends"}, {"role": "user", "content": "on what?"}]
+    prompt, ids = assemble_prompt("chat", "Be brief.", tokenizer, messages=messages)
+    assert tokenizer.encoded == ["<assistant>it depends\n", "<user>on what?\n"]
+    assert prompt_cache_stats()["hits"] == hits + 1 + 7  # System prompt and the previous turn's messages
+    assert ids == tokenizer(prompt)["input_ids"]
+
+def test_position_dependent_templates_fall_back_to_full_rendering():
+    tokenizer = NumberedTokenizer("numbered")
+    assert assemble_prompt("chat", "Be brief.", tokenizer, messages=chat(2)) is None
+
+def test_fallback_prompts_are_assembled_too():
+    tokenizer = TagTokenizer("fallback")
+    tokenizer.prompt_mode = "fallback"
+    prompt, ids = assemble_prompt("instruction", "Be brief.", tokenizer, message="Hi")
+    assert prompt == generate_prompt("instruction", "Be brief.", tokenizer, message="Hi")
+    assert ids == tokenizer(prompt)["input_ids"]
+
+def test_cached_layouts_follow_the_tokenizer_and_its_prompt_settings():
+    tokenizer = TagTokenizer("settings")
+    assert tokenizer_key(tokenizer) != tokenizer_key(TagTokenizer("settings"))  # Never shared, even by name
+    assert assemble_prompt("instruction", "Be brief.", tokenizer, message="Hi")[0].startswith("<system>")
+
+    tokenizer.prompt_mode = "custom"
+    tokenizer.custom_prompt_config = {"system_prefix": "[S]", "user_prefix": "[U]", "assistant_prefix": "[A]"}
+    prompt, ids = assemble_prompt("instruction", "Be brief.", tokenizer, message="Hi")
+    assert prompt == generate_prompt("instruction", "Be brief.", tokenizer, message="Hi")  # Re-probed, not stale
+    assert ids == tokenizer(prompt)["input_ids"]
+
+    segments = prompt_cache_stats()["segments"]
+    forget_tokenizer(tokenizer)
+    assert prompt_cache_stats()["segments"] < segments
+    assert not hasattr(tokenizer, "_prompt_layout")
@@ -0,0 +1,44 @@
+import pytest
+import os
+import sys
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.insert(0, project_root)
+
+try:
+    import torch
+    from backend.api.core.model_manager import estimate_model_memory
+    from backend.api.core.quantization import (
+        apply_post_load_quantization, estimate_precision_footprints, memory_breakdown,
+    )
+    from backend.api.core.settings_manager import VALID_PRECISIONS
+except ImportError as e:
+    pytest.skip(f"torch not available, skipping quantization tests: {e}", allow_module_level=True)
+
+
+def test_all_precision_modes_are_accepted():
+    assert VALID_PRECISIONS == {"fp32", "fp16", "bf16", "int8_dynamic", "int8", "int4"}
+
+def test_dynamic_int8_shrinks_linear_weights_and_still_generates(tiny_model):
+    model, tokenizer = tiny_model
+    if torch.backends.quantized.engine == "none":
+        pytest.skip("No quantized CPU engine in this torch build")
+    quantized = apply_post_load_quantization(model, "int8_dynamic")
+
+    assert "qint8" in memory_breakdown(quantized)
+    assert estimate_model_memory(quantized) < estimate_model_memory(model)
+    # Weight counts do not depend on whether the model is already quantized
+    assert estimate_precision_footprints(quantized) == estimate_precision_footprints(model)
+
+    input_ids = torch.tensor([[1, 5, 9, 13]])
+    output = quantized.generate(input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=4,
+                                do_sample=False, pad_token_id=tokenizer.pad_token_id)
+    assert output.shape[1] == 8
+
+def test_precision_estimates_are_ordered(tiny_model):
+    model, _ = tiny_model
+    estimates = estimate_precision_footprints(model)
+    assert estimates["fp32"] == 2 * estimates["fp16"] == 2 * estimates["bf16"]
+    assert estimates["int4"] < estimates["int8"] < estimates["fp16"]
+    assert estimates["int8_dynamic"] < estimates["fp32"]
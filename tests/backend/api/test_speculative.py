@@ -0,0 +1,64 @@
+import pytest
+import copy
+import os
+import sys
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.insert(0, project_root)
+
+try:
+    import torch
+    from prometheus_client import REGISTRY
+    from backend.api.core.metrics import StepTimer
+    from backend.api.core.model_manager import LoadedModel
+    from backend.api.core.speculative import DraftModel
+    from backend.api.core.stopping import build_stopping_criteria
+except ImportError as e:
+    pytest.skip(f"torch/transformers not available, skipping speculative decoding tests: {e}", allow_module_level=True)
+
+
+@pytest.fixture
+def self_draft(tiny_model):
+    """The tiny model drafting for itself, so every proposed token is accepted."""
+    model, tokenizer = tiny_model
+    draft_model = copy.deepcopy(model)
+    draft_model.generation_config.assistant_confidence_threshold = 0  # Always draft the full length
+    return DraftModel("tiny-draft", tokenizer, draft_model, "cpu", num_tokens=3)
+
+
+def test_assisted_decoding_matches_target_and_counts_acceptance(tiny_model, self_draft):
+    model, tokenizer = tiny_model
+    prompt = torch.tensor([[1, 5, 9, 13, 21]])
+
+    def greedy(stopping_criteria=None, **kwargs):
+        return model.generate(prompt, attention_mask=torch.ones_like(prompt), max_new_tokens=12, min_new_tokens=12,
+                              do_sample=False, pad_token_id=tokenizer.pad_token_id,
+                              stopping_criteria=stopping_criteria, **kwargs)
+
+    accepted_before = REGISTRY.get_sample_value("sigil_speculative_accepted_tokens_total") or 0
+    timer = StepTimer()
+    timer.assisted = True
+    criteria = build_stopping_criteria(tokenizer, [], prompt_length=5, step_timer=timer)
+    assisted = greedy(criteria, **self_draft.generate_kwargs(model, tokenizer))
+    assert torch.equal(assisted, greedy())  # The target still decides every token
+
+    assert timer.tokens == 12
+    assert timer.steps < 12  # Several tokens per target forward pass
+    self_draft.stats.record(timer)
+    stats = self_draft.stats.describe()
+    assert stats["generations"] == 1
+    assert stats["accepted_tokens"] == 12 - timer.steps
+    assert stats["acceptance_rate"] == 1.0
+    assert stats["tokens_per_step"] == round(12 / timer.steps, 3)
+    assert REGISTRY.get_sample_value("sigil_speculative_accepted_tokens_total") == accepted_before + 12 - timer.steps
+
+def test_attached_draft_is_charged_and_reported(tiny_model, self_draft):
+    model, tokenizer = tiny_model
+    entry = LoadedModel("tiny", "backend/models/tiny", tokenizer, model, "cpu")
+    alone = entry.memory_bytes
+    entry.attach_draft(self_draft)
+    assert entry.memory_bytes == 2 * alone
+    described = entry.describe()
+    assert described["draft_model"] == "tiny-draft"
+    assert described["speculative"]["acceptance_rate"] is None  # Nothing drafted yet
@@ -0,0 +1,89 @@
+import pytest
+import os
+import sys
+import threading
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.insert(0, project_root)
+
+try:
+    import torch
+    from prometheus_client import REGISTRY
+    from transformers import StoppingCriteria
+    from backend.api.core.metrics import StepTimer
+    from backend.api.core.cleaner import DEFAULT_STOP_TOKENS
+    from backend.api.core.stopping import StopSequenceCriteria, build_stopping_criteria, resolve_stop_sequences
+except ImportError as e:
+    pytest.skip(f"torch/transformers not available, skipping stopping tests: {e}", allow_module_level=True)
+
+
+class CharTokenizer:
+    """Decodes each token id to a single printable character."""
+    pad_token_id = 2
+    eos_token_id = 2
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(chr(48 + int(i)) for i in ids)
+
+
+def test_resolve_stop_sequences_merges_defaults_model_and_request():
+    tokenizer = CharTokenizer()
+    tokenizer.stop_sequences = ["\n###", "</s>"]
+    resolved = resolve_stop_sequences(tokenizer, ["END", "\n###"])
+    assert resolved == DEFAULT_STOP_TOKENS + ["\n###", "END"]
+
+def test_stop_sequence_in_prompt_is_ignored():
+    criteria = StopSequenceCriteria(CharTokenizer(), ["AB"], prompt_length=3)
+    ids = torch.tensor([[17, 18, 5, 6]])  # "AB" is only in the prompt
+    assert not criteria(ids, None).any()
+    ids = torch.tensor([[17, 18, 5, 17, 18]])  # ...and now in the output
+    assert criteria(ids, None).all()
+
+def test_generation_halts_as_soon_as_stop_sequence_appears(tiny_model):
+    model, tokenizer = tiny_model
+    char_tokenizer = CharTokenizer()
+    prompt = torch.tensor([[1, 5, 9, 13, 21]])
+
+    def greedy(stopping_criteria=None):
+        return model.generate(prompt, attention_mask=torch.ones_like(prompt), max_new_tokens=20, do_sample=False,
+                              pad_token_id=tokenizer.pad_token_id, stopping_criteria=stopping_criteria)[0, 5:]
+
+    full = greedy()
+    stop = char_tokenizer.decode(full[3:5])
+    first = char_tokenizer.decode(full).find(stop)
+    stopped = greedy(build_stopping_criteria(char_tokenizer, [stop], prompt_length=5))
+    assert len(stopped) == first + len(stop)
+    assert torch.equal(stopped, full[:len(stopped)])
+
+def test_cancel_event_stops_generation_within_a_step(tiny_model):
+    model, tokenizer = tiny_model
+    prompt = torch.tensor([[1, 5, 9, 13, 21]])
+    cancel_event = threading.Event()
+
+    class CancelAfter(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            if input_ids.shape[1] - 5 == 3:
+                cancel_event.set() # e.g. the client disconnects after three tokens
+            return torch.zeros(input_ids.shape[0], dtype=torch.bool)
+
+    criteria = build_stopping_criteria(CharTokenizer(), [], prompt_length=5, cancel_event=cancel_event)
+    criteria.insert(0, CancelAfter())
+    output = model.generate(prompt, attention_mask=torch.ones_like(prompt), max_new_tokens=20, do_sample=False,
+                            pad_token_id=tokenizer.pad_token_id, stopping_criteria=criteria)
+    assert output.shape[1] - 5 == 3
+
+def test_step_timer_records_prefill_and_decode_steps(tiny_model):
+    model, tokenizer = tiny_model
+    prompt = torch.tensor([[1, 5, 9, 13, 21]])
+
+    def count(name):
+        return REGISTRY.get_sample_value(f"{name}_count") or 0
+
+    prefills, steps = count("sigil_prefill_seconds"), count("sigil_decode_token_seconds")
+    criteria = build_stopping_criteria(CharTokenizer(), [], prompt_length=5, step_timer=StepTimer())
+    output = model.generate(prompt, attention_mask=torch.ones_like(prompt), max_new_tokens=6, min_new_tokens=6,
+                            do_sample=False, pad_token_id=tokenizer.pad_token_id, stopping_criteria=criteria)
+    assert output.shape[1] - 5 == 6
+    assert count("sigil_prefill_seconds") == prefills + 1
+    assert count("sigil_decode_token_seconds") == steps + 5
@@ -0,0 +1,52 @@
+import pytest
+import os
+import sys
+from unittest.mock import MagicMock
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+sys.path.insert(0, project_root)
+
+try:
+    from backend.api.core.model_manager import LoadedModel
+    from backend.api.core.warmup import bucket_length, prepare_for_serving, static_cache_for
+except ImportError as e:
+    pytest.skip(f"torch/transformers not available, skipping warmup tests: {e}", allow_module_level=True)
+
+
+class IdTokenizer:
+    """Maps each character to a token id inside the tiny model's vocabulary."""
+    pad_token_id = 2
+    eos_token_id = 2
+    chat_template = None
+
+    def __call__(self, text):
+        return {"input_ids": [3 + ord(c) % 60 for c in text]}
+
+
+def test_bucket_length_rounds_up():
+    assert bucket_length(10, [512, 256]) == 256
+    assert bucket_length(256, [256, 512]) == 256
+    assert bucket_length(600, [256, 512]) == 1024
+
+def test_warmup_marks_model_ready(tiny_model):
+    model, _ = tiny_model
+    entry = LoadedModel("tiny", "backend/models/tiny", IdTokenizer(), model, "cpu")
+    assert entry.ready and entry.warmup_status == "disabled"
+
+    prepare_for_serving(entry, compile_model=False, warmup=True, prompt_lengths=[8, 300], decode_steps=4, buckets=[64])
+    assert entry.warmup_status == "warm" and entry.ready
+    assert not entry.compiled
+    assert static_cache_for(model, 8, 4) is None  # Eager models keep using dynamic caches
+
+def test_failed_warmup_is_reported_not_raised():
+    model = MagicMock()
+    model.generate.side_effect = RuntimeError("kernel missing")
+    model.device = "cpu"
+    model.static_cache_buckets = None
+    model.config.max_position_embeddings = 128
+    entry = LoadedModel("broken", "backend/models/broken", IdTokenizer(), model, "cpu")
+
+    prepare_for_serving(entry, compile_model=False, warmup=True, prompt_lengths=[8], decode_steps=4, buckets=[64])
+    assert entry.warmup_status == "failed" and not entry.ready
+    assert entry.warmup_error == "kernel missing"
@@ -0,0 +1,51 @@
+import json
+import pytest
+import os
+import sys
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.insert(0, project_root)
+
+try:
+    from benchmarks.stats import compare, percentile, summarize
+    from benchmarks import inference_bench
+except ImportError as e:
+    pytest.skip(f"Could not import the benchmark harness, skipping benchmark tests: {e}", allow_module_level=True)
+
+
+def test_percentiles_interpolate_like_numpy():
+    values = [10, 20, 30, 40]
+    assert percentile(values, 50) == 25
+    assert percentile(values, 99) == pytest.approx(39.7)
+    assert percentile([], 50) is None
+    assert summarize(values)["p95"] == 38.5
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    case = {"target": "direct", "precision": "fp32", "device": "cpu", "prompt_tokens": 32, "output_tokens": 16,
+            "concurrency": 1, "latency_ms": {"p50": 100.0}, "tokens_per_second": 50.0}
+    slower = dict(case, latency_ms={"p50": 130.0}, tokens_per_second=52.0)
+    regressions = compare([slower], [case], tolerance=0.2)
+    assert len(regressions) == 1 and "latency_ms.p50" in regressions[0]
+    assert compare([slower], [case], tolerance=0.5) == []
+
+def test_direct_benchmark_runs_on_cpu_with_a_tiny_model(tmp_path):
+    pytest.importorskip("transformers")
+    from benchmarks.tiny_model import make_tiny_model
+
+    model_dir = make_tiny_model(str(tmp_path / "tiny"))
+    report_path = tmp_path / "bench.json"
+    argv = ["--model", model_dir, "--prompt-tokens", "16", "--output-tokens", "8", "--concurrency", "1,2",
+            "--warmup", "0", "--output", str(report_path)]
+    assert inference_bench.main(argv) == 0
+
+    results = json.loads(report_path.read_text())["results"]
+    assert [r["concurrency"] for r in results] == [1, 2]
+    for case in results:
+        assert case["errors"] == 0
+        assert case["generated_tokens"] == case["requests"] * 8 # Fixed output length
+        assert case["ttft_ms"]["p50"] <= case["latency_ms"]["p50"]
+        assert case["tokens_per_second"] > 0 and case["peak_memory_bytes"] > 0
+
+    # Comparing a report against itself finds no regressions
+    assert inference_bench.main(argv + ["--baseline", str(report_path), "--tolerance", "10"]) == 0
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import pytest
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+# Add the project root to the path to allow imports
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.insert(0, project_root)
+
+try:
+    import httpx
+    from benchmarks.load_test import Recorder, conversation, curve, stub_generation
+except ImportError as e:
+    pytest.skip(f"Could not import the load test tool, skipping load test tests: {e}", allow_module_level=True)
+
+
+def test_stub_generation_spends_the_configured_time():
+    generate, stream = stub_generation(prefill_ms=20, token_ms=5, reply_tokens=4)
+    start = time.perf_counter()
+    assert generate(max_new_tokens=2, prompt="ignored") == "lorem lorem"  # Capped by max_new_tokens
+    assert time.perf_counter() - start >= 0.03
+    assert "".join(stream(max_new_tokens=10)) == "lorem " * 4
+
+def test_conversation_follows_the_script():
+    calls = []
+
+    def handler(request):
+        calls.append((request.method, request.url.path))
+        if request.url.path.endswith("/chat-v2"):
+            body = json.loads(request.content)
+            assert body["thread_id"] == "t1" if len(body["messages"]) > 1 else "thread_id" not in body
+            return httpx.Response(200, json={"response": "ok", "thread_id": "t1"})
+        return httpx.Response(200, json=[])
+
+    args = SimpleNamespace(turns=2, max_new_tokens=8, read_ratio=1.0, think_ms=0)
+    recorder = Recorder()
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await conversation(client, "http://server", args, recorder, random.Random(0))
+
+    asyncio.run(scenario())
+    assert calls == [
+        ("POST", "/api/v1/chat/chat-v2"), ("GET", "/api/v1/chat/session/t1"),
+        ("POST", "/api/v1/chat/chat-v2"), ("GET", "/api/v1/chat/session/t1"),
+        ("GET", "/api/v1/chat/sessions"),
+    ]
+    assert len(recorder.latencies["chat-v2"]) == 2
+
+def test_rejected_turn_ends_the_conversation_and_is_counted():
+    def handler(request):
+        return httpx.Response(429, headers={"Retry-After": "1"}, json={"detail": "full"})
+
+    args = SimpleNamespace(turns=3, max_new_tokens=8, read_ratio=1.0, think_ms=0)
+    recorder = Recorder()
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await conversation(client, "http://server", args, recorder, random.Random(0))
+
+    asyncio.run(scenario())
+    assert dict(recorder.statuses) == {"chat-v2": {"429": 1}}
+    results = [{"arrival_rate": 2.0, "endpoints": {"chat-v2": {
+        "throughput_rps": 0.0, "statuses": {"429": 1}, "latency_ms": {"p50": None, "p95": None, "p99": None},
+    }}}]
+    assert curve(results, "chat-v2")[0]["rejected_429"] == 1